@@ -0,0 +1,13 @@
+"""
+Replay benchmarks for pyMHT.
+
+Deterministic scenarios are built with pymht.utils.simulator on fixed seeds and
+replayed through Tracker.addMeasurementList. Per stage timings (from
+Tracker.runtimeLog) are stored as JSON and compared against a baseline, and the
+resulting tracks are compared against golden files.
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json --golden benchmarks/golden
+    python -m benchmarks.run --update-golden benchmarks/golden
+"""
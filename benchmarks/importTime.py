@@ -0,0 +1,70 @@
+"""
+Import time benchmark for pymht.tracker.
+
+Each repetition imports the module in a fresh interpreter and reports wall time,
+peak resident memory and whether any of the heavy optional dependencies were
+pulled in by the import.
+
+Usage:
+    python -m benchmarks.importTime
+    python -m benchmarks.importTime --module pymht.utils.simulator --repeat 20
+"""
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+
+heavyModules = ['matplotlib.pyplot',
+                'ortools',
+                'termcolor',
+                'pykalman',
+                'scipy.sparse.csgraph',
+                'scipy.stats',
+                ]
+
+_probe = """
+import sys, time, json, resource
+tic = time.perf_counter()
+import {module}
+toc = time.perf_counter()
+print(json.dumps({{'time': toc - tic,
+                  'maxRss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measureImport(module, repeat=10):
+    code = _probe.format(module=module, heavy=heavyModules)
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', code])
+        samples.append(json.loads(output.decode().strip().splitlines()[-1]))
+    times = np.array([s['time'] for s in samples])
+    return {'module': module,
+            'median': float(np.median(times)),
+            'min': float(np.min(times)),
+            'maxRss': max(s['maxRss'] for s in samples),
+            'loaded': sorted(set(m for s in samples for m in s['loaded']))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pyMHT import time benchmark")
+    parser.add_argument('--module', action='append', default=[],
+                        help="Module to import (default pymht.tracker)")
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.module or ['pymht.tracker']:
+        result = measureImport(module, args.repeat)
+        print('{0:30} median {1:7.1f}ms min {2:7.1f}ms max RSS {3:8d}kB'.format(
+            module, result['median'] * 1000, result['min'] * 1000, result['maxRss']))
+        for heavyModule in result['loaded']:
+            print('\tHeavy module imported', heavyModule)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
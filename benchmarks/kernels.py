@@ -0,0 +1,73 @@
+"""
+Compiled kernel benchmark.
+
+Tracks the same scenario with the numpy implementation and with the compiled
+kernels in pymht.utils.cFunctions, and compares the Process stage (growing
+the hypothesis trees) and the tracks. Build the kernels first with
+    USE_CYTHON=1 python setup.py build_ext --inplace
+
+Usage:
+    python -m benchmarks.kernels
+    python -m benchmarks.kernels --spec nTargets=20 --spec lambda_phi=1e-5 --repeat 3
+"""
+import sys
+import logging
+import argparse
+import numpy as np
+import pymht.utils.kalman as kalman
+from . import scenarios
+from . import run
+from .monteCarlo import _parseSpec
+
+log = logging.getLogger(__name__)
+
+
+def measureKernels(spec, repeat=1):
+    """
+    Returns the median Process stage time per scan for each implementation
+    and the track differences between them.
+    """
+    scenario = scenarios.Scenario(**spec)
+    results = {}
+    tracks = {}
+    try:
+        for compiled in (False, True):
+            if kalman.useCompiledKernels(compiled) != compiled:
+                continue
+            name = 'compiled' if compiled else 'numpy'
+            processTimes = []
+            for _ in range(repeat):
+                tracker, _ = run.trackScenario(scenario.build())
+                processTimes.append(np.mean(tracker.runtimeLog['Process']))
+            results[name] = float(np.median(processTimes))
+            tracks[name] = run.getTracks(tracker)
+    finally:
+        kalman.useCompiledKernels(True)
+    differences = (run.compareTracks(tracks['compiled'], tracks['numpy'])
+                   if len(tracks) == 2 else [])
+    return results, differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pyMHT compiled kernel benchmark")
+    parser.add_argument('--spec', action='append', default=[],
+                        help="Scenario parameter, e.g. nTargets=20")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+    spec = _parseSpec(args.spec)
+
+    results, differences = measureKernels(spec, args.repeat)
+    if 'compiled' not in results:
+        print("Compiled kernels are not built, numpy only")
+    for name, processTime in results.items():
+        print('{0:10} Process {1:7.2f}ms/scan'.format(name, processTime * 1000))
+    if len(results) == 2:
+        print('Speedup {0:.2f}x'.format(results['numpy'] / results['compiled']))
+    for difference in differences:
+        print(difference)
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
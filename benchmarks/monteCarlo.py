@@ -0,0 +1,124 @@
+"""
+Parallel Monte Carlo runner.
+
+Every iteration simulates the scenario with its own numpy Generator, seeded
+from SeedSequence(seed), and tracks it in a worker process. The random
+streams do not depend on which worker runs an iteration or on how many
+workers there are. Results are collected in iteration order, so the track
+results are bit-identical for any number of workers. Run elements are
+streamed to a Scenario XML file and/or the tracks and timings are stored
+as JSON.
+
+Usage:
+    python -m benchmarks.monteCarlo --seeds 0:100 --workers 8 --xml results.xml
+    python -m benchmarks.monteCarlo --spec nTargets=20 --spec aisShare=0.5 --seeds 1,2,3 --json results.json
+"""
+import sys
+import logging
+import argparse
+import multiprocessing
+import numpy as np
+from pymht.utils.xmlWriter import ScenarioWriter
+from . import scenarios
+from . import run
+
+log = logging.getLogger(__name__)
+
+
+def runIteration(task):
+    (spec, iteration, seed, storeXml, preInitialized) = task
+    import xml.etree.ElementTree as ET
+    from pymht.utils.xmlDefinitions import scenarioTag
+
+    rng = np.random.default_rng(np.random.SeedSequence(seed))
+    scenario = scenarios.Scenario(**spec).build(rng)
+    tracker, wallTime = run.trackScenario(scenario)
+    result = {'iteration': iteration,
+              'seed': seed,
+              'wallTime': wallTime,
+              'timings': run.getTimings(tracker.runtimeLog),
+              'tracks': run.getTracks(tracker)}
+    if storeXml:
+        scenarioElement = ET.Element(scenarioTag)
+        tracker._storeRun(scenarioElement, preInitialized, i=iteration, seed=seed)
+        result['runElement'] = scenarioElement[0]
+        result['settingsElement'] = tracker._getTrackerSettingsElement()
+    return result
+
+
+def runMonteCarlo(spec, seeds, nWorkers=1, xmlPath=None, preInitialized=False):
+    """
+    Runs one iteration per seed and returns the results in seed order. With
+    xmlPath the Run elements are streamed to a Scenario XML file as they arrive.
+    """
+    tasks = [(spec, iteration, int(seed), xmlPath is not None, preInitialized)
+             for iteration, seed in enumerate(seeds)]
+    writer = (ScenarioWriter(xmlPath, **scenarios.Scenario(**spec).spec)
+              if xmlPath is not None else None)
+    pool = multiprocessing.Pool(nWorkers) if nWorkers > 1 else None
+    results = []
+    try:
+        resultIterator = (pool.imap(runIteration, tasks) if pool is not None
+                          else map(runIteration, tasks))
+        for result in resultIterator:
+            log.info("Iteration %s (seed %s) done in %.1fs",
+                     result['iteration'], result['seed'], result['wallTime'])
+            if writer is not None:
+                if result['iteration'] == 0:
+                    writer.writeElement(result.pop('settingsElement'))
+                writer.writeElement(result.pop('runElement'))
+                writer.nRuns += 1
+            result.pop('settingsElement', None)
+            results.append(result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if writer is not None:
+            writer.close()
+    return results
+
+
+def _parseSeeds(seedString):
+    if ':' in seedString:
+        start, stop = seedString.split(':')
+        return list(range(int(start), int(stop)))
+    return [int(s) for s in seedString.split(',')]
+
+
+def _parseSpec(specList):
+    spec = {}
+    for item in specList:
+        key, value = item.split('=')
+        if key not in scenarios.defaultScenario:
+            raise ValueError("Unknown scenario parameter " + key)
+        spec[key] = type(scenarios.defaultScenario[key])(float(value))
+    return spec
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pyMHT Monte Carlo runner")
+    parser.add_argument('--spec', action='append', default=[],
+                        help="Scenario parameter as key=value, changes from the default scenario")
+    parser.add_argument('--seeds', default='0:10',
+                        help="Seeds as start:stop or a comma separated list")
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--xml', help="Stream results to this Scenario XML file")
+    parser.add_argument('--json', help="Store tracks and timings as JSON")
+    parser.add_argument('--preInitialized', action='store_true',
+                        help="Store full (smoothed) tracks instead of first and last state")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('pymht').setLevel(logging.ERROR)
+    spec = _parseSpec(args.spec)
+    results = runMonteCarlo(spec, _parseSeeds(args.seeds), args.workers,
+                            args.xml, args.preInitialized)
+    if args.json:
+        run._writeJson(args.json, {'spec': scenarios.Scenario(**spec).spec,
+                                   'iterations': results})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import numpy as np
+from pymht.models import pv
+from . import scenarios
+
+log = logging.getLogger(__name__)
+
+goldenDirectory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+timingTolerance = {'rtol': 0.25, 'atol': 2e-3}
+stateTolerance = {'rtol': 1e-5, 'atol': 1e-3}
+
+
+def trackScenario(scenario, **kwargs):
+    import pymht.tracker as tomht
+    tracker = tomht.Tracker(pv,
+                            scenario.radarPeriod,
+                            scenario.lambda_phi,
+                            scenario.lambda_nu,
+                            N=scenario.N,
+                            P_d=scenario.P_d,
+                            radarRange=scenario.radarRange)
+    tic = time.time()
+    for scan in scenario.scanList:
+        aisList = scenario.aisList.getMeasurements(scan.time)
+        tracker.addMeasurementList(scan, aisList, **kwargs)
+    return tracker, time.time() - tic
+
+
+def runScenario(scenario, **kwargs):
+    if scenario.scanList is None:
+        scenario.build()
+    tracker, wallTime = trackScenario(scenario, **kwargs)
+    scenario.aisList = None
+    scenario.scanList = None
+    return {'spec': scenario.spec,
+            'nScans': len(tracker.runtimeLog['Total']),
+            'wallTime': wallTime,
+            'timings': getTimings(tracker.runtimeLog),
+            'tracks': getTracks(tracker)}
+
+
+def getTimings(runtimeLog):
+    timings = {}
+    for k, v in runtimeLog.items():
+        if not v:
+            continue
+        array = np.array(v)
+        timings[k] = {'mean': float(np.mean(array)),
+                      'median': float(np.median(array)),
+                      'max': float(np.max(array)),
+                      'sum': float(np.sum(array))}
+    return timings
+
+
+def getTracks(tracker):
+    tracks = []
+    terminatedNodes = tracker.__terminatedTargets__
+    for terminated, nodes in ((False, tracker.getTrackNodes()), (True, terminatedNodes)):
+        for node in nodes:
+            mmsi = node._getHistoricalMmsi()
+            tracks.append({'id': int(node.ID),
+                           'terminated': terminated,
+                           'status': node.status,
+                           'mmsi': int(mmsi) if mmsi is not None else None,
+                           'time': [float(n.time) for n in node.backtrackNodes()],
+                           'states': [[float(x) for x in n.x_0] for n in node.backtrackNodes()]})
+    tracks.sort(key=lambda t: (t['terminated'], t['id']))
+    return tracks
+
+
+def compareTimings(result, baseline, rtol=timingTolerance['rtol'], atol=timingTolerance['atol']):
+    regressions = []
+    for stage, timing in result['timings'].items():
+        if stage not in baseline['timings']:
+            continue
+        reference = baseline['timings'][stage]['median']
+        measured = timing['median']
+        if measured > reference * (1. + rtol) + atol:
+            regressions.append('{0:}: {1:.1f}ms > {2:.1f}ms'.format(
+                stage, measured * 1000, reference * 1000))
+    return regressions
+
+
+def compareTracks(tracks, goldenTracks, rtol=stateTolerance['rtol'], atol=stateTolerance['atol']):
+    differences = []
+    if len(tracks) != len(goldenTracks):
+        differences.append('Number of tracks {0:} != {1:}'.format(len(tracks), len(goldenTracks)))
+        return differences
+    for track, goldenTrack in zip(tracks, goldenTracks):
+        trackName = 'Track {0:}'.format(goldenTrack['id'])
+        for key in ('id', 'terminated', 'status', 'mmsi'):
+            if track[key] != goldenTrack[key]:
+                differences.append('{0:} {1:}: {2:} != {3:}'.format(
+                    trackName, key, track[key], goldenTrack[key]))
+        if len(track['states']) != len(goldenTrack['states']):
+            differences.append('{0:} length: {1:} != {2:}'.format(
+                trackName, len(track['states']), len(goldenTrack['states'])))
+            continue
+        if not np.allclose(track['time'], goldenTrack['time']):
+            differences.append(trackName + ' time stamps differ')
+        if not np.allclose(track['states'], goldenTrack['states'], rtol=rtol, atol=atol):
+            maxError = np.max(np.abs(np.array(track['states']) - np.array(goldenTrack['states'])))
+            differences.append('{0:} states differ (max {1:.2e})'.format(trackName, maxError))
+    return differences
+
+
+def _goldenPath(goldenDirectory, name):
+    return os.path.join(goldenDirectory, name + '.json')
+
+
+def _writeJson(path, data):
+    (head, tail) = os.path.split(path)
+    if head and not os.path.isdir(head):
+        os.makedirs(head)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+
+
+def _readJson(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pyMHT replay benchmark")
+    parser.add_argument('--output', help="Store timing results as JSON")
+    parser.add_argument('--baseline', help="Compare timings with this JSON file")
+    parser.add_argument('--golden', nargs='?', const=goldenDirectory,
+                        help="Compare tracks with the golden files in this directory, "
+                             "default " + goldenDirectory)
+    parser.add_argument('--update-golden', dest='updateGolden', nargs='?', const=goldenDirectory,
+                        help="Write golden track files to this directory, default " + goldenDirectory)
+    parser.add_argument('--grid', action='store_true',
+                        help="Run the full cartesian grid instead of a one-at-a-time sweep")
+    parser.add_argument('--scenario', action='append', default=[],
+                        help="Only run scenarios with this name")
+    parser.add_argument('--rtol', type=float, default=timingTolerance['rtol'],
+                        help="Relative timing tolerance")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+    scenarioList = scenarios.grid() if args.grid else scenarios.sweep()
+    if args.scenario:
+        scenarioList = [s for s in scenarioList if s.getName() in args.scenario]
+
+    baseline = _readJson(args.baseline)['scenarios'] if args.baseline else {}
+    results = {'platform': platform.platform(),
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'scenarios': {}}
+    failed = False
+    for scenario in scenarioList:
+        name = scenario.getName()
+        result = runScenario(scenario)
+        tracks = result.pop('tracks')
+        results['scenarios'][name] = result
+        print('{0:40} {1:3} scans {2:3} tracks {3:8.1f}ms'.format(
+            name, result['nScans'], len(tracks), result['wallTime'] * 1000))
+
+        if args.baseline:
+            if name not in baseline:
+                print('\tNo baseline timing for', name)
+                failed = True
+            else:
+                for regression in compareTimings(result, baseline[name], rtol=args.rtol):
+                    print('\tTiming regression', regression)
+                    failed = True
+
+        if args.updateGolden:
+            _writeJson(_goldenPath(args.updateGolden, name), tracks)
+        elif args.golden:
+            goldenPath = _goldenPath(args.golden, name)
+            if not os.path.isfile(goldenPath):
+                print('\tNo golden file', goldenPath)
+                failed = True
+                continue
+            for difference in compareTracks(tracks, _readJson(goldenPath)):
+                print('\tTrack difference', difference)
+                failed = True
+
+    if args.output:
+        _writeJson(args.output, results)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import copy
+import itertools
+import numpy as np
+import pymht.utils.simulator as sim
+from pymht.models import pv, ais
+
+initialTime = 1.5e9
+
+defaultScenario = {'seed': 172362,
+                   'nTargets': 10,
+                   'lambda_phi': 2e-6,
+                   'lambda_nu': 1e-4,
+                   'P_d': 0.8,
+                   'N': 5,
+                   'aisShare': 0.0,
+                   'radarPeriod': 60. / 24.,
+                   'radarRange': 5500.,
+                   'nScans': 30,
+                   }
+
+defaultVariations = {'nTargets': [5, 20, 40],
+                     'lambda_phi': [0., 1e-5],
+                     'P_d': [0.5, 0.95],
+                     'N': [1, 3, 7],
+                     'aisShare': [0.5, 1.0],
+                     }
+
+
+class Scenario():
+
+    def __init__(self, **kwargs):
+        self.spec = copy.copy(defaultScenario)
+        unknownKeys = set(kwargs) - set(defaultScenario)
+        if unknownKeys:
+            raise ValueError("Unknown scenario parameters: " + str(sorted(unknownKeys)))
+        self.spec.update(kwargs)
+        self.p0 = np.array([0., 0.])
+        self.simList = None
+        self.scanList = None
+        self.aisList = None
+
+    def __getattr__(self, item):
+        try:
+            return self.__dict__['spec'][item]
+        except KeyError:
+            raise AttributeError(item)
+
+    def getName(self):
+        changes = ['{0:}={1:g}'.format(k, v) for k, v in sorted(self.spec.items())
+                   if v != defaultScenario[k]]
+        return '_'.join(changes) if changes else 'default'
+
+    def build(self, rng=None):
+        """
+        Simulates the scenario. Without rng the global numpy random state is
+        seeded with the scenario seed and the object based simulator is used.
+        With an explicit numpy Generator (or RandomState) all draws come from it
+        and the array based simulator is used.
+        """
+        if rng is None:
+            sim.seed_simulator(self.seed)
+        initialTargets = sim.generateInitialTargets(self.nTargets,
+                                                    self.p0,
+                                                    self.radarRange,
+                                                    self.P_d,
+                                                    pv.sigmaQ_true,
+                                                    assignMMSI=True,
+                                                    initialTime=initialTime,
+                                                    rng=rng if rng is not None else np.random)
+        nAisTargets = int(round(self.aisShare * self.nTargets))
+        for target in initialTargets[nAisTargets:]:
+            target.mmsi = None
+
+        simTime = self.nScans * self.radarPeriod
+        if rng is None:
+            self.simList = sim.simulateTargets(initialTargets, simTime, self.radarPeriod, pv)
+            self.scanList = sim.simulateScans(self.simList,
+                                              self.radarPeriod,
+                                              pv.C_RADAR,
+                                              pv.R_RADAR(pv.sigmaR_RADAR_true),
+                                              self.lambda_phi,
+                                              self.radarRange,
+                                              self.p0,
+                                              P_d=self.P_d)
+            self.aisList = sim.simulateAIS(self.simList, ais, self.radarPeriod, initialTime)
+        else:
+            times, states = sim.simulateTargetsArray(initialTargets, simTime, self.radarPeriod, pv,
+                                                     rng=rng)
+            self.simList = sim.simListFromArray(initialTargets, times, states)
+            self.scanList = sim.simulateScansArray(times,
+                                                   states,
+                                                   self.radarPeriod,
+                                                   pv.C_RADAR,
+                                                   pv.R_RADAR(pv.sigmaR_RADAR_true),
+                                                   self.lambda_phi,
+                                                   self.radarRange,
+                                                   self.p0,
+                                                   P_d=[target.P_d for target in initialTargets],
+                                                   rng=rng)
+            self.aisList = sim.simulateAIS(self.simList, ais, self.radarPeriod, initialTime,
+                                           rng=rng)
+        return self
+
+
+def sweep(base=None, variations=None):
+    base = base if base is not None else {}
+    variations = variations if variations is not None else defaultVariations
+    scenarios = [Scenario(**base)]
+    for key, values in variations.items():
+        for value in values:
+            scenarios.append(Scenario(**{**base, key: value}))
+    return scenarios
+
+
+def grid(base=None, variations=None):
+    base = base if base is not None else {}
+    variations = variations if variations is not None else defaultVariations
+    keys = list(variations.keys())
+    return [Scenario(**{**base, **dict(zip(keys, values))})
+            for values in itertools.product(*[variations[k] for k in keys])]
@@ -1,10 +1,11 @@
 import logging
 import time
+import itertools
 import numpy as np
-from scipy.stats import chi2
 from ..models import pv, ais
 from ..pyTarget import Target
-from munkres import munkres  # https://github.com/jfrelinger/cython-munkres-wrapper
+from ..utils import trace
+from ..utils.classDefinitions import AisMessageList
 # import pymunkres  # https://github.com/erikliland/munkres
 # import scipy.optimize.linear_sum_assignment
 
@@ -13,7 +14,8 @@ np.set_printoptions(precision=1, suppress=True, linewidth=120)
 tracking_parameters = {
     'gate_probability': 0.99,
 }
-tracking_parameters['gamma'] = chi2(df=2).ppf(tracking_parameters['gate_probability'])
+# Chi-squared quantile with two degrees of freedom, -2 ln(1 - p)
+tracking_parameters['gamma'] = -2. * np.log(1. - tracking_parameters['gate_probability'])
 
 CONFIRMED = 1
 PRELIMINARY = 0
@@ -22,6 +24,7 @@ DEAD = -1
 log = logging.getLogger(__name__)
 
 def _solve_global_nearest_neighbour(delta_matrix, gate_distance=np.Inf, **kwargs):
+    from munkres import munkres  # https://github.com/jfrelinger/cython-munkres-wrapper
     try:
         DEBUG = kwargs.get('debug', False)
         # Copy and gating
@@ -101,6 +104,82 @@ def _solve_global_nearest_neighbour(delta_matrix, gate_distance=np.Inf, **kwargs
         time.sleep(0.1)
         raise e
 
+def _solve_sparse_global_nearest_neighbour(rows, cols, costs, shape):
+    """
+    Global nearest neighbour on a sparse cost structure. Only the (row, col) pairs
+    given are valid. The bipartite graph is split into connected components and
+    each component is solved as a small dense problem.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    nRows, nCols = shape
+    if rows.size == 0:
+        return []
+    graph = coo_matrix((np.ones(rows.size, dtype=bool), (rows, cols + nRows)),
+                       shape=(nRows + nCols, nRows + nCols))
+    _, labels = connected_components(graph, directed=False)
+    pairLabels = labels[rows]
+    order = np.argsort(pairLabels, kind='mergesort')
+    boundaries = np.flatnonzero(np.diff(pairLabels[order])) + 1
+    assignments = []
+    for component in np.split(order, boundaries):
+        if component.size == 1:
+            assignments.append((rows[component[0]], cols[component[0]]))
+            continue
+        componentRows, localRows = np.unique(rows[component], return_inverse=True)
+        componentCols, localCols = np.unique(cols[component], return_inverse=True)
+        delta_matrix = np.full((componentRows.size, componentCols.size), np.Inf)
+        delta_matrix[localRows, localCols] = costs[component]
+        for row, col in _solve_global_nearest_neighbour(delta_matrix):
+            assignments.append((componentRows[row], componentCols[col]))
+    assignments.sort()
+    return assignments
+
+def _grid_candidate_pairs(source_array, target_array, gate_distance):
+    """
+    Hash both point sets into a uniform grid with cell size gate_distance and
+    return the (source, target, distance) pairs that are within the gate.
+    Only pairs in neighbouring cells are evaluated.
+    """
+    empty = (np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0))
+    if source_array.shape[0] == 0 or target_array.shape[0] == 0:
+        return empty
+    sourceCells = np.floor(source_array / gate_distance).astype(np.int64)
+    targetCells = np.floor(target_array / gate_distance).astype(np.int64)
+    cellMin = np.minimum(sourceCells.min(axis=0), targetCells.min(axis=0)) - 1
+    cellMax = np.maximum(sourceCells.max(axis=0), targetCells.max(axis=0)) + 1
+    nCellsY = cellMax[1] - cellMin[1] + 1
+
+    def cellKey(cells):
+        return (cells[:, 0] - cellMin[0]) * nCellsY + (cells[:, 1] - cellMin[1])
+
+    targetKeys = cellKey(targetCells)
+    targetOrder = np.argsort(targetKeys, kind='mergesort')
+    sortedTargetKeys = targetKeys[targetOrder]
+
+    rowsList = []
+    colsList = []
+    for offset in itertools.product((-1, 0, 1), repeat=2):
+        neighbourKeys = cellKey(sourceCells + np.array(offset, dtype=np.int64))
+        start = np.searchsorted(sortedTargetKeys, neighbourKeys, side='left')
+        end = np.searchsorted(sortedTargetKeys, neighbourKeys, side='right')
+        counts = end - start
+        nPairs = np.sum(counts)
+        if nPairs == 0:
+            continue
+        rows = np.repeat(np.arange(source_array.shape[0]), counts)
+        localIndices = np.arange(nPairs) - np.repeat(np.cumsum(counts) - counts, counts)
+        rowsList.append(rows)
+        colsList.append(targetOrder[np.repeat(start, counts) + localIndices])
+    if not rowsList:
+        return empty
+    rows = np.concatenate(rowsList)
+    cols = np.concatenate(colsList)
+    deltaArray = (target_array[cols] - source_array[rows]).astype(np.float64)
+    distances = np.linalg.norm(deltaArray, axis=1)
+    inside_gate = distances <= gate_distance
+    return rows[inside_gate], cols[inside_gate], distances[inside_gate]
+
 def _initiator_distance(delta_vector, dt, v_max, R):
     movement_scalar = dt * v_max
     d_plus = np.maximum(delta_vector - movement_scalar, np.zeros(2))
@@ -125,18 +204,18 @@ def _merge_targets(targets):
 
 def _merge_similar_targets(initial_targets, threshold):
     if not initial_targets: return initial_targets
+    positions = np.array([t.x_0[0:2] for t in initial_targets], ndmin=2)
+    delta_tensor = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+    close_matrix = np.linalg.norm(delta_tensor, axis=2) < threshold
     targets = []
-    used_targets = set()
+    used_targets = np.zeros(len(initial_targets), dtype=bool)
     for target_index, target in enumerate(initial_targets):
-        if target_index not in used_targets:
-            distance_to_targets = np.array([np.linalg.norm(target.x_0[0:2] - t.x_0[0:2]) for t in initial_targets])
-            close_targets = distance_to_targets < threshold
-            close_targets_indices = np.where(close_targets)[0]
-            log.debug("Merging " + str(len(close_targets)) + " initial targets to 1")
-            selected_targets = [initial_targets[i] for i in close_targets_indices if i not in used_targets]
-            merged_target = _merge_targets(selected_targets)
-            for i in close_targets_indices:
-                used_targets.add(i)
+        if not used_targets[target_index]:
+            close_targets = close_matrix[target_index]
+            selected_targets_indices = np.flatnonzero(close_targets & ~used_targets)
+            log.debug("Merging %s initial targets to 1", selected_targets_indices.size)
+            merged_target = _merge_targets([initial_targets[i] for i in selected_targets_indices])
+            used_targets |= close_targets
             assert type(merged_target) == type(target)
             targets.append(merged_target)
     return targets
@@ -219,8 +298,8 @@ class Initiator():
         self.gamma = tracking_parameters['gamma']
         self.last_timestamp = None
         self.merge_threshold = mergeThreshold  # meter
-        log.info("Initiator ready ({0:}/{1:})".format(self.M, self.N))
-        log.debug("Initiator gamma: " + str(self.gamma))
+        log.info("Initiator ready (%s/%s)", self.M, self.N)
+        log.debug("Initiator gamma: %s", self.gamma)
 
     def getPreliminaryTracksString(self):
         return " ".join([str(e) for e in self.preliminary_tracks])
@@ -229,15 +308,14 @@ class Initiator():
         # print("radar_measurement_list",radar_measurement_list)
         # print("ais_measurement_list",ais_measurement_list)
         tic = time.time()
-        log.info("processMeasurements " + str(radar_measurement_list.measurements.shape[0]))
+        log.info("processMeasurements %s", radar_measurement_list.measurements.shape[0])
         unused_indices, initial_targets = self._processPreliminaryTracks(radar_measurement_list, ais_measurement_list)
         unused_indices = self._processInitiators(unused_indices, radar_measurement_list)
         self._spawnInitiators(unused_indices, radar_measurement_list)
         self.last_timestamp = radar_measurement_list.time
         initial_targets = _merge_similar_targets(initial_targets, self.merge_threshold)
-        log.info("new initial targets " + str(len(initial_targets)))
-        toc = time.time() - tic
-        log.debug("processMeasurements runtime: {:.1f}ms".format(toc * 1000))
+        log.info("new initial targets %s", len(initial_targets))
+        log.debug("processMeasurements runtime: %.1fms", (time.time() - tic) * 1000)
         return initial_targets
 
     def _processPreliminaryTracks(self, measurement_list, ais_measurement_list):
@@ -258,12 +336,21 @@ class Initiator():
         existingMmsiList = [t.mmsi for t in self.preliminary_tracks if t.mmsi is not None]
         existingMmsiSet = set(existingMmsiList)
         assert len(existingMmsiList) == len(existingMmsiSet), "Duplicate MMSI in preliminaryTracks"
-        for measurement in ais_measurement_list:
-            if measurement.mmsi in existingMmsiSet:
+        if not isinstance(ais_measurement_list, AisMessageList):
+            ais_measurement_list = AisMessageList(ais_measurement_list)
+        aisColumns = ais_measurement_list.getColumns()
+        aisPredictions = {}
+        for row in range(aisColumns.size):
+            mmsi = int(aisColumns.mmsi[row]) if aisColumns.mmsi[row] != -1 else None
+            if mmsi in existingMmsiSet:
                 continue
-            dT = radarMeasTime - measurement.time
-            state, covariance = measurement.predict(dT)
-            tempTrack = PreliminaryTrack(state, covariance, measurement.mmsi)
+            dT = radarMeasTime - aisColumns.time[row]
+            if dT not in aisPredictions:
+                Phi = ais.Phi(dT)
+                aisPredictions[dT] = (Phi, Phi.dot(pv.P0).dot(Phi.T) + pv.Q(dT))
+            Phi, covariance = aisPredictions[dT]
+            state = Phi.dot(aisColumns.state[row])
+            tempTrack = PreliminaryTrack(state, covariance, mmsi)
             tempTrack.predicted_state = state
             nisList = [p.compareSimilarity(tempTrack) for p in self.preliminary_tracks]
             threshold = 1.0
@@ -273,7 +360,7 @@ class Initiator():
                 print("Discarded new AIS preliminaryTrack because it was to similar",
                       [e for e in nisList if e <= threshold], tempTrack)
 
-        log.info("_processPreliminaryTracks " + str(len(self.preliminary_tracks)))
+        log.info("_processPreliminaryTracks %s", len(self.preliminary_tracks))
 
         predicted_states = np.array([track.get_predicted_state_and_clear()
                                      for track in self.preliminary_tracks],
@@ -304,7 +391,8 @@ class Initiator():
             delta_matrix[i,inside_gate_vector] = distance_vector[inside_gate_vector]
 
         # Assign measurements
-        log.debug("\n"+np.array_str(delta_matrix, max_line_width=120))
+        if trace.sink is not None:
+            trace.emit('delta_matrix', delta_matrix, time=radarMeasTime)
         assignments = _solve_global_nearest_neighbour(delta_matrix)
 
         # Update tracks
@@ -331,7 +419,7 @@ class Initiator():
         for track in self.preliminary_tracks:
             track.n += 1
 
-        log.debug("Preliminary tracks "+self.getPreliminaryTracksString())
+        log.debug("Preliminary tracks %s", trace.Lazy(self.getPreliminaryTracksString))
 
         #Evaluate destiny
         removeIndices = []
@@ -339,21 +427,20 @@ class Initiator():
             track_status = track.mn_analysis(self.M, self.N)
             track_speed = track.get_speed()
             if track_speed > self.v_max*1.5:
-                log.warning("Removing TOO FAST track ({0:6.1f} m/s) i={1:}".format(track_speed, track_index) +"\n"+ repr(track))
+                log.warning("Removing TOO FAST track (%6.1f m/s) i=%s\n%r", track_speed, track_index, track)
                 removeIndices.append(track_index)
             elif track_status == DEAD:
                 # log.debug("Removing DEAD track " + str(track_index))
                 removeIndices.append(track_index)
             elif track_status == CONFIRMED:
-                log.debug("Removing CONFIRMED track " + str(track_index))
+                log.debug("Removing CONFIRMED track %s", track_index)
                 new_target = Target(radarMeasTime,
                                     None,
                                     np.array(track.state),
                                     track.covariance,
                                     measurementNumber=track.measurement_index + 1,
                                     measurement=measurement_array[track.measurement_index])
-                log.debug("Spawning new (initial) Target: " + str(new_target)
-                          + " Covariance:\n" + np.array_str(track.covariance))
+                log.debug("Spawning new (initial) Target: %s Covariance:\n%s", new_target, track.covariance)
                 newInitialTargets.append(new_target)
                 removeIndices.append(track_index)
 
@@ -361,7 +448,7 @@ class Initiator():
         for i in reversed(removeIndices):
             self.preliminary_tracks.pop(i)
         if removeIndices:
-            log.debug(self.getPreliminaryTracksString())
+            log.debug("%s", trace.Lazy(self.getPreliminaryTracksString))
 
         #Return unused radar measurement indices
         used_radar_indices = [assignment[1] for assignment in assignments]
@@ -371,7 +458,7 @@ class Initiator():
         return unused_radar_indices, newInitialTargets
 
     def _processInitiators(self, unused_indices, measurement_list):
-        log.debug("_processInitiators " + str(len(self.initiators)))
+        log.debug("_processInitiators %s", len(self.initiators))
         measTime = measurement_list.time
         measurementArray = np.array(measurement_list.measurements, ndmin=2, dtype=np.float32)
         n1 = len(self.initiators)
@@ -380,22 +467,25 @@ class Initiator():
             return unused_indices
 
 
-        #TODO: Improve runtime of this section. It takes about 97% of m/n runtime
         unusedMeasurementArray = measurementArray[unused_indices]
         initiatorArray = np.array([i.value for i in self.initiators], ndmin=2, dtype=np.float32)
-        deltaTensor = np.empty((n1, n2, 2))
-        for i in range(n1):
-            deltaTensor[i] = unusedMeasurementArray - initiatorArray[i]
-        distance_matrix = np.linalg.norm(deltaTensor, axis=2)
-
 
         dt = measTime - self.initiators[0].timestamp
         gate_distance = (self.v_max * dt)
-        log.debug("Gate distance {0:.1f}".format(gate_distance))
-
-        assignments = _solve_global_nearest_neighbour(distance_matrix, gate_distance)
+        log.debug("Gate distance %.1f", gate_distance)
+
+        if np.isfinite(gate_distance) and gate_distance > 0:
+            rows, cols, distances = _grid_candidate_pairs(initiatorArray,
+                                                          unusedMeasurementArray,
+                                                          gate_distance)
+            log.debug("Grid candidate pairs %s of %s", rows.size, n1 * n2)
+            assignments = _solve_sparse_global_nearest_neighbour(rows, cols, distances, (n1, n2))
+        else:
+            deltaTensor = unusedMeasurementArray[np.newaxis, :, :] - initiatorArray[:, np.newaxis, :]
+            distance_matrix = np.linalg.norm(deltaTensor.astype(np.float64), axis=2)
+            assignments = _solve_global_nearest_neighbour(distance_matrix, gate_distance)
         assigned_local_indices = [assignment[1] for assignment in assignments]
-        used_indices = [unused_indices[j] for j in assigned_local_indices]
+        used_indices = set(unused_indices[j] for j in assigned_local_indices)
         unused_indices = [i for i in unused_indices if i not in used_indices]
         unused_indices.sort()
         assert len(unused_indices) == len(set(unused_indices))
@@ -403,22 +493,21 @@ class Initiator():
         return unused_indices
 
     def _spawnInitiators(self, unused_indices, measurement_list):
-        log.info("_spawnInitiators " + str(len(unused_indices)))
+        log.info("_spawnInitiators %s", len(unused_indices))
         time = measurement_list.time
         measurement_array = measurement_list.measurements
         self.initiators = [Measurement(measurement_array[index], time)
                            for index in unused_indices]
 
     def __spawn_preliminary_tracks(self, unusedMeasurementArray, assignments, measTime):
-        log.info("__spawn_preliminary_tracks " + str(len(assignments)))
+        log.info("__spawn_preliminary_tracks %s", len(assignments))
         for initiator_index, measurement_index in assignments:
             delta_vector = unusedMeasurementArray[measurement_index] - self.initiators[initiator_index].value
             dt = measTime - self.initiators[initiator_index].timestamp
             velocity_vector = delta_vector / dt
             speed = np.linalg.norm(velocity_vector)
             if speed > self.v_max*1.5:
-                log.warning("Initiator speed to high {0:6.1f} m/s".format(speed) +
-                            "\n" + str(delta_vector))
+                log.warning("Initiator speed to high %6.1f m/s\n%s", speed, delta_vector)
             x0 = np.hstack((unusedMeasurementArray[measurement_index], velocity_vector))
             track = PreliminaryTrack(x0, pv.P0)
             nisList = [p.compareSimilarity(track) for p in self.preliminary_tracks]
@@ -426,10 +515,9 @@ class Initiator():
             if not any([s <= threshold for s in nisList]):
                 self.preliminary_tracks.append(track)
             else:
-                log.debug("Discarded new preliminaryTrack because it was to similar " +
-                      str([e for e in nisList if e <= threshold]) +  str(track))
-                i = nisList.index(min(nisList))
-                print(self.preliminary_tracks[i])
+                log.debug("Discarded new preliminaryTrack because it was to similar %s%s (closest %s)",
+                          [e for e in nisList if e <= threshold], track,
+                          self.preliminary_tracks[nisList.index(min(nisList))])
 
 if __name__ == "__main__":
     import pymht.utils.simulator as sim
@@ -2,14 +2,83 @@ from pymht.utils.classDefinitions import Position, Velocity
 import pymht.models.pv as model
 import pymht.utils.kalman as kalman
 import pymht.utils.helpFunctions as hpf
+import pymht.utils.measurementKeys as measurementKeys
 import numpy as np
 import copy
 import datetime
-import matplotlib.pyplot as plt
+import collections
 import xml.etree.ElementTree as ET
 from pymht.utils.xmlDefinitions import *
 
 
+class AssociationSet():
+    """
+    The association set of a target: the measurement keys (see
+    pymht.utils.measurementKeys) of the nodes below the root. counts holds the
+    number of nodes using each key, so that the set can be kept up to date as
+    nodes are added and subtrees are cut, without walking the tree. keys is
+    the set as a sorted int64 array, rebuilt when the set has changed.
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self._keys = measurementKeys.empty
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            self._keys = np.array(sorted(self.counts), dtype=np.int64)
+        return self._keys
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def __iter__(self):
+        return iter(self.keys.tolist())
+
+    def __eq__(self, other):
+        return isinstance(other, AssociationSet) and np.array_equal(self.keys, other.keys)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "AssociationSet({0})".format(measurementKeys.toTuples(self.keys))
+
+    @classmethod
+    def fromTree(cls, root):
+        associatedMeasurements = cls()
+        nodes = list(root.trackHypotheses or [])
+        while nodes:
+            node = nodes.pop()
+            associatedMeasurements.addNodes([node])
+            nodes.extend(node.trackHypotheses or [])
+        return associatedMeasurements
+
+    def addNodes(self, nodes):
+        for node in nodes:
+            for key in node.getMeasurementKeys():
+                if key not in self.counts:
+                    self._keys = None
+                self.counts[key] += 1
+
+    def removeNode(self, node):
+        for key in node.getMeasurementKeys():
+            self.counts[key] -= 1
+            if self.counts[key] == 0:
+                del self.counts[key]
+                self._keys = None
+
+    def removeSubtree(self, node):
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            self.removeNode(node)
+            nodes.extend(node.trackHypotheses or [])
+
+
 class Target():
 
     def __init__(self, time, scanNumber, x_0, P_0, ID=None, S_inv=None, **kwargs):
@@ -31,6 +100,10 @@ class Target():
         self.cumulativeNLLR = copy.copy(kwargs.get("cumulativeNLLR", 0))
         self.trackHypotheses = None
         self.mmsi = kwargs.get('mmsi')
+        # The MMSI of this node or of the closest ancestor with one, None if no
+        # node in the chain has an MMSI. Set once when the node is created.
+        self.inheritedMmsi = (self.mmsi if self.mmsi is not None or self.parent is None
+                              else self.parent.inheritedMmsi)
         self.status = kwargs.get('status', activeTag)
         # self.score = self.cumulativeNLLR / self.rootHeight()
         assert self.P_d >= 0
@@ -251,10 +324,7 @@ class Target():
                     parent=self
                     ) for i in range(nNewStates)]
         )
-        for measurementIndex in measurementsIndices:
-            associatedMeasurements.update(
-                {(scanNumber, measurementIndex + 1)}
-            )
+        associatedMeasurements.addNodes(self.trackHypotheses)
 
         if fusedAisData is None:
             return
@@ -265,8 +335,8 @@ class Target():
          fusedMMSI) = fusedAisData
         if any([e is None for e in fusedAisData]):
             return
-        historicalMmsi = self._getHistoricalMmsi()
-        acceptedMMSI = []
+        historicalMmsi = self.inheritedMmsi
+        nNodes = len(self.trackHypotheses)
         for i in range(len(fusedMeasurementIndices)):
             if (historicalMmsi is None) or (fusedMMSI[i] == historicalMmsi):
                 measurementNumber = fusedMeasurementIndices[i] + 1 if fusedMeasurementIndices[i] is not None else None
@@ -286,19 +356,10 @@ class Target():
                            P_d=self.P_d,
                            parent=self)
                 )
-                acceptedMMSI.append(fusedMMSI[i])
-
-        for mmsi in acceptedMMSI:
-            associatedMeasurements.update(
-                {(scanNumber, mmsi)}
-            )
+        associatedMeasurements.addNodes(self.trackHypotheses[nNodes:])
 
     def _getHistoricalMmsi(self):
-        if self.mmsi is not None:
-            return self.mmsi
-        if self.parent is not None:
-            return self.parent._getHistoricalMmsi()
-        return None
+        return self.inheritedMmsi
 
     def _normalizedInnovationSquared(self, measurementsResidual, S_inv):
         return np.sum(measurementsResidual.dot(S_inv) *
@@ -326,23 +387,28 @@ class Target():
                       P_d=self.P_d,
                       parent=self)
 
-    def _pruneAllHypothesisExceptThis(self, keep, backtrack=False):
-        keepIndex = self.trackHypotheses.index(keep)
-        indices = np.delete(np.arange(len(self.trackHypotheses)), [keepIndex])
-        self.trackHypotheses = np.delete(self.trackHypotheses, indices).tolist()
+    def _pruneAllHypothesisExceptThis(self, keep, backtrack=False, associatedMeasurements=None):
+        if associatedMeasurements is not None:
+            for hyp in self.trackHypotheses:
+                if hyp is not keep:
+                    associatedMeasurements.removeSubtree(hyp)
+        self.trackHypotheses = [hyp for hyp in self.trackHypotheses if hyp is keep]
         assert len(self.trackHypotheses) == 1, "It should have been one node left."
 
-        if backtrack and self.parent is not None:
-            self.parent._pruneAllHypothesisExceptThis(self, backtrack=backtrack)
+        # Above the root every node is already down to its history
+        if backtrack and self.parent is not None and not self.isRoot:
+            self.parent._pruneAllHypothesisExceptThis(self, backtrack, associatedMeasurements)
 
     def _pruneEverythingExceptHistory(self):
         if self.parent is not None:
             self.parent._pruneAllHypothesisExceptThis(self, backtrack=True)
 
-    def pruneDepth(self, stepsLeft):
+    def pruneDepth(self, stepsLeft, associatedMeasurements=None):
+        if self.isRoot:
+            return self
         if stepsLeft <= 0:
             if self.parent is not None:
-                self.parent._pruneAllHypothesisExceptThis(self, backtrack=True)
+                self.parent._pruneAllHypothesisExceptThis(self, True, associatedMeasurements)
                 # self.recursiveSubtractScore(self.cumulativeNLLR)
                 assert self.parent.scanNumber == self.scanNumber - 1, \
                     "nScanPruning2: from scanNumber" + str(self.parent.scanNumber) + "->" + str(self.scanNumber)
@@ -350,65 +416,26 @@ class Target():
             else:
                 return self
         elif self.parent is not None:
-            return self.parent.pruneDepth(stepsLeft - 1)
+            return self.parent.pruneDepth(stepsLeft - 1, associatedMeasurements)
         else:
             return self
 
-    def pruneSimilarState(self, threshold):
-        if len(self.trackHypotheses) == 1:
-            return
-        p0 = np.array(self.trackHypotheses[0].x_0[0:2], dtype=np.float32)
-        hypPos = np.array([n.x_0[0:2] for n in self.trackHypotheses[1:]], ndmin=2, dtype=np.float32)
-        deltaPos = hypPos - p0
-        distArray = np.linalg.norm(deltaPos, axis=1)
-        # print("distArray",distArray)
-        gatedDistArray = distArray < threshold
-        # print("gatedDistArray",gatedDistArray)
-        tempFuseIndices = np.where(gatedDistArray)[0] + 1
-        if tempFuseIndices.size == 0:
-            return
-        fuseIndices = []
-        for i in tempFuseIndices:
-            if self.trackHypotheses[i].mmsi is not None:
-                continue
-            fuseIndices.append(i)
-        if len(fuseIndices) == 0:
-            return
-        # print("fuseIndices",fuseIndices)
-
-        # Create merged state
-        fuseStates = np.array([self.trackHypotheses[i].x_0 for i in fuseIndices])
-        # print("fuseStates",fuseStates)
-        meanState = np.mean(fuseStates, axis=0)
-        assert meanState.shape == self.trackHypotheses[0].x_0.shape
-
-        fuseCovariances = np.array([self.trackHypotheses[i].P_0 for i in fuseIndices])
-        meanCovariance = np.mean(fuseCovariances, axis=0)
-        assert meanCovariance.shape == self.trackHypotheses[0].P_0.shape
-
-        cnllrList = np.array([self.trackHypotheses[i].cumulativeNLLR for i in fuseIndices])
-        meanCNLLR = np.mean(cnllrList)
-
-        newNode = Target(self.trackHypotheses[0].time,
-                         self.trackHypotheses[0].scanNumber,
-                         meanState,
-                         meanCovariance,
-                         self.trackHypotheses[0].ID,
-                         P_d=self.trackHypotheses[0].P_d,
-                         parent=self,
-                         cumulativeNLLR=meanCNLLR)
-
-        # Remove "old" nodes
-        preLength = len(self.trackHypotheses)
-        for i in sorted(fuseIndices, reverse=True):
-            # print("i", i)
-            del self.trackHypotheses[i]
-        postLength = len(self.trackHypotheses)
-        assert postLength < preLength
-
-        # Add new node
-        # print("Replacing 0-node")
-        self.trackHypotheses[0] = newNode
+    def pruneSimilarState(self, threshold, associatedMeasurements=None):
+        pruneSimilarStates([self], threshold,
+                           [associatedMeasurements] if associatedMeasurements is not None else None)
+
+    def getMeasurementKeys(self):
+        """
+        The measurement keys of this node, see pymht.utils.measurementKeys.
+        """
+        if self.measurementNumber == 0:
+            return ()
+        keys = ()
+        if self.measurementNumber is not None:
+            keys += (measurementKeys.radarKey(self.scanNumber, self.measurementNumber),)
+        if self.mmsi is not None:
+            keys += (measurementKeys.aisKey(self.scanNumber, self.mmsi),)
+        return keys
 
     def getMeasurementSet(self, root=True):
         subSet = set()
@@ -512,51 +539,50 @@ class Target():
 
         recCheckReferenceIntegrety(self.getInitial())
 
-    def _checkMmsiIntegrity(self, activeMMSI=None):
-        if self.mmsi is not None:
-            if activeMMSI is None:
-                if self.parent is not None:
-                    self.parent._checkMmsiIntegrity(self.mmsi)
+    def _checkMmsiIntegrity(self):
+        """
+        Checks the inherited MMSI of this node, its ancestors and every node
+        below it against a walk from the initial node, and that no chain
+        holds more than one MMSI.
+        """
+        def walkMmsi(node, parentMmsi):
+            if node.mmsi is None:
+                mmsi = parentMmsi
             else:
-                assert self.mmsi == activeMMSI, "A track is associated with multiple MMSI's"
-                if self.parent is not None:
-                    self.parent._checkMmsiIntegrity(self.mmsi)
-        else:
-            if self.parent is not None:
-                self.parent._checkMmsiIntegrity(activeMMSI)
+                assert parentMmsi is None or parentMmsi == node.mmsi, \
+                    "A track is associated with multiple MMSI's"
+                mmsi = node.mmsi
+            assert node.inheritedMmsi == mmsi, "Inherited MMSI out of date"
+            return mmsi
+
+        ancestors = []
+        node = self.parent
+        while node is not None:
+            ancestors.append(node)
+            node = node.parent
+        mmsi = None
+        for node in reversed(ancestors):
+            mmsi = walkMmsi(node, mmsi)
+        nodes = [(self, mmsi)]
+        while nodes:
+            node, parentMmsi = nodes.pop()
+            mmsi = walkMmsi(node, parentMmsi)
+            nodes.extend((hyp, mmsi) for hyp in node.trackHypotheses or [])
 
     def _estimateRadarPeriod(self):
         if self.parent is not None:
             return self.time - self.parent.time
 
     def plotValidationRegion(self, eta2, stepsBack=0):
-        if not hasattr(self, 'kalmanFilter'):
-            raise NotImplementedError("plotValidationRegion is not functional in this version")
-        if self.kalmanFilter.S is not None:
-            self._plotCovarianceEllipse(eta2)
-        if (self.parent is not None) and (stepsBack > 0):
-            self.parent.plotValidationRegion(eta2, stepsBack - 1)
+        from pymht.utils import plotting
+        plotting.plotValidationRegion(self, eta2, stepsBack)
 
     def _plotCovarianceEllipse(self, eta2):
-        from matplotlib.patches import Ellipse
-        lambda_, _ = np.linalg.eig(self.kalmanFilter.S)
-        ell = Ellipse(xy=(self.kalmanFilter.x_bar[0], self.kalmanFilter.x_bar[1]),
-                      width=np.sqrt(lambda_[0]) * np.sqrt(eta2) * 2,
-                      height=np.sqrt(lambda_[1]) * np.sqrt(eta2) * 2,
-                      angle=np.rad2deg(np.arctan2(lambda_[1], lambda_[0])),
-                      linewidth=2,
-                      )
-        ell.set_facecolor('none')
-        ell.set_linestyle("dotted")
-        ell.set_alpha(0.5)
-        ax = plt.subplot(111)
-        ax.add_artist(ell)
+        from pymht.utils import plotting
+        plotting.plotCovarianceEllipse(self, eta2)
 
     def backtrackPosition(self, stepsBack=float('inf')):
-        if self.parent is None:
-            return [self.x_0[0:2]]
-        else:
-            return self.parent.backtrackPosition(stepsBack) + [self.x_0[0:2]]
+        return [node.x_0[0:2] for node in self.backtrackNodes(stepsBack)]
 
     def backtrackState(self, stepsBack=float('inf')):
         if self.parent is None:
@@ -565,18 +591,23 @@ class Target():
             return self.parent.backtrackPosition(stepsBack) + [self.x_0]
 
     def backtrackMeasurement(self, stepsBack=float('inf')):
-        if self.parent is None:
-            return [self.measurement]
-        else:
-            return self.parent.backtrackMeasurement(stepsBack) + [self.measurement]
+        return [node.measurement for node in self.backtrackNodes(stepsBack)]
 
     def backtrackNodes(self, stepsBack=float('inf')):
-        if self.parent is None:
-            return [self]
-        else:
-            return self.parent.backtrackNodes(stepsBack) + [self]
+        nodes = []
+        node = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def getSmoothTrack(self, radarPeriod, **kwargs):
+        if kwargs.get('em', False):
+            return self._getSmoothTrackEM(radarPeriod)
+        return smoothTracks([self], radarPeriod)[0]
 
-    def getSmoothTrack(self, radarPeriod):
+    def _getSmoothTrackEM(self, radarPeriod):
         from pykalman import KalmanFilter
         roughTrackArray = self.backtrackMeasurement()
         initialNode = self.getInitial()
@@ -608,139 +639,46 @@ class Target():
         return smoothedPositions, smoothedVelocities, True
 
     def plotTrack(self, root=None, stepsBack=float('inf'), **kwargs):
-        if kwargs.get('markInitial', False) and stepsBack == float('inf'):
-            self.getInitial().markInitial(**kwargs)
-        if kwargs.get('markID', True):
-            self.getInitial().markID(offset=20, **kwargs)
-        if kwargs.get('markRoot', False) and root is not None:
-            root.markRoot()
-        if kwargs.get('markEnd', True):
-            self.markEnd(**kwargs)
-        if kwargs.get('smooth', False) and self.getInitial().depth() > 1:
-            radarPeriod = kwargs.get('radarPeriod', self._estimateRadarPeriod())
-            track, _, smoothingGood = self.getSmoothTrack(radarPeriod)
-            linestyle = 'dashed'
-            if not smoothingGood:
-                return
-        else:
-            track = self.backtrackPosition(stepsBack)
-            linestyle = 'solid'
-        plt.plot([p[0] for p in track],
-                 [p[1] for p in track],
-                 c=kwargs.get('c'),
-                 linestyle=linestyle)
+        from pymht.utils import plotting
+        plotting.plotTrack(self, root, stepsBack, **kwargs)
 
     def plotMeasurement(self, stepsBack=0, **kwargs):
-        if (self.measurement is not None) and kwargs.get('real', True):
-            Position(self.measurement).plot(
-                self.measurementNumber, self.scanNumber, **kwargs)
-        if kwargs.get("dummy", False):
-            self.getPosition().plot(self.measurementNumber, self.scanNumber, **kwargs)
-
-        if (self.parent is not None) and (stepsBack > 0):
-            self.parent.plotMeasurement(stepsBack - 1, **kwargs)
+        from pymht.utils import plotting
+        plotting.plotMeasurement(self, stepsBack, **kwargs)
 
     def plotStates(self, stepsBack=0, **kwargs):
-        if (self.mmsi is not None) and kwargs.get('ais', True):
-            Position(self.x_0).plot(self.measurementNumber,
-                                    self.scanNumber,
-                                    self.mmsi,
-                                    **kwargs)
-        elif (self.measurementNumber is not None) and (self.measurementNumber == 0) and kwargs.get("dummy", True):
-            Position(self.x_0).plot(self.measurementNumber,
-                                    self.scanNumber,
-                                    **kwargs)
-        elif (self.measurementNumber is not None) and(self.measurementNumber > 0) and kwargs.get('real', True):
-            Position(self.x_0).plot(self.measurementNumber,
-                                    self.scanNumber,
-                                    **kwargs)
-        if (self.parent is not None) and (stepsBack > 0):
-            self.parent.plotStates(stepsBack - 1, **kwargs)
+        from pymht.utils import plotting
+        plotting.plotStates(self, stepsBack, **kwargs)
 
     def plotVelocityArrow(self, stepsBack=1):
-        if self.kalmanFilter.x_bar is not None:
-            ax = plt.subplot(111)
-            deltaPos = self.kalmanFilter.x_bar[0:2] - self.kalmanFilter.x_hat[0:2]
-            ax.arrow(self.kalmanFilter.x_hat[0],
-                     self.kalmanFilter.x_hat[1],
-                     deltaPos[0],
-                     deltaPos[1],
-                     head_width=0.1,
-                     head_length=0.1,
-                     fc="None", ec='k',
-                     length_includes_head="true",
-                     linestyle="-",
-                     alpha=0.3,
-                     linewidth=1)
-        if (self.parent is not None) and (stepsBack > 0):
-            self.parent.plotVelocityArrow(stepsBack - 1)
+        from pymht.utils import plotting
+        plotting.plotVelocityArrow(self, stepsBack)
 
     def markInitial(self, **kwargs):
-        plt.plot(self.x_0[0],
-                 self.x_0[1],
-                 "*",
-                 markerfacecolor='black',
-                 markeredgecolor='black')
+        from pymht.utils import plotting
+        plotting.markInitial(self, **kwargs)
 
     def markID(self, **kwargs):
-        index = self.ID
-        if (index is not None):
-            ax = plt.subplot(111)
-            normVelocity = (self.x_0[2:4] /
-                            np.linalg.norm(self.x_0[2:4]))
-            offsetScale = kwargs.get('offset', 0.0)
-            offset = offsetScale * np.array(normVelocity)
-            position = self.x_0[0:2] - offset
-            (horizontalalignment,
-             verticalalignment) = hpf._getBestTextPosition(normVelocity)
-            ax.text(position[0],
-                    position[1],
-                    "T" + str(index),
-                    fontsize=10,
-                    horizontalalignment=horizontalalignment,
-                    verticalalignment=verticalalignment)
+        from pymht.utils import plotting
+        plotting.markID(self, **kwargs)
 
     def markRoot(self):
-        plt.plot(self.x_0[0],
-                 self.x_0[1],
-                 's',
-                 markerfacecolor='None',
-                 markeredgecolor='black')
+        from pymht.utils import plotting
+        plotting.markRoot(self)
 
     def markEnd(self, **kwargs):
-        plt.plot(self.x_0[0],
-                 self.x_0[1],
-                 "H",
-                 markerfacecolor='None',
-                 markeredgecolor='black')
-        if kwargs.get('terminated', False):
-            plt.plot(self.x_0[0],
-                     self.x_0[1],
-                     "*",
-                     markeredgecolor='red')
+        from pymht.utils import plotting
+        plotting.markEnd(self, **kwargs)
 
     def recDownPlotMeasurements(self, plottedMeasurements, **kwargs):
-        if self.parent is not None:
-            if self.measurementNumber == 0:
-                self.plotMeasurement(**kwargs)
-            else:
-                if kwargs.get('real', True):
-                    measurementID = (self.scanNumber, self.measurementNumber)
-                    if measurementID not in plottedMeasurements:
-                        self.plotMeasurement(**kwargs)
-                        plottedMeasurements.add(measurementID)
-        if self.trackHypotheses is not None:
-            for hyp in self.trackHypotheses:
-                hyp.recDownPlotMeasurements(plottedMeasurements, **kwargs)
+        from pymht.utils import plotting
+        plotting.recDownPlotMeasurements(self, plottedMeasurements, **kwargs)
 
     def recDownPlotStates(self, **kwargs):
-        if self.parent is not None:
-            self.plotStates(**kwargs)
-        if self.trackHypotheses is not None:
-            for hyp in self.trackHypotheses:
-                hyp.recDownPlotStates(**kwargs)
+        from pymht.utils import plotting
+        plotting.recDownPlotStates(self, **kwargs)
 
-    def _storeNode(self, simulationElement, radarPeriod, **kwargs):
+    def _storeNode(self, simulationElement, radarPeriod, smoothTrack=None, **kwargs):
         trackElement = ET.SubElement(simulationElement,
                                      trackTag)
         unSmoothedStates = ET.SubElement(trackElement,
@@ -754,7 +692,9 @@ class Target():
             trackElement.attrib[str(k)] = str(v)
 
         unSmoothedNodes = self.backtrackNodes()
-        smoothedPositions, smoothedVelocities, smoothingGood = self.getSmoothTrack(radarPeriod)
+        if smoothTrack is None:
+            smoothTrack = self.getSmoothTrack(radarPeriod)
+        smoothedPositions, smoothedVelocities, smoothingGood = smoothTrack
 
         trackElement.attrib[lengthTag] = str(len(unSmoothedNodes))
 
@@ -826,5 +766,108 @@ class Target():
             if node.status != activeTag:
                 stateElement.attrib[stateTag] = node.status
 
+
+def pruneSimilarStates(parents, threshold, associationSets=None):
+    """
+    Merges the children of each parent that are within threshold of its
+    first child (the zero hypothesis) and carry no MMSI. The merged node
+    replaces the first child. All sibling groups are handled as one
+    segmented array operation. associationSets[i] is the association set of
+    the target of parents[i].
+    """
+    children = [hyp for parent in parents for hyp in parent.trackHypotheses]
+    groupSizes = np.array([len(parent.trackHypotheses) for parent in parents], dtype=int)
+    groupStarts = np.cumsum(groupSizes) - groupSizes
+    groupIndices = np.repeat(np.arange(len(parents)), groupSizes)
+    nChildren = len(children)
+    if nChildren == len(parents):
+        return
+    positions = np.array([hyp.x_0[0:2] for hyp in children], ndmin=2, dtype=np.float32)
+    distances = np.linalg.norm(positions - positions[groupStarts[groupIndices]], axis=1)
+    hasMmsi = np.array([hyp.mmsi is not None for hyp in children], dtype=bool)
+    isFirst = np.zeros(nChildren, dtype=bool)
+    isFirst[groupStarts] = True
+    fuse = (distances < threshold) & ~isFirst & ~hasMmsi
+    if not np.any(fuse):
+        return
+
+    fuseIndices = np.flatnonzero(fuse)
+    fuseGroups = groupIndices[fuseIndices]
+    fuseCounts = np.bincount(fuseGroups, minlength=len(parents))
+    states = np.zeros((len(parents),) + children[0].x_0.shape)
+    covariances = np.zeros((len(parents),) + children[0].P_0.shape)
+    cnllrs = np.zeros(len(parents))
+    np.add.at(states, fuseGroups, np.array([children[i].x_0 for i in fuseIndices]))
+    np.add.at(covariances, fuseGroups, np.array([children[i].P_0 for i in fuseIndices]))
+    np.add.at(cnllrs, fuseGroups, np.array([children[i].cumulativeNLLR for i in fuseIndices]))
+
+    for group in np.flatnonzero(fuseCounts):
+        parent = parents[group]
+        first = parent.trackHypotheses[0]
+        newNode = Target(first.time,
+                         first.scanNumber,
+                         states[group] / fuseCounts[group],
+                         covariances[group] / fuseCounts[group],
+                         first.ID,
+                         P_d=first.P_d,
+                         parent=parent,
+                         cumulativeNLLR=cnllrs[group] / fuseCounts[group])
+        start = groupStarts[group]
+        groupFuse = fuse[start:start + groupSizes[group]]
+        if associationSets is not None:
+            for hyp, fused in zip(parent.trackHypotheses, groupFuse):
+                if fused:
+                    associationSets[group].removeSubtree(hyp)
+            associationSets[group].removeSubtree(first)
+            associationSets[group].addNodes([newNode])
+        parent.trackHypotheses = [newNode] + [hyp for hyp, fused in
+                                              zip(parent.trackHypotheses[1:], groupFuse[1:])
+                                              if not fused]
+
+
+def smoothTracks(nodes, radarPeriod, **kwargs):
+    """
+    Smooths the tracks ending in each of the nodes with a batched RTS smoother
+    on the tracker model. Returns a list of (positions, velocities, smoothingGood).
+    Set em=True to fit the model with pykalman EM per track instead.
+    """
+    if kwargs.get('em', False):
+        return [node._getSmoothTrackEM(radarPeriod) for node in nodes]
+    results = [None] * len(nodes)
+    tracks = []
+    for index, node in enumerate(nodes):
+        trackNodes = node.backtrackNodes()
+        measurements = np.array([m if m is not None else [np.nan, np.nan]
+                                 for m in (n.measurement for n in trackNodes)],
+                                dtype=np.float64).reshape(-1, 2)
+        if len(trackNodes) < 3:
+            results[index] = (measurements, np.full_like(measurements, np.nan), False)
+        else:
+            tracks.append((index, trackNodes, measurements))
+    if not tracks:
+        return results
+
+    nTracks = len(tracks)
+    nSteps = max(len(trackNodes) for _, trackNodes, _ in tracks)
+    z = np.full((nTracks, nSteps, 2), np.nan)
+    x_0 = np.empty((nTracks, 4))
+    P_0 = np.empty((nTracks, 4, 4))
+    for row, (_, trackNodes, measurements) in enumerate(tracks):
+        z[row, :len(trackNodes)] = measurements
+        x_0[row] = trackNodes[0].x_0
+        P_0[row] = trackNodes[0].P_0
+    mask = ~np.isnan(z).any(axis=2)
+    # The initial node state is already conditioned on its own measurement
+    mask[:, 0] = False
+    x_smooth, _ = kalman.rtsSmoother(z, mask, x_0, P_0,
+                                     model.Phi(radarPeriod),
+                                     model.Q(radarPeriod),
+                                     model.C_RADAR,
+                                     model.R_RADAR())
+    for row, (index, trackNodes, _) in enumerate(tracks):
+        trackStates = x_smooth[row, :len(trackNodes)]
+        results[index] = (trackStates[:, 0:2], trackStates[:, 2:4], True)
+    return results
+
 if __name__ == '__main__':
     pass
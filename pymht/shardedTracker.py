@@ -0,0 +1,316 @@
+"""
+Spatially sharded tracker.
+
+The surveillance area is split into a grid of tiles. Every tile runs its own
+Tracker, by default in a separate process. A measurement or AIS message is
+routed to each tile whose core, grown by the overlap margin, holds it.
+Tracks are only initiated in the core of a tile and are owned by that tile.
+When the track of a target leaves the core by more than the hysteresis
+distance, the target is handed over to the tile whose core it is in. The
+handover carries either the hypothesis tree or the collapsed state of the
+selected track node. getTracks merges the tracks of all tiles and removes
+duplicates in the overlap areas.
+
+The margin should be larger than the hysteresis plus the gate radius, so
+that a track sees all its measurements until it is handed over.
+
+Usage:
+    with ShardedTracker(pv, radarPeriod, lambda_phi, lambda_nu, radarRange=radarRange,
+                        nTiles=(2, 2), margin=1000.) as tracker:
+        for scanList in scanLists:
+            tracker.addMeasurementList(scanList, aisList)
+        tracks = tracker.getTracks()
+"""
+import copy
+import logging
+import importlib
+import multiprocessing
+import numpy as np
+from .tracker import Tracker
+from .utils.classDefinitions import AisMessageList, MeasurementList
+
+log = logging.getLogger(__name__)
+
+_idStride = 10 ** 6
+
+
+class Tile():
+    def __init__(self, index, core, margin):
+        self.index = index
+        self.core = core
+        self.margin = margin
+
+    def inCore(self, positions, distance=0.):
+        xMin, xMax, yMin, yMax = self.core
+        positions = np.array(positions, ndmin=2)
+        return ((positions[:, 0] >= xMin - distance) & (positions[:, 0] < xMax + distance) &
+                (positions[:, 1] >= yMin - distance) & (positions[:, 1] < yMax + distance))
+
+    def inRegion(self, positions):
+        return self.inCore(positions, self.margin)
+
+
+def makeTiles(position, radarRange, nTiles, margin):
+    """
+    Grid of nTiles[0] x nTiles[1] tiles over the radar coverage. The cores
+    of the outer tiles extend to infinity.
+    """
+    tiles = []
+    xEdges = np.linspace(position[0] - radarRange, position[0] + radarRange, nTiles[0] + 1)
+    yEdges = np.linspace(position[1] - radarRange, position[1] + radarRange, nTiles[1] + 1)
+    xEdges[[0, -1]] = [-np.inf, np.inf]
+    yEdges[[0, -1]] = [-np.inf, np.inf]
+    for i in range(nTiles[0]):
+        for j in range(nTiles[1]):
+            core = (xEdges[i], xEdges[i + 1], yEdges[j], yEdges[j + 1])
+            tiles.append(Tile(len(tiles), core, margin))
+    return tiles
+
+
+class TileWorker():
+    """
+    The tracker of one tile. Measurement numbers in the hypothesis trees are
+    local to the tile; handed over trees and their history are translated
+    through the global measurement indices of the scans, which are kept for
+    every scan like the scan history of the tracker.
+    """
+
+    def __init__(self, modelName, radarPeriod, lambda_phi, lambda_nu, tile, **kwargs):
+        model = importlib.import_module(modelName)
+        core = tuple(float(edge) for edge in tile.core)
+        self.tile = tile
+        self.tracker = Tracker(model, radarPeriod, lambda_phi, lambda_nu,
+                               initiationRegion=core, **kwargs)
+        self.tracker.trackIdCounter = tile.index * _idStride
+        self.globalIndices = {}
+
+    def addMeasurementList(self, scanList, globalIndices, aisList, **kwargs):
+        self.tracker.addMeasurementList(scanList, aisList, **kwargs)
+        scanNumber = len(self.tracker.__scanHistory__)
+        self.globalIndices[scanNumber] = globalIndices
+        return self.getTracks()
+
+    def getTracks(self):
+        return [self._describeTrack(node, trackIndex)
+                for trackIndex, node in enumerate(self.tracker.getTrackNodes())]
+
+    def getTerminatedTracks(self):
+        return [self._describeTrack(node, None) for node in self.tracker.__terminatedTargets__]
+
+    def _describeTrack(self, node, trackIndex):
+        mmsi = node._getHistoricalMmsi()
+        return {'id': int(node.ID),
+                'tile': self.tile.index,
+                'index': trackIndex,
+                'time': float(node.time),
+                'state': node.x_0.tolist(),
+                'covariance': node.P_0.tolist(),
+                'cumulativeNLLR': float(node.cumulativeNLLR),
+                'mmsi': int(mmsi) if mmsi is not None else None,
+                'status': node.status}
+
+    def releaseTargets(self, trackIndices, collapse):
+        """
+        Releases the targets with their history as (root node, index of the
+        track node among the leaf nodes, window size). A collapsed target is
+        pruned down to the history of its track node, which becomes the
+        root.
+        """
+        released = []
+        for root, trackNode, windowSize in self.tracker.releaseTargets(trackIndices):
+            if collapse:
+                trackNode._pruneEverythingExceptHistory()
+                root.isRoot = False
+                trackNode.isRoot = True
+                root = trackNode
+            leafIndex = next(i for i, node in enumerate(root.getLeafNodes()) if node is trackNode)
+            self._translateMeasurementNumbers(root, self._localToGlobal)
+            released.append((root, leafIndex, windowSize))
+        return released
+
+    def adoptTargets(self, releasedTargets):
+        adopted = []
+        for root, leafIndex, windowSize in releasedTargets:
+            self._translateMeasurementNumbers(root, self._globalToLocal)
+            adopted.append((root, root.getLeafNodes()[leafIndex], windowSize))
+        self.tracker.adoptTargets(adopted)
+        return self.getTracks()
+
+    def _localToGlobal(self, scanNumber, measurementNumber):
+        globalIndices = self.globalIndices[scanNumber]
+        if measurementNumber > len(globalIndices):
+            return measurementNumber - len(globalIndices)
+        return int(globalIndices[measurementNumber - 1]) + 1
+
+    def _globalToLocal(self, scanNumber, measurementNumber):
+        # Measurements outside this tile are numbered after the local ones
+        globalIndices = self.globalIndices[scanNumber]
+        localIndex = np.searchsorted(globalIndices, measurementNumber - 1)
+        if localIndex < len(globalIndices) and globalIndices[localIndex] == measurementNumber - 1:
+            return int(localIndex) + 1
+        return len(globalIndices) + measurementNumber
+
+    def _translateMeasurementNumbers(self, root, translate):
+        # Above the root every node has one child, the walk starts at the first node of the track
+        while root.parent is not None:
+            root = root.parent
+        nodes = [root]
+        while nodes:
+            node = nodes.pop()
+            if node.measurementNumber and node.scanNumber in self.globalIndices:
+                node.measurementNumber = translate(node.scanNumber, node.measurementNumber)
+            if node.trackHypotheses is not None:
+                nodes.extend(node.trackHypotheses)
+
+
+def _serveTile(connection, args, kwargs):
+    worker = TileWorker(*args, **kwargs)
+    while True:
+        name, args, kwargs = connection.recv()
+        if name is None:
+            break
+        try:
+            connection.send((True, getattr(worker, name)(*args, **kwargs)))
+        except Exception as exception:
+            connection.send((False, exception))
+    connection.close()
+
+
+class _LocalTile():
+    def __init__(self, *args, **kwargs):
+        self.worker = TileWorker(*args, **kwargs)
+        self._result = None
+
+    def send(self, name, *args, **kwargs):
+        self._result = getattr(self.worker, name)(*args, **kwargs)
+
+    def receive(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class _ProcessTile():
+    def __init__(self, *args, **kwargs):
+        self.connection, childConnection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serveTile,
+                                               args=(childConnection, args, kwargs),
+                                               daemon=True)
+        self.process.start()
+        childConnection.close()
+
+    def send(self, name, *args, **kwargs):
+        self.connection.send((name, args, kwargs))
+
+    def receive(self):
+        success, result = self.connection.recv()
+        if not success:
+            raise result
+        return result
+
+    def close(self):
+        if self.process.is_alive():
+            self.connection.send((None, None, None))
+            self.process.join()
+        self.connection.close()
+
+
+class ShardedTracker():
+    def __init__(self, model, radarPeriod, lambda_phi, lambda_nu, **kwargs):
+        self.position = kwargs.pop('position', np.array([0., 0.]))
+        self.radarRange = kwargs.get('radarRange', float('inf'))
+        assert np.isfinite(self.radarRange), "The sharded tracker needs a finite radarRange"
+        self.margin = kwargs.pop('margin', 1000.)
+        self.hysteresis = kwargs.pop('hysteresis', self.margin * 0.25)
+        self.collapse = kwargs.pop('handover', 'tree') == 'collapsed'
+        processes = kwargs.pop('processes', True)
+        self.mergeThreshold = 4 * (model.sigmaR_RADAR_tracker ** 2)
+        self.tiles = makeTiles(self.position, self.radarRange, kwargs.pop('nTiles', (2, 2)), self.margin)
+        tileClass = _ProcessTile if processes else _LocalTile
+        self.workers = []
+        try:
+            for tile in self.tiles:
+                self.workers.append(tileClass(model.__name__, radarPeriod, lambda_phi, lambda_nu,
+                                              tile, position=self.position, **kwargs))
+        except Exception:
+            self.close()
+            raise
+        self.tracks = [[] for _ in self.tiles]
+        self.nHandovers = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+
+    def addMeasurementList(self, scanList, aisList=AisMessageList(), **kwargs):
+        measurements = np.array(scanList.measurements, ndmin=2).reshape(-1, 2)
+        aisList = aisList if aisList is not None else AisMessageList()
+        aisPositions = aisList.getColumns().state[:, 0:2].reshape(-1, 2)
+        for tile, worker in zip(self.tiles, self.workers):
+            globalIndices = np.flatnonzero(tile.inRegion(measurements))
+            tileAisList = aisList.select(np.flatnonzero(tile.inRegion(aisPositions)))
+            worker.send('addMeasurementList', MeasurementList(scanList.time, measurements[globalIndices]),
+                        globalIndices, tileAisList, **kwargs)
+        self.tracks = [worker.receive() for worker in self.workers]
+        self._handover()
+
+    def _handover(self):
+        destinations = [{} for _ in self.tiles]
+        for tile, tracks in zip(self.tiles, self.tracks):
+            for track in tracks:
+                position = track['state'][0:2]
+                if tile.inCore(position, self.hysteresis)[0]:
+                    continue
+                destination = next(t for t in self.tiles if t.inCore(position)[0])
+                destinations[tile.index][track['index']] = destination.index
+        if not any(destinations):
+            return
+        for tile, worker in zip(self.tiles, self.workers):
+            if destinations[tile.index]:
+                worker.send('releaseTargets', sorted(destinations[tile.index]), self.collapse)
+        incoming = [[] for _ in self.tiles]
+        for tile, worker in zip(self.tiles, self.workers):
+            if destinations[tile.index]:
+                released = worker.receive()
+                for trackIndex, handover in zip(sorted(destinations[tile.index]), released):
+                    incoming[destinations[tile.index][trackIndex]].append(handover)
+                    self.nHandovers += 1
+        for tile, worker in zip(self.tiles, self.workers):
+            if incoming[tile.index] or destinations[tile.index]:
+                worker.send('adoptTargets', incoming[tile.index])
+        for tile, worker in zip(self.tiles, self.workers):
+            if incoming[tile.index] or destinations[tile.index]:
+                self.tracks[tile.index] = worker.receive()
+
+    def getTracks(self):
+        """
+        Tracks of all tiles, a track in an overlap area is only reported once.
+        """
+        tracks = [track for tile, tileTracks in zip(self.tiles, self.tracks)
+                  for track in tileTracks
+                  if tile.inCore(track['state'][0:2], self.hysteresis)[0]]
+        tracks.sort(key=lambda track: track['cumulativeNLLR'])
+        merged = []
+        for track in tracks:
+            if all(np.linalg.norm(np.subtract(track['state'][0:2], other['state'][0:2])) >= self.mergeThreshold
+                   for other in merged if other['tile'] != track['tile']):
+                merged.append(copy.copy(track))
+        merged.sort(key=lambda track: track['id'])
+        return merged
+
+    def getTerminatedTracks(self):
+        """
+        Terminated tracks of all tiles, including the targets that were
+        replaced by, or discarded as, a duplicate at a handover.
+        """
+        for worker in self.workers:
+            worker.send('getTerminatedTracks')
+        return [track for worker in self.workers for track in worker.receive()]
@@ -0,0 +1,91 @@
+"""
+Slot map holding the per-target state of the tracker.
+
+Every target gets a slot when it is initiated or adopted and keeps it until
+it is terminated or released, so a slot is a stable handle for the target.
+The per-target fields are columns indexed by slot. Freed slots are reused
+lowest first, which keeps the slots compact. Adding and removing a target
+does not move the other targets.
+"""
+import heapq
+import numpy as np
+
+
+class TargetRegistry():
+
+    def __init__(self, capacity=16):
+        self.roots = np.empty(capacity, dtype=np.dtype(object))
+        self.trackNodes = np.empty(capacity, dtype=np.dtype(object))
+        self.windowSizes = np.zeros(capacity, dtype=np.int64)
+        self.associations = np.empty(capacity, dtype=np.dtype(object))
+        self.used = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity))
+        self._slots = None
+
+    def __len__(self):
+        return len(self.used) - len(self._free)
+
+    @property
+    def capacity(self):
+        return len(self.used)
+
+    @property
+    def slots(self):
+        """
+        The used slots in increasing order.
+        """
+        if self._slots is None:
+            self._slots = np.flatnonzero(self.used)
+        return self._slots
+
+    def add(self, root, trackNode, windowSize, associations, slot=None):
+        """
+        Stores a new target in the lowest free slot, or in slot if given.
+        Returns the slot.
+        """
+        if slot is None:
+            if not self._free:
+                self._grow(2 * self.capacity)
+            slot = heapq.heappop(self._free)
+        else:
+            if slot >= self.capacity:
+                self._grow(max(2 * self.capacity, slot + 1))
+            assert not self.used[slot], "Slot is in use"
+            self._free.remove(slot)
+            heapq.heapify(self._free)
+        self.roots[slot] = root
+        self.trackNodes[slot] = trackNode
+        self.windowSizes[slot] = windowSize
+        self.associations[slot] = associations
+        self.used[slot] = True
+        self._slots = None
+        return slot
+
+    def remove(self, slot):
+        """
+        Frees the slot and returns (root, trackNode, windowSize, associations).
+        """
+        assert self.used[slot], "Slot is not in use"
+        removed = (self.roots[slot], self.trackNodes[slot],
+                   int(self.windowSizes[slot]), self.associations[slot])
+        self.roots[slot] = None
+        self.trackNodes[slot] = None
+        self.windowSizes[slot] = 0
+        self.associations[slot] = None
+        self.used[slot] = False
+        heapq.heappush(self._free, slot)
+        self._slots = None
+        return removed
+
+    def clear(self):
+        self.__init__(self.capacity)
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.roots = np.concatenate((self.roots, np.empty(extra, dtype=np.dtype(object))))
+        self.trackNodes = np.concatenate((self.trackNodes, np.empty(extra, dtype=np.dtype(object))))
+        self.windowSizes = np.concatenate((self.windowSizes, np.zeros(extra, dtype=np.int64)))
+        self.associations = np.concatenate((self.associations, np.empty(extra, dtype=np.dtype(object))))
+        for slot in range(len(self.used), capacity):
+            heapq.heappush(self._free, slot)
+        self.used = np.concatenate((self.used, np.zeros(extra, dtype=bool)))
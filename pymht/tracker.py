@@ -7,8 +7,16 @@ Spring 2017
 ========================================================================================
 """
 from pymht.utils.xmlDefinitions import *
-from pymht.pyTarget import Target
+from pymht.pyTarget import Target, AssociationSet, pruneSimilarStates, smoothTracks
+from pymht.targetRegistry import TargetRegistry
+from pymht.utils.deadline import Deadline
 import pymht.utils.kalman as kalman
+import pymht.utils.snapshot as snapshot
+import pymht.utils.trace as trace
+import pymht.utils.sector as sector
+import pymht.utils.measurementKeys as measurementKeys
+import pymht.utils.memory as memory
+import pymht.utils.profiler as profiler
 import pymht.initiators.m_of_n as m_of_n
 import pymht.models.pv as pv
 import pymht.models.ais as ais_model
@@ -17,13 +25,9 @@ import copy
 import logging
 import datetime
 import itertools
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.sparse.csgraph import connected_components
-from ortools.linear_solver import pywraplp
-from termcolor import cprint
 import xml.etree.ElementTree as ET
-from .utils.classDefinitions import AisMessageList
+from .utils.classDefinitions import AisMessageList, MeasurementList
 import os
 npVersionTuple = np.__version__.split('.')
 assert (int(npVersionTuple[0]) >= 1 and int(npVersionTuple[1]) >= 12), str(np.__version__)
@@ -39,11 +43,7 @@ class Tracker():
 
     def __init__(self, model, radarPeriod, lambda_phi, lambda_nu, **kwargs):
 
-        log.debug('Debug Initializing MHT tracker')
-        log.info('Info Initializing MHT tracker')
-        log.warning('Warning Initializing MHT tracker')
-        log.error('Error Initializing MHT tracker')
-        log.critical('Critical Initializing MHT tracker')
+        log.debug('Initializing MHT tracker')
 
         # Radar parameters
         self.position = kwargs.get('position', np.array([0., 0.]))
@@ -73,19 +73,19 @@ class Tracker():
                                           self.maxSpeedMS,
                                           self.C,
                                           self.R_RADAR,
-                                          self.mergeThreshold,
-                                          logLevel='DEBUG')
+                                          self.mergeThreshold)
 
         # Tracker storage
-        self.__targetList__ = []
-        self.__targetWindowSize__ = []
+        self.__targets__ = TargetRegistry()
         self.__scanHistory__ = []
-        self.__associatedMeasurements__ = []
         self.__targetProcessList__ = []
-        self.__trackNodes__ = np.empty(0, dtype=np.dtype(object))
         self.__terminatedTargets__ = []
         self.__clusterList__ = []
         self.__aisHistory__ = []
+        self.__snapshotWriter__ = None
+        self.__sectorScan__ = None
+        self.__initiationDeferred__ = False
+        self.__leafNodeIndex__ = None
         self.trackIdCounter = 0
 
         # Timing and logging
@@ -98,12 +98,34 @@ class Tracker():
                            'N-Prune': [],
                            'Terminate': [],
                            'Init': [],
+                           'Degraded': [],
                            }
         self.tic = {}
         self.toc = {}
         self.nOptimSolved = 0
         self.leafNodeTimeList = []
         self.createComputationTime = None
+        self.deadline = None
+        self.degradationLog = []
+
+        # Memory accounting, see pymht.utils.memory
+        self.memoryLimits = kwargs.get('memoryLimits', {})
+        self.memoryAccounting = kwargs.get('memoryAccounting', bool(self.memoryLimits))
+        self.stageAllocations = memory.StageAllocations() if kwargs.get('traceAllocations', False) else None
+        self.historyUsage = memory.HistoryUsage()
+        if self.memoryAccounting:
+            self.runtimeLog.update(('Mem-' + name, []) for name in memory.structures + ['Total'])
+        if self.stageAllocations is not None:
+            self.runtimeLog.update(('Alloc-' + stage, []) for stage in memory.stages)
+
+        # Profiles of slow scans, see pymht.utils.profiler
+        self.slowScanFraction = kwargs.get('slowScanFraction', 0.6)
+        self.profileDirectory = kwargs.get('profileDirectory')
+        self.profileKeep = kwargs.get('profileKeep', 10)
+        self.profileState = kwargs.get('profileState', False)
+        self.__profiler__ = (profiler.SamplingProfiler(kwargs.get('profileInterval', 0.005))
+                             if self.profileDirectory is not None else None)
+        self.__capture__ = None
 
         # Tracker parameters
         self.pruneSimilar = kwargs.get('pruneSimilar', False)
@@ -120,7 +142,10 @@ class Tracker():
         self.scoreUpperLimit = -np.log(1 - self.default_P_d) * 0.8
         self.clnnrUpperLimit = 3.0
         self.pruneThreshold = kwargs.get("pruneThreshold", 4)
+        self.initiationRegion = kwargs.get("initiationRegion")
         self.targetSizeLimit = 3000
+        self.maxLeaves = kwargs.get('maxLeaves', 64)
+        self.stageDeadlines = kwargs.get('stageDeadlines', {})
 
         if ((kwargs.get("realTime") is not None) and
                 (kwargs.get("realTime") is True)):
@@ -129,7 +154,7 @@ class Tracker():
         # Misc
         self.colors = ['r', 'g', 'b', 'c', 'm', 'y', 'k']
 
-        log.info("Initiation done\n" + "#" * 100)
+        log.debug("Initiation done")
 
     def setHighPriority(self):
         import psutil
@@ -142,35 +167,262 @@ class Tracker():
             p.nice(psutil.HIGH_PRIORITY_CLASS)
 
     def preInitialize(self, simList):
-        for initialTarget in simList[0]:
-            self.initiateTarget(Target(initialTarget.time,
-                                       None,
-                                       initialTarget.cartesianState(),
-                                       pv.P0,
-                                       status=preinitializedTag))
+        self.initiateTargets([Target(initialTarget.time,
+                                     None,
+                                     initialTarget.cartesianState(),
+                                     pv.P0,
+                                     status=preinitializedTag)
+                              for initialTarget in simList[0]])
 
     def initiateTarget(self, newTarget):
-        if newTarget.haveNoNeightbours(self.__targetList__, self.mergeThreshold):
+        self.initiateTargets([newTarget])
+
+    def initiateTargets(self, newTargets):
+        if not newTargets:
+            return
+        newPositions = np.array([t.x_0[0:2] for t in newTargets], ndmin=2)
+        hasNeighbour = self._getLeafNodeDistances(newPositions) < self.mergeThreshold
+        deltaTensor = newPositions[:, np.newaxis, :] - newPositions[np.newaxis, :, :]
+        closeToNew = np.linalg.norm(deltaTensor, axis=2) < self.mergeThreshold
+        accepted = np.zeros(len(newTargets), dtype=bool)
+        for i, newTarget in enumerate(newTargets):
+            if hasNeighbour[i] or np.any(closeToNew[i] & accepted):
+                log.debug("Discarded an initial target: %s", newTarget)
+                continue
+            accepted[i] = True
             target = copy.copy(newTarget)
             target.scanNumber = len(self.__scanHistory__)
             target.P_d = self.default_P_d
             target.ID = copy.copy(self.trackIdCounter)
             target.isRoot = True
             self.trackIdCounter += 1
-            self.__targetList__.append(target)
-            self.__associatedMeasurements__.append(set())
-            self.__trackNodes__ = np.append(self.__trackNodes__, target)
-            self.__targetWindowSize__.append(self.N)
-        else:
-            log.debug("Discarded an initial target: " + str(newTarget))
+            self.__targets__.add(target, target, self.N, AssociationSet())
+
+    def releaseTargets(self, trackIndices):
+        """
+        Removes the targets without terminating them, for handing them over
+        to another tracker. Returns (root node, track node, window size) for
+        each target.
+        """
+        slots = self.__targets__.slots[np.asarray(trackIndices, dtype=int)]
+        return [self.__targets__.remove(slot)[0:3] for slot in slots]
+
+    def adoptTargets(self, releasedTargets):
+        """
+        Adds targets released by another tracker that has processed the same
+        number of scans. If an incoming track is within mergeThreshold of an
+        existing track, only the one with the lowest cumulative NLLR is kept,
+        the others are terminated. Returns the number of adopted targets.
+        """
+        targets = self.__targets__
+        nAdopted = 0
+        for root, trackNode, windowSize in releasedTargets:
+            assert root.isRoot
+            assert trackNode.scanNumber == len(self.__scanHistory__)
+            distances = np.array([np.linalg.norm(node.x_0[0:2] - trackNode.x_0[0:2])
+                                  for node in targets.trackNodes[targets.slots]])
+            duplicates = targets.slots[distances < self.mergeThreshold]
+            slot = targets.add(root, trackNode, windowSize, AssociationSet.fromTree(root))
+            if any(targets.trackNodes[duplicate].cumulativeNLLR <= trackNode.cumulativeNLLR
+                   for duplicate in duplicates):
+                log.debug("Discarded handed over target %s", trackNode.ID)
+                self._terminateTracks([slot])
+                continue
+            if duplicates.size:
+                log.debug("Handed over target %s replaces %s", trackNode.ID,
+                          [targets.trackNodes[duplicate].ID for duplicate in duplicates])
+                self._terminateTracks(list(duplicates))
+            nAdopted += 1
+        return nAdopted
+
+    def _getLeafNodeDistances(self, positions):
+        """
+        Distance from each position to the nearest leaf node of the targets.
+        The KD-tree of the leaf positions is built once per scan and reused
+        while the targets it was built from are unchanged. Targets initiated
+        after it was built are measured directly.
+        """
+        from scipy.spatial import cKDTree
+        targets = self.__targets__
+        scanNumber = len(self.__scanHistory__)
+        cache = self.__leafNodeIndex__
+        if (cache is None or cache[0] != scanNumber or
+                any(targets.roots[slot] is not root for slot, root in zip(cache[1], cache[2]))):
+            slots = targets.slots.copy()
+            leafPositions = [node.x_0[0:2]
+                             for target in targets.roots[slots]
+                             for node in target.getLeafNodes()]
+            leafPositionIndex = cKDTree(np.array(leafPositions, ndmin=2)) if leafPositions else None
+            cache = (scanNumber, slots, list(targets.roots[slots]), leafPositionIndex)
+            self.__leafNodeIndex__ = cache
+        distances = np.full(positions.shape[0], np.inf)
+        if cache[3] is not None:
+            distances, _ = cache[3].query(positions, k=1)
+        newLeafPositions = [node.x_0[0:2]
+                            for target in targets.roots[np.setdiff1d(targets.slots, cache[1])]
+                            for node in target.getLeafNodes()]
+        if newLeafPositions:
+            deltaTensor = positions[:, np.newaxis, :] - np.array(newLeafPositions, ndmin=2)[np.newaxis, :, :]
+            distances = np.minimum(distances, np.min(np.linalg.norm(deltaTensor, axis=2), axis=1))
+        return distances
 
     def addMeasurementList(self, scanList, aisList=AisMessageList(), **kwargs):
+        self.finishSectorScan()
+        self._beginCapture(scanList, aisList, **kwargs)
+        self._beginScan(scanList, aisList, **kwargs)
+
+        # 0 --Iterative procedure for tracking --
+        self.tic['Total'] = time.time()
+
+        # 1 --Grow each track tree--
+        self.tic['Process'] = time.time()
+        nRadarMeas = len(scanList.measurements)
+        radarMeasDim = self.C.shape[0]
+        scanNumber = len(self.__scanHistory__)
+        unusedRadarMeasurementIndices = np.ones(nRadarMeas, dtype=np.bool)
+        targetProcessTimes = np.zeros(self.__targets__.capacity)
+        nTargetNodes = np.zeros(self.__targets__.capacity)
+        if kwargs.get('gnn', False):
+            self._growTargetsGnn(nTargetNodes, scanList, unusedRadarMeasurementIndices, scanNumber,
+                                 targetProcessTimes)
+        else:
+            for slot in self.__targets__.slots:
+                self._growTarget(slot, nTargetNodes, scanList, aisList, radarMeasDim,
+                                 unusedRadarMeasurementIndices, scanList.time, scanNumber, targetProcessTimes)
+        self.toc['Process'] = time.time() - self.tic['Process']
+        self._recordAllocations('Process')
+
+        self._finishScan(scanList, aisList, unusedRadarMeasurementIndices,
+                         targetProcessTimes, nTargetNodes, **kwargs)
+
+    def addSector(self, sectorList, aisList=None, **kwargs):
+        """
+        Sector mode for rotating radars. sectorList holds the measurements of
+        the azimuth sector sectorList.sector (see pymht.utils.sector) and the
+        time of the scan it belongs to. aisList is only read with the first
+        sector of a scan. A target is grown as soon as the sectors holding the
+        gates of all its leaf nodes have arrived. Clustering, optimisation,
+        termination, pruning and initiation run when the sectors cover the
+        full circle, or when a sector of the next scan arrives. With
+        deadline=True the budget of the scan is spent on processing the
+        sectors, the time between them is not counted.
+        Returns (track index, best leaf node) for the targets grown by this
+        sector, before the global association of the scan.
+        """
+        assert not kwargs.get('gnn', False), "GNN mode needs full scans"
+        pending = self.__sectorScan__
+        if pending is not None and pending['scanList'].time != sectorList.time:
+            self.finishSectorScan()
+            pending = None
+        if pending is None:
+            pending = self._beginSectorScan(sectorList, aisList, **kwargs)
+
+        tic = time.time()
+        self._markAllocations()
+        scanList = pending['scanList']
+        measurements = np.array(sectorList.measurements, ndmin=2).reshape(-1, self.C.shape[0])
+        assert np.all(sector.inSector(sector.azimuth(measurements, self.position), sectorList.sector)), \
+            "Measurement outside of sector"
+        scanList.measurements = np.vstack((scanList.measurements, measurements))
+        pending['unused'] = np.concatenate((pending['unused'], np.ones(len(measurements), dtype=bool)))
+        pending['coverage'] = sector.addCoverage(pending['coverage'], sectorList.sector)
+        readyTargets = [slot for slot, gateSector in pending['gateSectors'].items()
+                        if not pending['grown'][slot] and
+                        sector.isCovered(pending['coverage'], gateSector)]
+        self._growSectorTargets(readyTargets)
+        self.toc['Process'] += time.time() - tic
+        self._recordAllocations('Process')
+
+        provisionalTracks = [(int(np.searchsorted(self.__targets__.slots, slot)),
+                              self.__targets__.roots[slot]._selectBestHypothesis())
+                             for slot in readyTargets]
+        if sector.isComplete(pending['coverage']):
+            self.finishSectorScan()
+        return provisionalTracks
+
+    def finishSectorScan(self):
+        """
+        Completes the scan started by addSector, if any. Targets whose gates
+        are not covered by the received sectors are grown with the
+        measurements received so far.
+        """
+        pending = self.__sectorScan__
+        if pending is None:
+            return
+        tic = time.time()
+        # The deadline counts the processing of the sectors, not the wait for the rotation
+        if pending['kwargs'].get('deadline', False):
+            self.deadline = Deadline(self.radarPeriod, len(self.__scanHistory__),
+                                     stageDeadlines=self.stageDeadlines,
+                                     startTime=tic - self.toc['Process'])
+        self._markAllocations()
+        self._growSectorTargets([slot for slot in pending['gateSectors'] if not pending['grown'][slot]])
+        self.toc['Process'] += time.time() - tic
+        self._recordAllocations('Process')
+        self.__sectorScan__ = None
+        self.tic['Total'] = time.time() - self.toc['Process']
+        self._finishScan(pending['scanList'], pending['aisList'], pending['unused'],
+                         pending['targetProcessTimes'], pending['nTargetNodes'], **pending['kwargs'])
+
+    def _beginSectorScan(self, sectorList, aisList, **kwargs):
+        aisList = aisList if aisList is not None else AisMessageList()
+        measurements = np.asarray(sectorList.measurements)
+        scanList = MeasurementList(sectorList.time,
+                                   np.empty((0, self.C.shape[0]), dtype=measurements.dtype))
+        self._beginScan(scanList, aisList, startDeadline=False, **kwargs)
+        targets = self.__targets__
+        self.toc['Process'] = 0.
+        self.__sectorScan__ = {'scanList': scanList,
+                               'aisList': aisList,
+                               'kwargs': kwargs,
+                               'coverage': [],
+                               'gateSectors': {slot: self._gateSector(targets.roots[slot], len(aisList) > 0)
+                                               for slot in targets.slots},
+                               'grown': np.zeros(targets.capacity, dtype=bool),
+                               'unused': np.ones(0, dtype=bool),
+                               'targetProcessTimes': np.zeros(targets.capacity),
+                               'nTargetNodes': np.zeros(targets.capacity)}
+        return self.__sectorScan__
+
+    def _growSectorTargets(self, slots):
+        pending = self.__sectorScan__
+        scanList = pending['scanList']
+        for slot in slots:
+            self._growTarget(slot, pending['nTargetNodes'], scanList, pending['aisList'],
+                             self.C.shape[0], pending['unused'], scanList.time,
+                             len(self.__scanHistory__), pending['targetProcessTimes'])
+            pending['grown'][slot] = True
+
+    def _gateSector(self, target, withAis):
+        """
+        Sector holding the predicted radar gates of all the leaf nodes. With
+        AIS the gate is widened by the AIS gate, which bounds how far fusion
+        moves the radar gate.
+        """
+        leafNodes = target.getLeafNodes()
+        x_0_list = np.array([node.x_0 for node in leafNodes], ndmin=2)
+        P_0_list = np.array([node.P_0 for node in leafNodes], ndmin=3)
+        x_bar_list, P_bar_list = kalman.predict(self.A, self.Q, x_0_list, P_0_list)
+        S_list = np.matmul(np.matmul(self.C, P_bar_list), self.C.T) + self.R_RADAR
+        radii = np.sqrt(self.eta2 * np.linalg.eigvalsh(S_list)[:, -1])
+        if withAis:
+            radii *= 1. + np.sqrt(self.eta2_ais / self.eta2)
+        z_hat_list = x_bar_list.dot(self.C.T)
+        return sector.spanSectors([sector.discSector(z_hat, radius, self.position)
+                                   for z_hat, radius in zip(z_hat_list, radii)])
+
+    def _beginScan(self, scanList, aisList, startDeadline=True, **kwargs):
         if kwargs.get("checkIntegrity", False):
             self._checkTrackerIntegrity()
         self.tic.clear()
         self.toc.clear()
 
-        log.info("addMeasurementList starting " + str(len(self.__scanHistory__) + 1))
+        log.info("addMeasurementList starting %s", len(self.__scanHistory__) + 1)
+        if self.stageAllocations is not None:
+            self.stageAllocations.reset()
+        self.deadline = (Deadline(self.radarPeriod, len(self.__scanHistory__) + 1,
+                                  stageDeadlines=self.stageDeadlines)
+                         if startDeadline and kwargs.get('deadline', False) else None)
 
         # Adding new data to history
         self.__scanHistory__.append(scanList)
@@ -178,52 +430,42 @@ class Tracker():
 
         # Verifying time stamps
         scanTime = scanList.time
-        log.debug('Radar time \t' +
-                  datetime.datetime.fromtimestamp(scanTime).strftime("%H:%M:%S.%f"))
+        log.debug('Radar time \t%s', trace.Lazy(
+            lambda: datetime.datetime.fromtimestamp(scanTime).strftime("%H:%M:%S.%f")))
 
         if aisList is not None:
-            assert all([float(aisMessage.time) < scanTime for aisMessage in aisList])
-            assert all([float(aisMessage.time) > scanTime - self.radarPeriod for aisMessage in aisList]),\
-                str(scanTime) + str([m.time for m in aisList])
-            mmsiList = [m.mmsi for m in aisList]
-            mmsiSet = set(mmsiList)
-            assert len(mmsiList) == len(mmsiSet), "Duplicate MMSI in aisList"
-            log.debug(
-                'AIS times \t' + ','.join([aisMeasurement.getTimeString() for aisMeasurement in aisList]))
-            log.debug("AIS list:\n" + '\n'.join([str(m) for m in aisList]))
-            nAisMeasurements = len(aisList)
-
-        # 0 --Iterative procedure for tracking --
-        self.tic['Total'] = time.time()
+            aisColumns = aisList.getColumns()
+            assert np.all(aisColumns.time < scanTime)
+            assert np.all(aisColumns.time > scanTime - self.radarPeriod), \
+                str(scanTime) + str(aisColumns.time)
+            assert len(aisColumns.rowOfMmsi) == np.count_nonzero(aisColumns.mmsi != -1), \
+                "Duplicate MMSI in aisList"
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('AIS times \t%s', ','.join([m.getTimeString() for m in aisList]))
+                log.debug("AIS list:\n%s", '\n'.join([str(m) for m in aisList]))
 
-        # 1 --Grow each track tree--
-        self.tic['Process'] = time.time()
-        nRadarMeas = len(scanList.measurements)
-        radarMeasDim = self.C.shape[0]
-        scanNumber = len(self.__scanHistory__)
-        nTargets = len(self.__targetList__)
         timeSinceLastScan = scanTime - self.__scanHistory__[-1].time
         if not self.fixedPeriod:
             self.radarPeriod = timeSinceLastScan
-        unusedRadarMeasurementIndices = np.ones(nRadarMeas, dtype=np.bool)
         self.leafNodeTimeList = []
-        targetProcessTimes = np.zeros(nTargets)
-        nTargetNodes = np.zeros(nTargets)
-        for targetIndex, _ in enumerate(self.__targetList__):
-            self._growTarget(targetIndex, nTargetNodes, scanList, aisList, radarMeasDim,
-                             unusedRadarMeasurementIndices, scanTime, scanNumber, targetProcessTimes)
-        self.toc['Process'] = time.time() - self.tic['Process']
+
+    def _finishScan(self, scanList, aisList, unusedRadarMeasurementIndices,
+                    targetProcessTimes, nTargetNodes, **kwargs):
+        nRadarMeas = len(scanList.measurements)
+        scanNumber = len(self.__scanHistory__)
 
         if kwargs.get("printAssociation", False):
-            print(*self.__associatedMeasurements__, sep="\n", end="\n\n")
+            print(*self.__targets__.associations[self.__targets__.slots], sep="\n", end="\n\n")
 
         if kwargs.get("checkIntegrity", False):
             self._checkTrackerIntegrity()
 
         # 2 --Cluster targets --
         self.tic['Cluster'] = time.time()
+        self._markAllocations()
         self.__clusterList__ = self._findClustersFromSets()
         self.toc['Cluster'] = time.time() - self.tic['Cluster']
+        self._recordAllocations('Cluster')
         if kwargs.get("printCluster", False):
             self.printClusterList(self.__clusterList__)
 
@@ -231,15 +473,23 @@ class Tracker():
         self.tic['Optim'] = time.time()
         self.nOptimSolved = 0
         for cluster in self.__clusterList__:
-            if len(cluster) == 1:
+            if kwargs.get('gnn', False):
+                # The trees are single hypothesis, the association is already made
+                for slot in cluster:
+                    self.__targets__.trackNodes[slot] = self.__targets__.roots[slot]._selectBestHypothesis()[0]
+            elif len(cluster) == 1:
                 if kwargs.get('pruneSimilar', False):
                     self._pruneSimilarState(cluster, self.pruneThreshold)
-                self.__trackNodes__[cluster] = self.__targetList__[
+                self.__targets__.trackNodes[cluster] = self.__targets__.roots[
                     cluster[0]]._selectBestHypothesis()
+            elif self.deadline is not None and self.deadline.isBehind('Optim'):
+                self.deadline.degrade('Optim', 'greedy')
+                self.__targets__.trackNodes[cluster] = self._solveGreedyAssociation(cluster)
             else:
-                self.__trackNodes__[cluster] = self._solveOptimumAssociation(cluster)
+                self.__targets__.trackNodes[cluster] = self._solveOptimumAssociation(cluster)
                 self.nOptimSolved += 1
         self.toc['Optim'] = time.time() - self.tic['Optim']
+        self._recordAllocations('Optim')
 
         # 4 -- ILP Pruning
         self.tic['ILP-Prune'] = time.time()
@@ -251,45 +501,62 @@ class Tracker():
         if kwargs.get('dynamicWindow', False):
             self.__dynamicWindow(targetProcessTimes)
         self.toc['DynN'] = time.time() - self.tic['DynN']
+        self._recordAllocations('DynN')
 
         # 6 -- Pick out dead tracks (terminate)
         self.tic['Terminate'] = time.time()
         deadTracks = self.__analyzeTrackTermination()
         self._terminateTracks(deadTracks)
         self.toc['Terminate'] = time.time() - self.tic['Terminate']
+        self._recordAllocations('Terminate')
 
         # 5 --Prune sliding window --
         self.tic['N-Prune'] = time.time()
         self._nScanPruning()
         self.toc['N-Prune'] = time.time() - self.tic['N-Prune']
+        self._recordAllocations('N-Prune')
 
         if kwargs.get("checkIntegrity", False):
             self._checkTrackerIntegrity()
 
         # 7 -- Initiate new tracks
         self.tic['Init'] = time.time()
+        self._markAllocations()
         unusedRadarMeasurements = scanList.filterUnused(unusedRadarMeasurementIndices)
-        usedAisMmsi = [[a[1] for a in targetAssociations if a[0] == scanNumber and a[1]>=1e8]
-                       for targetAssociations in self.__associatedMeasurements__]
-        usedAisMmsi = [item for sublist in usedAisMmsi for item in sublist]
-        unusedAisMeasurements = aisList.filterUnused(set(usedAisMmsi))
+        usedAisMmsi = set()
+        for targetAssociations in self.__targets__.associations[self.__targets__.slots]:
+            usedAisMmsi.update(measurementKeys.scanRange(
+                targetAssociations.keys, scanNumber, measurementKeys.AIS).tolist())
+        unusedAisMeasurements = aisList.filterUnused(usedAisMmsi)
         if not kwargs.get('aisInitialization', True):
-            unusedAisMeasurements = []
-        new_initial_targets = self.initiator.processMeasurements(unusedRadarMeasurements, unusedAisMeasurements)
-        for initial_target in new_initial_targets:
-            log.info("\tNew target({}): ".format(
-                len(self.__targetList__) + 1) + str(initial_target))
-            self.initiateTarget(initial_target)
+            unusedAisMeasurements = AisMessageList()
+        # The initiator skips at most one scan in a row, its tracks are predicted over the gap
+        if (self.deadline is not None and self.deadline.isBehind('Init') and
+                not self.__initiationDeferred__):
+            self.deadline.degrade('Init', 'deferInitiation')
+            self.__initiationDeferred__ = True
+            new_initial_targets = []
+        else:
+            self.__initiationDeferred__ = False
+            new_initial_targets = self.initiator.processMeasurements(unusedRadarMeasurements, unusedAisMeasurements)
+        if self.initiationRegion is not None:
+            xMin, xMax, yMin, yMax = self.initiationRegion
+            new_initial_targets = [t for t in new_initial_targets
+                                   if xMin <= t.x_0[0] < xMax and yMin <= t.x_0[1] < yMax]
+        for i, initial_target in enumerate(new_initial_targets):
+            log.info("\tNew target(%s): %s", len(self.__targets__) + i + 1, initial_target)
+        self.initiateTargets(new_initial_targets)
         self.toc['Init'] = time.time() - self.tic['Init']
+        self._recordAllocations('Init')
 
         # Logging critical time constraints
         self.toc['Total'] = time.time() - self.tic['Total']
         if self.toc['Total'] > self.radarPeriod:
-            log.critical("Did not pass real time demand! Used {0:.0f}ms of {1:.0f}ms".format(
-                self.toc['Total'] * 1000, self.radarPeriod * 1000))
-        elif self.toc['Total'] > self.radarPeriod * 0.6:
-            log.warning("Did almost not pass real time demand! Used {0:.0f}ms of {1:.0f}ms".format(
-                self.toc['Total'] * 1000, self.radarPeriod * 1000))
+            log.critical("Did not pass real time demand! Used %.0fms of %.0fms",
+                         self.toc['Total'] * 1000, self.radarPeriod * 1000)
+        elif self.toc['Total'] > self.radarPeriod * self.slowScanFraction:
+            log.warning("Did almost not pass real time demand! Used %.0fms of %.0fms",
+                        self.toc['Total'] * 1000, self.radarPeriod * 1000)
 
         if kwargs.get("checkIntegrity", False):
             self._checkTrackerIntegrity()
@@ -297,6 +564,15 @@ class Tracker():
         for k, v in self.runtimeLog.items():
             if k in self.toc:
                 v.append(self.toc[k])
+        degradations = self.deadline.getDegradations() if self.deadline is not None else []
+        self.runtimeLog['Degraded'].append(float(len(degradations)))
+        self.degradationLog.extend(degradations)
+        if self.memoryAccounting:
+            self._accountMemory()
+        if self.stageAllocations is not None:
+            for stage in memory.stages:
+                self.runtimeLog['Alloc-' + stage].append(
+                    self.stageAllocations.allocations.get(stage, 0) / memory.MB)
 
         if kwargs.get("printInfo", False):
             print("Added scan number:", len(self.__scanHistory__),
@@ -305,23 +581,27 @@ class Tracker():
         if kwargs.get("printTime", False):
             self.printTimeLog(**kwargs)
 
-        if nTargetNodes.size > 0:
+        if np.sum(nTargetNodes) > 0:
             avgTimePerNode = self.toc['Process'] * 1e6 / np.sum(nTargetNodes)
-            log.debug(
-                "Process time per (old) leaf node = {:.0f}us".format(avgTimePerNode))
-        log.info("addMeasurement completed \n" + self.getTimeLogString() + "\n")
+            log.debug("Process time per (old) leaf node = %.0fus", avgTimePerNode)
+        log.info("addMeasurement completed \n%s\n", trace.Lazy(self.getTimeLogString))
+
+        if self.__capture__ is not None:
+            self._finishCapture()
 
-    def _growTarget(self, targetIndex, nTargetNodes, scanList, aisList, measDim, unused_measurement_indices,
+    def _growTarget(self, slot, nTargetNodes, scanList, aisList, measDim, unused_measurement_indices,
                     scanTime, scanNumber, targetProcessTimes):
         tic = time.time()
-        target = self.__targetList__[targetIndex]
+        if self.deadline is not None and self.deadline.isBehind('Process'):
+            aisList = self._degradeTarget(slot, aisList)
+        target = self.__targets__.roots[slot]
         targetNodes = target.getLeafNodes()
         nNodes = len(targetNodes)
-        nTargetNodes[targetIndex] = nNodes
+        nTargetNodes[slot] = nNodes
         dummyNodesData, radarNodesData, fusedNodesData = self._processLeafNodes(targetNodes,
                                                                                 scanList,
                                                                                 aisList)
-        x_bar_list, P_bar_list = dummyNodesData
+        x_bar_list, P_bar_list, _, _ = dummyNodesData
         gated_x_hat_list, P_hat_list, gatedIndicesList, nllrList = radarNodesData
         (fused_x_hat_list,
          fused_P_hat_list,
@@ -337,7 +617,7 @@ class Tracker():
             unused_measurement_indices[gated_index] = False
 
         for i, node in enumerate(targetNodes):
-            node.spawnNewNodes(self.__associatedMeasurements__[targetIndex],
+            node.spawnNewNodes(self.__targets__.associations[slot],
                                scanTime,
                                scanNumber,
                                x_bar_list[i],
@@ -353,37 +633,91 @@ class Tracker():
                                 fused_nllr_list[i],
                                 fused_mmsi_list[i]))
 
-        targetProcessTimes[targetIndex] = time.time() - tic
+        targetProcessTimes[slot] = time.time() - tic
+
+    def _growTargetsGnn(self, nTargetNodes, scanList, unused_measurement_indices, scanNumber,
+                        targetProcessTimes):
+        """
+        Single hypothesis growing with global nearest neighbour association.
+        Each target is collapsed to its track node, and the track nodes of
+        all targets are gated against the radar measurements in one batch.
+        The measurements are assigned by NIS, and every track node gets one
+        child. AIS is not fused. A following full MHT scan grows the trees
+        from these nodes again.
+        """
+        tic = time.time()
+        targets = self.__targets__
+        slots = targets.slots
+        if len(slots) == 0:
+            return
+        for slot in slots:
+            if len(targets.roots[slot].getLeafNodes()) > 1:
+                self._pruneTargetIndex(slot, 0)
+        trackNodes = list(targets.trackNodes[slots])
+        dummyNodesData = self.__predictDummyMeasurements(trackNodes)
+        x_bar_list, P_bar_list, _, _ = dummyNodesData
+        (gatedIndicesList,
+         _,
+         gated_x_hat_list,
+         P_hat_list,
+         _,
+         gatedNis,
+         nllrList) = self.__processMeasurements(trackNodes, scanList, dummyNodesData, pv.C_RADAR, self.R_RADAR)
+        gatedNodes = np.repeat(np.arange(len(trackNodes)), [len(indices) for indices in gatedIndicesList])
+        deltaMatrix = np.full((len(trackNodes), len(scanList.measurements)), np.inf)
+        deltaMatrix[gatedNodes, np.concatenate(gatedIndicesList + [np.zeros(0, dtype=int)])] = gatedNis.ravel()
+        assignments = dict(m_of_n._solve_global_nearest_neighbour(deltaMatrix))
+
+        for i, (slot, node) in enumerate(zip(slots, trackNodes)):
+            if i in assignments:
+                k = int(np.flatnonzero(gatedIndicesList[i] == assignments[i])[0])
+                newNode = Target(scanList.time,
+                                 scanNumber,
+                                 gated_x_hat_list[i][k],
+                                 P_hat_list[i],
+                                 node.ID,
+                                 measurementNumber=assignments[i] + 1,
+                                 measurement=scanList.measurements[assignments[i]],
+                                 cumulativeNLLR=node.cumulativeNLLR + nllrList[i][k],
+                                 P_d=node.P_d,
+                                 parent=node)
+            else:
+                newNode = node.createZeroHypothesis(scanList.time, scanNumber, x_bar_list[i], P_bar_list[i])
+            node.trackHypotheses = [newNode]
+            targets.associations[slot].addNodes([newNode])
+            unused_measurement_indices[gatedIndicesList[i]] = False
+            nTargetNodes[slot] = 1
+        targetProcessTimes[slots] = (time.time() - tic) / len(slots)
+
+    def _degradeTarget(self, slot, aisList):
+        """
+        Cheaper growing of a target when the scan is behind. The tree is
+        pruned to at most maxLeaves leaf nodes, and targets that are not
+        identified by an MMSI are grown without AIS. Returns the AIS list to
+        grow the target with.
+        """
+        depth = 0
+        node = self.__targets__.trackNodes[slot]
+        while not node.isRoot:
+            node = node.parent
+            depth += 1
+        for N in range(depth - 1, -1, -1):
+            if len(self.__targets__.roots[slot].getLeafNodes()) <= self.maxLeaves:
+                break
+            self.deadline.degrade('Process', 'capLeaves')
+            self._pruneTargetIndex(slot, N)
+        if aisList and self.__targets__.trackNodes[slot].inheritedMmsi is None:
+            self.deadline.degrade('Process', 'skipAis')
+            return None
+        return aisList
 
     def _terminateTracks(self, deadTracks):
-        deadTracks.sort(reverse=True)
-        for trackIndex in deadTracks:
-            nTargetPre = len(self.__targetList__)
-            nTracksPre = self.__trackNodes__.shape[0]
-            nAssociationsPre = len(self.__associatedMeasurements__)
-            targetListTypePre = type(self.__targetList__)
-            trackListTypePre = type(self.__trackNodes__)
-            associationTypePre = type(self.__associatedMeasurements__)
-            self.__terminatedTargets__.append(
-                copy.deepcopy(self.__trackNodes__[trackIndex]))
-            del self.__targetList__[trackIndex]
-            del self.__targetWindowSize__[trackIndex]
-            self.__trackNodes__ = np.delete(self.__trackNodes__, trackIndex)
-            del self.__associatedMeasurements__[trackIndex]
+        nTargetsPre = len(self.__targets__)
+        for slot in sorted(deadTracks, reverse=True):
+            _, trackNode, _, _ = self.__targets__.remove(slot)
+            self.__terminatedTargets__.append(copy.deepcopy(trackNode))
             self.__terminatedTargets__[-1]._pruneEverythingExceptHistory()
-            nTargetsPost = len(self.__targetList__)
-            nTracksPost = self.__trackNodes__.shape[0]
-            nAssociationsPost = len(self.__associatedMeasurements__)
-            targetListTypePost = type(self.__targetList__)
-            trackListTypePost = type(self.__trackNodes__)
-            associationTypePost = type(self.__associatedMeasurements__)
-            assert nTargetsPost == nTargetPre - 1
-            assert nTracksPost == nTracksPre - \
-                1, str(nTracksPre) + '=>' + str(nTracksPost)
-            assert nAssociationsPost == nAssociationsPre - 1
-            assert targetListTypePost == targetListTypePre
-            assert trackListTypePost == trackListTypePre
-            assert associationTypePost == associationTypePre
+        assert len(self.__targets__) == nTargetsPre - len(deadTracks)
 
     def _processLeafNodes(self, targetNodes, scanList, aisList):
         dummyNodesData = self.__predictDummyMeasurements(targetNodes)
@@ -429,9 +763,8 @@ class Tracker():
                     [np.array([]) for _ in range(nNodes)],
                     [np.array([]) for _ in range(nNodes)])
 
-        aisMeasurements = aisList
+        aisColumns = aisList.getColumns()
         radarMeasurements = scanList.measurements
-        aisTimeSet = {m.time for m in aisMeasurements}
         scanTime = scanList.time
 
         fused_x_hat_list = []
@@ -440,7 +773,7 @@ class Tracker():
         fused_nllr_list = []
         fused_mmsi_list = []
 
-        lambda_ais = (len(self.__targetList__) * self.P_ais) / (np.pi * self.radarRange ** 2)
+        lambda_ais = (len(self.__targets__) * self.P_ais) / (np.pi * self.radarRange ** 2)
         # print("lambda_ais {:.2e}".format(lambda_ais))
 
         for i, node in enumerate(targetNodes):
@@ -450,82 +783,72 @@ class Tracker():
             radar_indices_list = []
             nllr_list = []
             mmsi_list = []
-            for aisTime in aisTimeSet:
-                # print("aisTime", aisTime)
-                dT1 = float(aisTime) - node.time
-                x_bar1, P_bar1 = kalman.predict_single(pv.Phi(dT1), pv.Q(dT1), node.x_0, node.P_0)
-                # print("x_bar_1", x_bar1)
-                # print("P_bar1\n", P_bar1)
-                for highAccuracy in [True, False]:
-                    # print("highAccuracy",highAccuracy)
-                    z_hat_list1, S_list1, S_inv_list1, K_list1, P_hat_list1 = kalman.precalc(
-                        ais_model.C,
-                        ais_model.R(highAccuracy),
-                        np.array(x_bar1, ndmin=2),
-                        np.array(P_bar1, ndmin=3))
-                    activeAisMeasurements = [m for m in aisMeasurements if
-                                             m.time == aisTime and m.highAccuracy == highAccuracy]
-                    if len(activeAisMeasurements) == 0: continue
-                    # print("activeAisMeasurements",activeAisMeasurements)
-                    # activeAisMeasurementsIndices = np.array([aisMeasurements.index(m) for m in activeAisMeasurements])
-                    # print("activeAisMeasurementsIndices",activeAisMeasurementsIndices)
-                    z_array1 = np.array([m.state for m in activeAisMeasurements], ndmin=2)
-                    z_tilde_array1 = z_array1 - z_hat_list1[0]
-                    nis_array1 = (kalman.normalizedInnovationSquared(z_tilde_array1, S_inv_list1))[0]
-                    # print("nis_array1",nis_array1)
-                    gated_nis_array1 = nis_array1 <= self.eta2_ais
-                    # print("gated nis array1", nis_array1[gated_nis_array1])
-                    gated_ais_indices = np.flatnonzero(gated_nis_array1)
-                    if len(gated_ais_indices) == 0: continue
-                    # print("gated S array1\n", S_list1)
-                    # print("gated_ais_indices",gated_ais_indices)
-                    nllr1_list = kalman.nllr(lambda_ais, 1.0, S_list1, nis_array1[gated_ais_indices])
-                    # print("nllr1", np.array_str(nllr1_list, precision=2))
-                    for i, ais_index in enumerate(gated_ais_indices):
-                        # print("ais_index",ais_index)
-                        ais_measurement = activeAisMeasurements[ais_index]
-                        x_hat1 = x_bar1 + K_list1[0].dot(ais_measurement.state - z_hat_list1[0])
-                        P_hat1 = P_hat_list1[0]
-                        dT2 = scanTime - float(ais_measurement.time)
-                        x_bar2, P_bar2 = kalman.predict_single(pv.Phi(dT2), pv.Q(dT2), x_hat1, P_hat1)
-                        z_hat_list2, S_list2, S_inv_list2, K_list2, P_hat_list2 = kalman.precalc(
-                            pv.C_RADAR,
-                            pv.R_RADAR(),
-                            np.array(x_bar2, ndmin=2),
-                            np.array(P_bar2, ndmin=3))
-                        z_tilde_array2 = radarMeasurements - z_hat_list2[0]
-                        nis_array2 = (kalman.normalizedInnovationSquared(z_tilde_array2, S_inv_list2))[0]
-                        gated_nis_array2 = nis_array2 <= self.eta2
-                        gated_radar_indices = np.flatnonzero(gated_nis_array2)
-                        nllr2_list = kalman.nllr(self.lambda_ex, node.P_d, S_list2, nis_array2[gated_radar_indices])
-                        # print("nllr2_list",np.array_str(nllr2_list, precision=2))
-                        for j, radar_index in enumerate(gated_radar_indices):
-                            x_hat2 = x_bar2 + K_list2[0].dot(radarMeasurements[radar_index] - z_hat_list2[0])
-                            P_hat2 = P_hat_list2[0]
-                            nllr12 = 0.5 * nllr1_list[i] + 0.5 * nllr2_list[j]
-                            log.debug("Fused node " +
-                                      np.array_str(x_hat2, precision=1) + " " +
-                                      '{: .2f} '.format(nllr12) +
-                                      str(ais_measurement.mmsi))
-
-                            x_hat_list.append(x_hat2)
-                            P_hat_list.append(P_hat2)
-                            radar_indices_list.append(radar_index)
-                            nllr_list.append(nllr12)
-                            mmsi_list.append(ais_measurement.mmsi)
-                        if len(gated_radar_indices) == 0:
-                            x_hat2 = x_bar2
-                            P_hat2 = P_hat_list2[0]
-                            nllr12 = nllr1_list[i]
-                            log.debug("Pure AIS node " +
-                                      np.array_str(x_hat2, precision=1) + " " +
-                                      '{: .2f} '.format(nllr12) +
-                                      'MMSI: {:}'.format(ais_measurement.mmsi))
-                            x_hat_list.append(x_hat2)
-                            P_hat_list.append(P_hat2)
-                            radar_indices_list.append(None)
-                            nllr_list.append(nllr12)
-                            mmsi_list.append(ais_measurement.mmsi)
+            predictedTime = None
+            for aisTime, highAccuracy, aisRows in aisColumns.groups:
+                if aisTime != predictedTime:
+                    dT1 = aisTime - node.time
+                    x_bar1, P_bar1 = kalman.predict_single(pv.Phi(dT1), pv.Q(dT1), node.x_0, node.P_0)
+                    predictedTime = aisTime
+                z_hat_list1, S_list1, S_inv_list1, K_list1, P_hat_list1 = kalman.precalc(
+                    ais_model.C,
+                    ais_model.R(highAccuracy),
+                    np.array(x_bar1, ndmin=2),
+                    np.array(P_bar1, ndmin=3))
+                z_array1 = aisColumns.state[aisRows]
+                z_tilde_array1 = z_array1 - z_hat_list1[0]
+                nis_array1 = (kalman.normalizedInnovationSquared(z_tilde_array1, S_inv_list1))[0]
+                # print("nis_array1",nis_array1)
+                gated_nis_array1 = nis_array1 <= self.eta2_ais
+                # print("gated nis array1", nis_array1[gated_nis_array1])
+                gated_ais_indices = np.flatnonzero(gated_nis_array1)
+                if len(gated_ais_indices) == 0: continue
+                # print("gated S array1\n", S_list1)
+                # print("gated_ais_indices",gated_ais_indices)
+                nllr1_list = kalman.nllr(lambda_ais, 1.0, S_list1, nis_array1[gated_ais_indices])
+                # print("nllr1", np.array_str(nllr1_list, precision=2))
+                for i, ais_index in enumerate(gated_ais_indices):
+                    aisRow = aisRows[ais_index]
+                    mmsi = int(aisColumns.mmsi[aisRow]) if aisColumns.mmsi[aisRow] != -1 else None
+                    x_hat1 = x_bar1 + K_list1[0].dot(aisColumns.state[aisRow] - z_hat_list1[0])
+                    P_hat1 = P_hat_list1[0]
+                    dT2 = scanTime - aisTime
+                    x_bar2, P_bar2 = kalman.predict_single(pv.Phi(dT2), pv.Q(dT2), x_hat1, P_hat1)
+                    z_hat_list2, S_list2, S_inv_list2, K_list2, P_hat_list2 = kalman.precalc(
+                        pv.C_RADAR,
+                        pv.R_RADAR(),
+                        np.array(x_bar2, ndmin=2),
+                        np.array(P_bar2, ndmin=3))
+                    z_tilde_array2 = radarMeasurements - z_hat_list2[0]
+                    nis_array2 = (kalman.normalizedInnovationSquared(z_tilde_array2, S_inv_list2))[0]
+                    gated_nis_array2 = nis_array2 <= self.eta2
+                    gated_radar_indices = np.flatnonzero(gated_nis_array2)
+                    nllr2_list = kalman.nllr(self.lambda_ex, node.P_d, S_list2, nis_array2[gated_radar_indices])
+                    # print("nllr2_list",np.array_str(nllr2_list, precision=2))
+                    for j, radar_index in enumerate(gated_radar_indices):
+                        x_hat2 = x_bar2 + K_list2[0].dot(radarMeasurements[radar_index] - z_hat_list2[0])
+                        P_hat2 = P_hat_list2[0]
+                        nllr12 = 0.5 * nllr1_list[i] + 0.5 * nllr2_list[j]
+                        log.debug("Fused node %s % .2f %s",
+                                  trace.Lazy(np.array_str, x_hat2, precision=1),
+                                  nllr12, mmsi)
+
+                        x_hat_list.append(x_hat2)
+                        P_hat_list.append(P_hat2)
+                        radar_indices_list.append(radar_index)
+                        nllr_list.append(nllr12)
+                        mmsi_list.append(mmsi)
+                    if len(gated_radar_indices) == 0:
+                        x_hat2 = x_bar2
+                        P_hat2 = P_hat_list2[0]
+                        nllr12 = nllr1_list[i]
+                        log.debug("Pure AIS node %s % .2f MMSI: %s",
+                                  trace.Lazy(np.array_str, x_hat2, precision=1),
+                                  nllr12, mmsi)
+                        x_hat_list.append(x_hat2)
+                        P_hat_list.append(P_hat2)
+                        radar_indices_list.append(None)
+                        nllr_list.append(nllr12)
+                        mmsi_list.append(mmsi)
 
             fused_x_hat_list.append(np.array(x_hat_list, ndmin=2))
             fused_P_hat_list.append(np.array(P_hat_list, ndmin=3))
@@ -589,7 +912,7 @@ class Tracker():
 
         print("fused_x_hat_list",fused_x_hat_list)
 
-        lambda_ais = (len(self.__targetList__) * self.P_ais) / (np.pi * self.radarRange**2)
+        lambda_ais = (len(self.__targets__) * self.P_ais) / (np.pi * self.radarRange**2)
         # print("lambda_ais {:.2e}".format(lambda_ais))
 
         for aisTime in aisTimeSet:
@@ -811,47 +1134,45 @@ class Tracker():
         nNodes = len(targetNodes)
         nMeas = len(measurementList.measurements)
         meas_dim = C.shape[0]
-        x_bar_list, P_bar_list = dummyNodesData
+        x_bar_list, _, groupIndices, _ = dummyNodesData
 
         nodesPredictionData = self.__predictPrecalcBulk(targetNodes, C, R, dummyNodesData)
 
         (z_hat_list,
          S_list,
-         S_inv_list,
-         K_list,
-         P_hat_list) = nodesPredictionData
+         S_inv_unique,
+         K_unique,
+         P_hat_list,
+         det_S_unique) = nodesPredictionData
 
         z_list = measurementList.getMeasurements()
         assert z_list.shape[1] == meas_dim
 
-        z_tilde_list = kalman.z_tilde(z_list, z_hat_list, nNodes, meas_dim)
-        assert z_tilde_list.shape == (nNodes, nMeas, meas_dim)
-
-        nis = kalman.normalizedInnovationSquared(z_tilde_list, S_inv_list)
+        nis, gated_filter = kalman.gate(z_list, z_hat_list, S_inv_unique, groupIndices, self.eta2)
         assert nis.shape == (nNodes, nMeas,)
-
-        gated_filter = nis <= self.eta2
         assert gated_filter.shape == (nNodes, nMeas)
 
-        gated_indices_list = [np.nonzero(gated_filter[row])[0]
-                              for row in range(nNodes)]
+        # Gated (node, measurement) pairs, ordered by node and then measurement
+        gatedNodes, gatedMeasurements = np.nonzero(gated_filter)
+        P_d_list = np.array([node.P_d for node in targetNodes], dtype=np.float64)
+        gated_z_tilde, gated_x_hat, gated_nllr = kalman.filterGated(x_bar_list,
+                                                                    z_hat_list,
+                                                                    z_list,
+                                                                    K_unique,
+                                                                    groupIndices,
+                                                                    det_S_unique,
+                                                                    P_d_list,
+                                                                    self.lambda_ex,
+                                                                    nis,
+                                                                    gatedNodes,
+                                                                    gatedMeasurements)
+        splitIndices = np.cumsum(np.count_nonzero(gated_filter, axis=1))[:-1]
+        gated_indices_list = np.split(gatedMeasurements, splitIndices)
+        gated_z_tilde_list = np.split(gated_z_tilde, splitIndices)
+        gated_x_hat_list = np.split(gated_x_hat, splitIndices)
+        nllr_list = np.split(gated_nllr, splitIndices)
         assert len(gated_indices_list) == nNodes
-
-        gated_z_tilde_list = [z_tilde_list[i, gated_indices_list[i]]
-                              for i in range(nNodes)]
-        assert len(gated_z_tilde_list) == nNodes
-        assert all([z_tilde.shape[1] == meas_dim for z_tilde in gated_z_tilde_list])
-
-        gated_x_hat_list = [kalman.numpyFilter(
-            x_bar_list[i], K_list[i], gated_z_tilde_list[i])
-            for i in range(nNodes)]
         assert len(gated_x_hat_list) == nNodes
-
-        nllr_list = [kalman.nllr(self.lambda_ex,
-                                 targetNodes[i].P_d,
-                                 S_list[i],
-                                 nis[i, gated_filter[i]])
-                     for i in range(nNodes)]
         assert len(nllr_list) == nNodes
 
         return (gated_indices_list,
@@ -862,96 +1183,116 @@ class Tracker():
                 np.array(nis[gated_filter], ndmin=2),
                 nllr_list)
 
+    @staticmethod
+    def _groupCovariances(targetNodes):
+        # Siblings spawned from the same parent share their covariance object,
+        # and so do their descendants as long as the shared objects are passed on.
+        groupIndices = np.empty(len(targetNodes), dtype=int)
+        groups = {}
+        covariances = []
+        for i, node in enumerate(targetNodes):
+            groupIndex = groups.get(id(node.P_0))
+            if groupIndex is None:
+                groupIndex = groups[id(node.P_0)] = len(covariances)
+                covariances.append(node.P_0)
+            groupIndices[i] = groupIndex
+        return groupIndices, np.array(covariances, ndmin=3)
+
     def __predictDummyMeasurements(self, targetNodes):
         nNodes = len(targetNodes)
         radarMeasDim, nStates = pv.C_RADAR.shape
         x_0_list = np.array([target.x_0 for target in targetNodes],
                             ndmin=2)
-        P_0_list = np.array([target.P_0 for target in targetNodes],
-                            ndmin=3)
+        groupIndices, P_0_unique = self._groupCovariances(targetNodes)
         assert x_0_list.shape == (nNodes, nStates)
-        assert P_0_list.shape == (nNodes, nStates, nStates)
+        assert P_0_unique.shape[1:] == (nStates, nStates)
 
-        x_bar_list, P_bar_list = kalman.predict(
-            self.A, self.Q, x_0_list, P_0_list)
-        return x_bar_list, P_bar_list
+        x_bar_list, P_bar_unique = kalman.predict(
+            self.A, self.Q, x_0_list, P_0_unique)
+        P_bar_views = list(P_bar_unique)
+        P_bar_list = [P_bar_views[groupIndex] for groupIndex in groupIndices]
+        return x_bar_list, P_bar_list, groupIndices, P_bar_unique
 
     def __predictPrecalcBulk(self, targetNodes, C, R, dummyNodesData):
         nNodes = len(targetNodes)
         measDim, nStates = C.shape
-        x_bar_list, P_bar_list = dummyNodesData
+        x_bar_list, _, groupIndices, P_bar_unique = dummyNodesData
 
-        z_hat_list, S_list, S_inv_list, K_list, P_hat_list = kalman.precalc(
-            C, R, x_bar_list, P_bar_list)
+        z_hat_list = C.dot(x_bar_list.T).T
+        S_unique, S_inv_unique, K_unique, P_hat_unique = kalman.precalcCovariance(
+            C, R, P_bar_unique)
+        det_S_unique = np.linalg.det(2 * np.pi * S_unique)
+        S_list = S_unique[groupIndices]
+        P_hat_views = list(P_hat_unique)
+        P_hat_list = [P_hat_views[groupIndex] for groupIndex in groupIndices]
 
         assert S_list.shape == (nNodes, measDim, measDim)
-        assert S_inv_list.shape == (nNodes, measDim, measDim)
-        assert K_list.shape == (nNodes, nStates, measDim)
-        assert P_hat_list.shape == P_bar_list.shape
+        assert S_inv_unique.shape == S_unique.shape
+        assert K_unique.shape == (S_unique.shape[0], nStates, measDim)
+        assert P_hat_unique.shape == P_bar_unique.shape
         assert z_hat_list.shape == (nNodes, measDim)
 
-        return z_hat_list, S_list, S_inv_list, K_list, P_hat_list
+        return z_hat_list, S_list, S_inv_unique, K_unique, P_hat_list, det_S_unique
 
     def __analyzeTrackTermination(self):
         deadTracks = []
-        for trackIndex, trackNode in enumerate(self.__trackNodes__):
+        for trackIndex in self.__targets__.slots:
+            trackNode = self.__targets__.trackNodes[trackIndex]
             # Check outside radarRange
             if trackNode.isOutsideRange(self.position, self.radarRange):
                 trackNode.status = outofrangeTag
                 deadTracks.append(trackIndex)
-                log.info("Terminating track {0:} at {1:} since it is out of radarRange".format(
-                    trackIndex, np.array_str(self.__trackNodes__[trackIndex].x_0[0:2])))
+                log.info("Terminating track %s at %s since it is out of radarRange",
+                         trackIndex, trackNode.x_0[0:2])
 
             # Check if track is to insecure
             elif trackNode.getScore() / (self.N+1) > self.scoreUpperLimit:
                 trackNode.status = toolowscoreTag
                 deadTracks.append(trackIndex)
-                log.info("Terminating track {0:} at {1:} since its score is above the threshold ({2:.1f}>{3:.1f})".format(
-                    trackIndex, np.array_str(self.__trackNodes__[trackIndex].x_0[0:2]),
-                    trackNode.getScore() / (self.N+1), self.scoreUpperLimit))
+                log.info("Terminating track %s at %s since its score is above the threshold (%.1f>%.1f)",
+                         trackIndex, trackNode.x_0[0:2],
+                         trackNode.getScore() / (self.N+1), self.scoreUpperLimit)
             elif trackNode.cumulativeNLLR > self.clnnrUpperLimit:
                 trackNode.status = toolowscoreTag
                 deadTracks.append(trackIndex)
-                log.info(
-                    "Terminating track {0:} at {1:} since its CNNLR is above the threshold ({2:.1f}>{3:.1f})".format(
-                        trackIndex, np.array_str(
-                            self.__trackNodes__[trackIndex].x_0[0:2]),
-                        trackNode.cumulativeNLLR, self.clnnrUpperLimit))
+                log.info("Terminating track %s at %s since its CNNLR is above the threshold (%.1f>%.1f)",
+                         trackIndex, trackNode.x_0[0:2],
+                         trackNode.cumulativeNLLR, self.clnnrUpperLimit)
         return deadTracks
 
     def __dynamicWindow(self, targetProcessTimes):
         totalGrowTime = sum(targetProcessTimes)
         tooSlowTotal = totalGrowTime > self.totalGrowTimeLimit
-        targetProcessTimeLimit = (self.totalGrowTimeLimit / len(self.__targetList__)
+        windowSizes = self.__targets__.windowSizes
+        targetProcessTimeLimit = (self.totalGrowTimeLimit / len(self.__targets__)
                                   if tooSlowTotal else self.nodeGrowTimeLimit)
-        for targetIndex, target in enumerate(self.__targetList__):
+        for targetIndex in self.__targets__.slots:
+            target = self.__targets__.roots[targetIndex]
             targetProcessTime = targetProcessTimes[targetIndex]
             targetSize = target.getNumOfNodes()
             tooSlow = targetProcessTime > targetProcessTimeLimit
             tooLarge = targetSize > self.targetSizeLimit
             if tooSlow or tooLarge:
-                target = self.__targetList__[targetIndex]
                 targetDepth = target.depth()
-                assert targetDepth <= self.__targetWindowSize__[targetIndex] + 1
-                infoString = "\tTarget {:2} ".format(targetIndex + 1)
-                if tooSlow:
-                    infoString += "Too slow {:.1f}ms. ".format(targetProcessTime * 1000)
-                if tooLarge:
-                    infoString += "To large {:}. ".format(targetSize)
-                oldN = self.__targetWindowSize__[targetIndex]
-                self.__targetWindowSize__[targetIndex] -= 1
-                newN = self.__targetWindowSize__[targetIndex]
-                infoString += "Reducing window from {0:} to {1:}".format(oldN, newN)
-                log.debug(infoString)
+                assert targetDepth <= windowSizes[targetIndex] + 1
+                oldN = windowSizes[targetIndex]
+                windowSizes[targetIndex] -= 1
+                newN = windowSizes[targetIndex]
+                if log.isEnabledFor(logging.DEBUG):
+                    infoString = "\tTarget {:2} ".format(targetIndex + 1)
+                    if tooSlow:
+                        infoString += "Too slow {:.1f}ms. ".format(targetProcessTime * 1000)
+                    if tooLarge:
+                        infoString += "To large {:}. ".format(targetSize)
+                    infoString += "Reducing window from {0:} to {1:}".format(oldN, newN)
+                    log.debug(infoString)
 
         tempTotalTime = time.time() - self.tic['Total']
         if tempTotalTime > (self.radarPeriod * 0.8):
             self.N = max(1, self.N - 1)
-            log.warning(
-                'Iteration took to long time ({0:.1f}ms), reducing window size roof from {1:} to  {2:}'.format(
-                    tempTotalTime * 1000, self.N + 1, self.N))
-            self.__targetWindowSize__ = [min(e, self.N)
-                                         for e in self.__targetWindowSize__]
+            log.warning('Iteration took to long time (%.1fms), reducing window size roof from %s to  %s',
+                        tempTotalTime * 1000, self.N + 1, self.N)
+            np.minimum(windowSizes, self.N, out=windowSizes)
 
     def _compareTracksWithTruth(self, xTrue):
         return [(target.filteredStateMean - xTrue[targetIndex].state).T.dot(
@@ -959,62 +1300,148 @@ class Tracker():
             (target.filteredStateMean - xTrue[targetIndex].state))
             for targetIndex, target in enumerate(self.__trackNodes__)]
 
+    def _beginCapture(self, scanList, aisList, **kwargs):
+        """
+        Starts profiling a full scan when profileDirectory is set. The inputs
+        are kept, and with profileState the state before the scan.
+        """
+        if self.__profiler__ is None:
+            return
+        state = snapshot.SnapshotWriter().write(self) if self.profileState else None
+        self.__capture__ = (scanList, aisList, kwargs, state)
+        self.__profiler__.start()
+
+    def _finishCapture(self):
+        scanList, aisList, kwargs, state = self.__capture__
+        self.__capture__ = None
+        self.__profiler__.stop()
+        if self.toc['Total'] <= self.radarPeriod * self.slowScanFraction:
+            return
+        os.makedirs(self.profileDirectory, exist_ok=True)
+        path = profiler.writeCapture(self.profileDirectory, len(self.__scanHistory__), self.__profiler__,
+                                     scanList, aisList,
+                                     {'radarPeriod': self.radarPeriod, 'timings': dict(self.toc), 'kwargs': kwargs},
+                                     state)
+        profiler.rotate(self.profileDirectory, self.profileKeep)
+        log.warning("Scan %s took %.0fms, profile and input written to %s",
+                    len(self.__scanHistory__), self.toc['Total'] * 1000, path)
+
+    def _markAllocations(self):
+        if self.stageAllocations is not None:
+            self.stageAllocations.mark()
+
+    def _recordAllocations(self, stage):
+        if self.stageAllocations is not None:
+            self.stageAllocations.record(stage)
+
+    def _accountMemory(self):
+        usage, targetUsage = memory.trackerUsage(self, self.historyUsage)
+        for name, size in usage.items():
+            self.runtimeLog['Mem-' + name].append(size / memory.MB)
+        memory.checkLimits(usage, targetUsage, self.memoryLimits)
+
+    def getMemorySnapshot(self, nTopAllocations=10):
+        """
+        Estimated bytes held by each structure and by the tree of each target
+        (by track ID). With traceAllocations also the bytes allocated by each
+        stage of the last scan and the source lines holding the most memory.
+        The history is measured in full, a sector scan may be in progress.
+        """
+        usage, targetUsage = memory.trackerUsage(self)
+        memorySnapshot = {'structures': usage, 'targets': targetUsage}
+        if self.stageAllocations is not None:
+            memorySnapshot['allocations'] = dict(self.stageAllocations.allocations)
+            memorySnapshot['topAllocations'] = self.stageAllocations.topAllocations(nTopAllocations)
+        return memorySnapshot
+
     def getRuntimeAverage(self):
         return {k: np.mean(np.array(v)) for k, v in self.runtimeLog.items()}
 
     def _findClustersFromSets(self):
-        self.superSet = set()
-        for targetSet in self.__associatedMeasurements__:
-            self.superSet |= targetSet
-        nTargets = len(self.__associatedMeasurements__)
-        nNodes = nTargets + len(self.superSet)
-        adjacencyMatrix = np.zeros((nNodes, nNodes), dtype=bool)
-        for targetIndex, targetSet in enumerate(self.__associatedMeasurements__):
-            for measurementIndex, measurement in enumerate(self.superSet):
-                adjacencyMatrix[targetIndex, measurementIndex +
-                                nTargets] = (measurement in targetSet)
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        slots = self.__targets__.slots
+        keyArrays = [targetSet.keys for targetSet in self.__targets__.associations[slots]]
+        nTargets = len(keyArrays)
+        targetIndices = np.repeat(np.arange(nTargets), [len(keys) for keys in keyArrays])
+        allKeys = np.concatenate(keyArrays + [measurementKeys.empty])
+        uniqueKeys, measurementIndices = np.unique(allKeys, return_inverse=True)
+        nNodes = nTargets + len(uniqueKeys)
+        adjacencyMatrix = coo_matrix((np.ones(len(allKeys), dtype=bool),
+                                      (targetIndices, measurementIndices + nTargets)),
+                                     shape=(nNodes, nNodes))
         (nClusters, labels) = connected_components(adjacencyMatrix)
-        return [np.where(labels[:nTargets] == clusterIndex)[0]
+        return [slots[labels[:nTargets] == clusterIndex]
                 for clusterIndex in range(nClusters)]
 
     def getTrackNodes(self):
         return self.__trackNodes__
 
+    # Dense views of the target registry in slot order. The position of a
+    # target in these is the track index used by getTrackNodes and
+    # releaseTargets; it changes when a target before it is removed.
+    @property
+    def __targetList__(self):
+        return list(self.__targets__.roots[self.__targets__.slots])
+
+    @property
+    def __trackNodes__(self):
+        return self.__targets__.trackNodes[self.__targets__.slots]
+
+    @property
+    def __targetWindowSize__(self):
+        return self.__targets__.windowSizes[self.__targets__.slots].tolist()
+
+    @property
+    def __associatedMeasurements__(self):
+        return list(self.__targets__.associations[self.__targets__.slots])
+
+    def snapshot(self, delta=False):
+        """
+        Returns the tracker state as bytes, see pymht.utils.snapshot. A delta
+        snapshot only holds what has changed since the previous snapshot.
+        """
+        assert self.__sectorScan__ is None, "Finish the sector scan before taking a snapshot"
+        if self.__snapshotWriter__ is None:
+            self.__snapshotWriter__ = snapshot.SnapshotWriter()
+        return self.__snapshotWriter__.write(self, delta)
+
+    def restore(self, snapshots):
+        """
+        Restores the state from a full snapshot, optionally followed by the
+        delta snapshots taken after it.
+        """
+        reader = snapshot.SnapshotReader()
+        for data in ([snapshots] if isinstance(snapshots, bytes) else snapshots):
+            reader.apply(data)
+        reader.restore(self)
+
     def _solveOptimumAssociation(self, cluster):
-        log.debug("Cluster {0:} Sum = {1:}".format(cluster, len(cluster)))
+        log.debug("Cluster %s Sum = %s", cluster, len(cluster))
         nHypInClusterArray = self._getHypInCluster(cluster)
-        log.debug("nHypInClusterArray {0:} => Sum = {1:}".format(
-            nHypInClusterArray, sum(nHypInClusterArray)))
+        log.debug("nHypInClusterArray %s => Sum = %s", nHypInClusterArray, sum(nHypInClusterArray))
 
         for i in cluster:
-            log.debug("AssociatedMeasurements[{0:}] {1:}".format(
-                i, self.__associatedMeasurements__[i]))
-        uniqueMeasurementSet = set.union(
-            *[self.__associatedMeasurements__[i] for i in cluster])
-        nRealMeasurementsInCluster = len(uniqueMeasurementSet)
-        log.debug("Cluster Measurement set: {0:} Sum={1:}".format(
-            uniqueMeasurementSet, nRealMeasurementsInCluster))
-
-        (A1, measurementList) = self._createA1(
-            nRealMeasurementsInCluster, sum(nHypInClusterArray), cluster)
-        log.debug("Difference: {:}".format(
-            uniqueMeasurementSet.symmetric_difference(set(measurementList))))
-
-        assert len(measurementList) == A1.shape[0], str(
-            len(measurementList)) + " vs " + str(A1.shape[0])
-
-        assert len(measurementList) == nRealMeasurementsInCluster
+            log.debug("AssociatedMeasurements[%s] %s", i, self.__targets__.associations[i])
+        uniqueMeasurementKeys = np.unique(np.concatenate(
+            [self.__targets__.associations[i].keys for i in cluster]))
+        nRealMeasurementsInCluster = len(uniqueMeasurementKeys)
+        log.debug("Cluster Measurement set: %s Sum=%s",
+                  trace.Lazy(measurementKeys.toTuples, uniqueMeasurementKeys), nRealMeasurementsInCluster)
+
+        A1 = self._createA1(uniqueMeasurementKeys, sum(nHypInClusterArray), cluster)
+        assert A1.shape[0] == nRealMeasurementsInCluster
         A2 = self._createA2(len(cluster), nHypInClusterArray)
-        log.debug("A2 \n" + np.array_str(A2.astype(np.int), max_line_width=200))
         C = self._createC(cluster)
-        log.debug("C =" + np.array_str(np.array(C), precision=1))
+        if trace.sink is not None:
+            trace.emit('A1', A1, cluster=cluster, measurements=uniqueMeasurementKeys)
+            trace.emit('A2', A2, cluster=cluster)
+            trace.emit('C', C, cluster=cluster)
 
-        log.debug("Solving optimal association in cluster with targets" +
-                  str(cluster) + ",   \t" +
-                  str(sum(nHypInClusterArray)) + " hypotheses and " +
-                  str(nRealMeasurementsInCluster) + " real measurements.")
+        log.debug("Solving optimal association in cluster with targets %s,   \t%s hypotheses and %s real measurements.",
+                  cluster, sum(nHypInClusterArray), nRealMeasurementsInCluster)
         selectedHypotheses = self._solveBLP_OR_TOOLS(A1, A2, C)
-        log.debug("selectedHypotheses" + str(selectedHypotheses))
+        log.debug("selectedHypotheses %s", selectedHypotheses)
         selectedNodes = self._hypotheses2Nodes(selectedHypotheses, cluster)
         selectedNodesArray = np.array(selectedNodes)
 
@@ -1030,6 +1457,32 @@ class Tracker():
             "found same node in more than one track in selectedNodesArray"
         return selectedNodesArray
 
+    def _solveGreedyAssociation(self, cluster):
+        """
+        Cheap replacement for _solveOptimumAssociation. Hypotheses are taken
+        in order of increasing score if their target has none yet and they do
+        not share a measurement with the hypotheses taken so far. A target
+        whose hypotheses all conflict gets its best one.
+        """
+        nHypInClusterArray = self._getHypInCluster(cluster)
+        uniqueMeasurementKeys = np.unique(np.concatenate(
+            [self.__targets__.associations[i].keys for i in cluster]))
+        A1 = self._createA1(uniqueMeasurementKeys, sum(nHypInClusterArray), cluster)
+        C = np.array(self._createC(cluster))
+        targetOfHypothesis = np.repeat(np.arange(len(cluster)), nHypInClusterArray)
+        usedMeasurements = np.zeros(A1.shape[0], dtype=bool)
+        selected = np.full(len(cluster), -1, dtype=int)
+        for hypothesis in np.argsort(C, kind='stable'):
+            target = targetOfHypothesis[hypothesis]
+            if selected[target] == -1 and not np.any(A1[:, hypothesis] & usedMeasurements):
+                selected[target] = hypothesis
+                usedMeasurements |= A1[:, hypothesis]
+        for target in np.flatnonzero(selected == -1):
+            hypotheses = np.flatnonzero(targetOfHypothesis == target)
+            selected[target] = hypotheses[np.argmin(C[hypotheses])]
+            log.debug("Greedy association gave target %s a conflicting hypothesis", cluster[target])
+        return np.array(self._hypotheses2Nodes(selected.tolist(), cluster))
+
     def _getHypInCluster(self, cluster):
         def nLeafNodes(target):
             if target.trackHypotheses is None:
@@ -1039,82 +1492,35 @@ class Tracker():
 
         nHypInClusterArray = np.zeros(len(cluster), dtype=int)
         for i, targetIndex in enumerate(cluster):
-            nHypInTarget = nLeafNodes(self.__targetList__[targetIndex])
+            nHypInTarget = nLeafNodes(self.__targets__.roots[targetIndex])
             nHypInClusterArray[i] = nHypInTarget
         return nHypInClusterArray
 
-    def _createA1(self, nRow, nCol, cluster):
-        def recActiveMeasurement(target, A1, measurementList,
-                                 activeMeasurements, hypothesisIndex):
+    def _createA1(self, uniqueMeasurementKeys, nCol, cluster):
+        """
+        A1[i, j] is True if leaf node j of the cluster uses measurement
+        uniqueMeasurementKeys[i], the sorted keys of the cluster.
+        """
+        def recActiveMeasurement(target, activeMeasurementKeys):
             if target.trackHypotheses is None:  # leaf node
-
-                if ((target.measurementNumber is not None) and
-                        (target.measurementNumber != 0)):  # we are at a real measurement
-                    radarMeasurement = (target.scanNumber, target.measurementNumber)
-                    try:
-                        radarMeasurementIndex = measurementList.index(radarMeasurement)
-                    except ValueError:
-                        measurementList.append(radarMeasurement)
-                        radarMeasurementIndex = len(measurementList) - 1
-                    activeMeasurements[radarMeasurementIndex] = True
-
-                if target.mmsi is not None:
-                    aisMeasurement = (target.scanNumber, target.mmsi)
-                    try:
-                        aisMeasurementIndex = measurementList.index(aisMeasurement)
-                    except ValueError:
-                        measurementList.append(aisMeasurement)
-                        aisMeasurementIndex = len(measurementList) - 1
-                    activeMeasurements[aisMeasurementIndex] = True
-
-                A1[activeMeasurements, hypothesisIndex[0]] = True
+                keys.extend(activeMeasurementKeys)
+                hypothesisIndices.extend([hypothesisIndex[0]] * len(activeMeasurementKeys))
                 hypothesisIndex[0] += 1
-
             else:
                 for hyp in target.trackHypotheses:
-                    activeMeasurementsCpy = activeMeasurements.copy()
-                    if ((hyp.measurementNumber is not None) and
-                            (hyp.measurementNumber != 0)):
-                        radarMeasurement = (hyp.scanNumber, hyp.measurementNumber)
-                        try:
-                            radarMeasurementIndex = measurementList.index(
-                                radarMeasurement)
-                        except ValueError:
-                            measurementList.append(radarMeasurement)
-                            radarMeasurementIndex = len(measurementList) - 1
-                        activeMeasurementsCpy[radarMeasurementIndex] = True
-
-                    if hyp.mmsi is not None:
-                        aisMeasurement = (hyp.scanNumber, hyp.mmsi)
-                        try:
-                            aisMeasurementIndex = measurementList.index(aisMeasurement)
-                        except ValueError:
-                            measurementList.append(aisMeasurement)
-                            aisMeasurementIndex = len(measurementList) - 1
-                        activeMeasurementsCpy[aisMeasurementIndex] = True
-
-                    recActiveMeasurement(hyp, A1, measurementList,
-                                         activeMeasurementsCpy, hypothesisIndex)
-
-        A1 = np.zeros((nRow, nCol), dtype=bool)
-        activeMeasurements = np.zeros(nRow, dtype=bool)
-        measurementList = []
+                    recActiveMeasurement(hyp, activeMeasurementKeys + hyp.getMeasurementKeys())
+
+        keys = []
+        hypothesisIndices = []
         hypothesisIndex = [0]
-        # TODO:
-        # http://stackoverflow.com/questions/15148496/python-passing-an-integer-by-reference
         for targetIndex in cluster:
-            recActiveMeasurement(self.__targetList__[targetIndex],
-                                 A1,
-                                 measurementList,
-                                 activeMeasurements,
-                                 hypothesisIndex)
-        log.debug("measurementList" + str(measurementList) +
-                  "Sum=" + str(len(measurementList)))
-        log.debug("size(A1) " + str(A1.shape))
-        log.debug("A1 \n" + 'V: Measurements, LeafNodes ---->\n' +
-                  np.array_str(A1.astype(np.int), max_line_width=200))
-        # assert len(measurementList) == A1.shape[0], str(len(measurementList)) + " vs " + str(A1.shape[0])
-        return A1, measurementList
+            recActiveMeasurement(self.__targets__.roots[targetIndex], ())
+        assert hypothesisIndex[0] == nCol
+        rows = np.searchsorted(uniqueMeasurementKeys, np.array(keys, dtype=np.int64))
+        assert np.array_equal(uniqueMeasurementKeys[rows], keys), "Cluster key missing from association sets"
+        A1 = np.zeros((len(uniqueMeasurementKeys), nCol), dtype=bool)
+        A1[rows, hypothesisIndices] = True
+        return A1
 
     def _createA2(self, nTargetsInCluster, nHypInClusterArray):
         A2 = np.zeros((nTargetsInCluster, sum(nHypInClusterArray)), dtype=bool)
@@ -1135,7 +1541,7 @@ class Tracker():
 
         scoreArray = []
         for targetIndex in cluster:
-            getTargetScore(self.__targetList__[targetIndex], scoreArray)
+            getTargetScore(self.__targets__.roots[targetIndex], scoreArray)
         assert all(np.isfinite(scoreArray)), str(scoreArray)
         return scoreArray
 
@@ -1152,7 +1558,7 @@ class Tracker():
         nodeList = []
         counter = [0]
         for targetIndex in cluster:
-            recDFS(self.__targetList__[targetIndex],
+            recDFS(self.__targets__.roots[targetIndex],
                    selectedHypotheses, nodeList, counter)
         return nodeList
 
@@ -1168,6 +1574,7 @@ class Tracker():
         assert A1.shape[1] == A2.shape[1]
 
         # Initiate solver
+        from ortools.linear_solver import pywraplp
         solver = pywraplp.Solver(
             'MHT-solver', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
 
@@ -1200,7 +1607,7 @@ class Tracker():
         tic2 = time.time()
         # Solving optimization problem
         result_status = solver.Solve()
-        log.debug("Optim Time = " + str(solver.WallTime()) + " milliseconds")
+        log.debug("Optim Time = %s milliseconds", solver.WallTime())
 
         if result_status == pywraplp.Solver.OPTIMAL:
             log.debug("Optim result optimal")
@@ -1212,47 +1619,67 @@ class Tracker():
         tic3 = time.time()
         selectedHypotheses = [i for i in range(nHyp)
                               if tau[i].solution_value() > 0.]
-        log.debug("Selected hypotheses" + str(selectedHypotheses))
+        log.debug("Selected hypotheses %s", selectedHypotheses)
         assert len(selectedHypotheses) == nTargets
         toc3 = time.time() - tic3
 
-        log.debug('_solveBLP_OR_TOOLS ({0:4.0f}|{1:4.0f}|{2:4.0f}|{3:4.0f}) ms = {4:4.0f}'.format(
-            toc0 * 1000, toc1 * 1000, toc2 * 1000, toc3 * 1000, (toc0 + toc1 + toc2 + toc3) * 1000))
+        log.debug('_solveBLP_OR_TOOLS (%4.0f|%4.0f|%4.0f|%4.0f) ms = %4.0f',
+                  toc0 * 1000, toc1 * 1000, toc2 * 1000, toc3 * 1000, (toc0 + toc1 + toc2 + toc3) * 1000)
         return selectedHypotheses
 
     def _pruneTargetIndex(self, targetIndex, N):
-        node = self.__trackNodes__[targetIndex]
-        newRootNode = node.pruneDepth(N)
-        if newRootNode != self.__targetList__[targetIndex]:
+        targets = self.__targets__
+        node = targets.trackNodes[targetIndex]
+        oldRootNode = targets.roots[targetIndex]
+        associatedMeasurements = targets.associations[targetIndex]
+        newRootNode = node.pruneDepth(N, associatedMeasurements)
+        if newRootNode != oldRootNode:
+            # The nodes from the new root up to the old root are history now
+            historyNode = newRootNode
+            while historyNode is not oldRootNode and historyNode is not None:
+                associatedMeasurements.removeNode(historyNode)
+                historyNode = historyNode.parent
+            if historyNode is None:
+                targets.associations[targetIndex] = AssociationSet.fromTree(newRootNode)
+            oldRootNode.isRoot = False
             newRootNode.parent.isRoot = False
             newRootNode.isRoot = True
-            self.__targetList__[targetIndex] = newRootNode
-            self.__associatedMeasurements__[targetIndex] = self.__targetList__[
-                targetIndex].getMeasurementSet()
+            targets.roots[targetIndex] = newRootNode
 
     def _nScanPruning(self):
-        for targetIndex, target in enumerate(self.__trackNodes__):
-            self._pruneTargetIndex(targetIndex, self.__targetWindowSize__[targetIndex])
+        for targetIndex in self.__targets__.slots:
+            self._pruneTargetIndex(targetIndex, self.__targets__.windowSizes[targetIndex])
 
     def _pruneSimilarState(self, cluster, threshold):
+        parents = []
+        associationSets = []
         for targetIndex in cluster:
-            leafParents = self.__targetList__[targetIndex].getLeafParents()
-            for node in leafParents:
-                node.pruneSimilarState(threshold)
-            self.__associatedMeasurements__[targetIndex] = self.__targetList__[
-                targetIndex].getMeasurementSet()
+            leafParents = self.__targets__.roots[targetIndex].getLeafParents()
+            parents.extend(leafParents)
+            associationSets.extend([self.__targets__.associations[targetIndex]] * len(leafParents))
+        pruneSimilarStates(parents, threshold, associationSets)
 
     def _checkTrackerIntegrity(self):
         log.debug("Checking tracker integrity")
-        assert len(self.__trackNodes__) == len(self.__targetList__), \
+        targets = self.__targets__
+        assert all((node is not None) == used for node, used in zip(targets.trackNodes, targets.used)), \
             "There are not the same number trackNodes as targets"
+        assert all((root is not None) == used for root, used in zip(targets.roots, targets.used)), \
+            "There are targets in free slots"
         assert len(self.__targetList__) == len(set(self.__targetList__)), \
             "There are copies of targets in the target list"
         assert len(self.__trackNodes__) == len(set(self.__trackNodes__)), \
             "There are copies of track nodes in __trackNodes__"
-        for target in self.__targetList__:
+        for targetIndex in targets.slots:
+            target = targets.roots[targetIndex]
             target._checkScanNumberIntegrity()
             target._checkReferenceIntegrity()
+            target._checkMmsiIntegrity()
+            assert targets.associations[targetIndex].counts == \
+                AssociationSet.fromTree(target).counts, "Association set out of date"
+            assert set(measurementKeys.toTuples(targets.associations[targetIndex].keys)) == \
+                target.getMeasurementSet(), \
+                "Association set out of date"
         if len(self.__trackNodes__) > 0:
             assert len({node.scanNumber for node in self.__trackNodes__}) == 1, \
                 "there are inconsistency in trackNodes scanNumber"
@@ -1264,7 +1691,6 @@ class Tracker():
                     "{0:} != {1:} @ TargetNumber {2:}".format(leafNode.scanNumber,
                                                               scanNumber,
                                                               targetIndex + 1)
-                leafNode._checkMmsiIntegrity()
                 assert np.isfinite(leafNode.getScore())
                 assert np.isfinite(leafNode.cumulativeNLLR)
         activeMmsiList = [target.mmsi
@@ -1274,8 +1700,8 @@ class Tracker():
         assert len(activeMmsiList) == len(
             activeMmsiSet), "One or more MMSI is used multiple times"
 
-    def getSmoothTracks(self):
-        return [track.getSmoothTrack() for track in self.__trackNodes__]
+    def getSmoothTracks(self, **kwargs):
+        return smoothTracks(self.__trackNodes__, self.radarPeriod, **kwargs)
 
     def plotValidationRegionFromRoot(self, stepsBack=1):
         def recPlotValidationRegionFromTarget(target, eta2, stepsBack):
@@ -1293,24 +1719,8 @@ class Tracker():
             node.plotValidationRegion(self.eta2, stepsBack)
 
     def plotHypothesesTrack(self, **kwargs):
-        def recPlotHypothesesTrack(target, track=[], **kwargs):
-            newTrack = track[:] + [target.getPosition()]
-            if target.trackHypotheses is None:
-                plt.plot([p.x() for p in newTrack],
-                         [p.y() for p in newTrack],
-                         "--",
-                         **kwargs)
-            else:
-                for hyp in target.trackHypotheses:
-                    recPlotHypothesesTrack(hyp, newTrack, **kwargs)
-
-        colors = kwargs.get("colors", self._getColorCycle())
-        for target in self.__targetList__:
-            recPlotHypothesesTrack(target, c=next(colors))
-        if kwargs.get('markStates', False):
-            defaults = {'dummy': True, 'real': True, 'ais': True,
-                        'includeHistory': False, 'color': 'red'}
-            self.plotStatesFromRoot(**{**defaults, **kwargs})
+        from .utils import plotting
+        plotting.plotHypothesesTrack(self, **kwargs)
 
     def plotActiveTracks(self, **kwargs):
         colors = kwargs.get("colors", self._getColorCycle())
@@ -1389,16 +1799,8 @@ class Tracker():
             track.plotVelocityArrow(stepsBack)
 
     def plotInitialTargets(self, **kwargs):
-        initialTargets = [target.getInitial() for target in self.__targetList__]
-        fig = plt.gcf()
-        size = fig.get_size_inches() * fig.dpi
-        for i, initialTarget in enumerate(initialTargets):
-            index = kwargs.get("index", list(range(len(initialTargets))))
-            offset = 0.05 * size
-            if len(index) != len(initialTargets):
-                raise ValueError(
-                    "plotInitialTargets: Need equal number of targets and indices")
-            initialTarget.markInitial(index=index[i], offset=offset)
+        from .utils import plotting
+        plotting.plotInitialTargets(self, **kwargs)
 
     def _getColorCycle(self):
         return itertools.cycle(self.colors)
@@ -1434,7 +1836,7 @@ class Tracker():
         nAisUpdates = len(
             self.__aisHistory__[-1]) if self.__aisHistory__[-1] is not None else 0
         scanNumber = len(self.__scanHistory__)
-        nTargets = len(self.__targetList__)
+        nTargets = len(self.__targets__)
         nClusters = len(self.__clusterList__)
         timeLogString = ('{:<3.0f} '.format(scanNumber) +
                          'nTrack {:2.0f} '.format(nTargets) +
@@ -1451,7 +1853,7 @@ class Tracker():
         return timeLogString
 
     def printTimeLog(self, **kwargs):
-        tooLongWarning = self.toc['Total'] > self.radarPeriod * 0.6
+        tooLongWarning = self.toc['Total'] > self.radarPeriod * self.slowScanFraction
         tooLongCritical = self.toc['Total'] > self.radarPeriod
         on_color = 'on_green'
         on_color = 'on_yellow' if tooLongWarning else on_color
@@ -1459,6 +1861,7 @@ class Tracker():
         on_color = kwargs.get('on_color', on_color)
         attrs = ['dark']
         attrs = attrs.append('bold') if tooLongWarning else attrs
+        from termcolor import cprint
         cprint(self.getTimeLogString(),
                on_color=on_color,
                attrs=attrs
@@ -1479,8 +1882,13 @@ class Tracker():
     def _storeTrackerArgs(self, scenarioElement, **kwargs):
         for k, v in kwargs.items():
             scenarioElement.attrib[str(k)] = str(v)
+        scenarioElement.append(self._getTrackerSettingsElement())
+
+    def _streamTrackerArgs(self, writer):
+        writer.writeElement(self._getTrackerSettingsElement())
 
-        trackerSettingElement = ET.SubElement(scenarioElement, trackerSettingsTag)
+    def _getTrackerSettingsElement(self):
+        trackerSettingElement = ET.Element(trackerSettingsTag)
         ET.SubElement(trackerSettingElement, 'M_required').text = str(self.M_required)
         ET.SubElement(trackerSettingElement, 'N_checks').text = str(self.N_checks)
         ET.SubElement(trackerSettingElement, 'mergeThreshold').text = str(
@@ -1500,23 +1908,39 @@ class Tracker():
         ET.SubElement(trackerSettingElement, 'targetSizeLimit').text = str(
             self.targetSizeLimit)
         ET.SubElement(trackerSettingElement, 'maxSpeedMS').text = str(self.maxSpeedMS)
+        return trackerSettingElement
 
     def _storeRun(self, scenarioElement, preInitialized=True, **kwargs):
-        runElement = ET.SubElement(scenarioElement, runTag)
-
-        if iterationTag in kwargs:
-            iteration = kwargs.get(iterationTag)
-        else:
-            iteration = len(scenarioElement.findall(runTag))
-        runElement.attrib[iterationTag] = str(iteration)
-
+        iteration = kwargs.get(iterationTag, len(scenarioElement.findall(runTag)))
+        runElement = ET.SubElement(scenarioElement, runTag,
+                                   attrib=self._getRunAttributes(iteration, **kwargs))
+        runElement.append(self._getRuntimeElement())
+        for trackElement in self._getTrackElements(preInitialized):
+            runElement.append(trackElement)
+
+    def _streamRun(self, writer, preInitialized=True, **kwargs):
+        """
+        Same as _storeRun, but writes the Run element to a ScenarioWriter one
+        track at a time instead of adding it to an in-memory tree.
+        """
+        iteration = kwargs.get(iterationTag, writer.nRuns)
+        writer.startElement(runTag, self._getRunAttributes(iteration, **kwargs))
+        writer.writeElement(self._getRuntimeElement())
+        for trackElement in self._getTrackElements(preInitialized):
+            writer.writeElement(trackElement)
+        writer.endElement()
+        writer.nRuns += 1
+
+    def _getRunAttributes(self, iteration, **kwargs):
+        attrib = {iterationTag: str(iteration)}
         if seedTag in kwargs:
-            runElement.attrib[seedTag] = str(kwargs.get(seedTag))
+            attrib[seedTag] = str(kwargs.get(seedTag))
+        return attrib
 
-        runtimeElement = ET.SubElement(runElement,
-                                       runtimeTag,
-                                       attrib={descriptionTag: "Per iteration",
-                                               precisionTag: str(timeLogPrecision)})
+    def _getRuntimeElement(self):
+        runtimeElement = ET.Element(runtimeTag,
+                                    attrib={descriptionTag: "Per iteration",
+                                            precisionTag: str(timeLogPrecision)})
         for k, v in self.runtimeLog.items():
             if not v:
                 continue
@@ -1535,18 +1959,23 @@ class Tracker():
                           ).text = np.array_str(array,
                                                 precision=timeLogPrecision,
                                                 max_line_width=999999)
-
-        for target in self.__trackNodes__:
-            if preInitialized:
-                target._storeNode(runElement, self.radarPeriod)
-            else:
-                target._storeNodeSparse(runElement)
-
-        for target in self.__terminatedTargets__:
+        return runtimeElement
+
+    def _getTrackElements(self, preInitialized):
+        # Each track is built under its own temporary parent so that only one
+        # track sub-tree is alive at a time when streaming.
+        nodes = ([(target, {}) for target in self.__trackNodes__] +
+                 [(target, {'terminated': True}) for target in self.__terminatedTargets__])
+        if preInitialized:
+            smoothedTracks = smoothTracks([target for target, _ in nodes], self.radarPeriod)
+        for index, (target, attrib) in enumerate(nodes):
+            parentElement = ET.Element(runTag)
             if preInitialized:
-                target._storeNode(runElement, self.radarPeriod, terminated=True)
+                target._storeNode(parentElement, self.radarPeriod,
+                                  smoothTrack=smoothedTracks[index], **attrib)
             else:
-                target._storeNodeSparse(runElement, terminated=True)
+                target._storeNodeSparse(parentElement, **attrib)
+            yield parentElement[0]
 
 if __name__ == '__main__':
     pass
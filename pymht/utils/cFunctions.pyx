@@ -1,54 +1,149 @@
-import numpy as np
-cimport numpy as np
-from libcpp cimport bool
-
-cpdef int binomial(int n, int k):
-    return 1 if k == 0 else (0 if n == 0 else binomial(n - 1, k) + binomial(n - 1, k - 1)) 
-
-cpdef double nllrNoMeasurement(double P_d):
-    if P_d == 1:
-        return -np.log(1e-6)
-    return -np.log(1 - P_d)
-
-cpdef double nllr(double P_d, 
-                  np.ndarray[np.double_t, ndim=1] measurementResidual, 
-                  double lambda_ex, 
-                  np.ndarray[np.double_t, ndim=2] covariance, 
-                  np.ndarray[np.double_t, ndim=2] invCovariance):
-    return (0.5 * (measurementResidual.T.dot(invCovariance).dot(measurementResidual))
-            + np.log((lambda_ex * np.sqrt(2 * np.pi *np.linalg.det(covariance))) / P_d))
-
-cpdef np.ndarray[np.double_t, ndim=2] stackNodeMatrix(np.ndarray[np.uint8_t, ndim=1] indecies, 
-                                                  np.ndarray[np.double_t, ndim=2] measurementsResidual, 
-                                                  np.ndarray[np.double_t, ndim=2] measurements, 
-                                                  np.ndarray[np.double_t, ndim=1] cNLLR):
-    cdef array = np.zeros((indecies.shape[0],6))
-    array[:,0] = indecies
-    array[:,1:3] = measurementsResidual
-    array[:,3:5] = measurements
-    array[:,5] = cNLLR
-    return array
-
-cpdef np.ndarray[np.double_t,ndim=2] cNewMeasurement(np.ndarray[np.double_t,ndim=2] measurements,
-                                                     np.ndarray[np.double_t,ndim=1] z_hat,
-                                                     np.ndarray[np.double_t,ndim=2] S, 
-                                                     np.ndarray[np.double_t,ndim=2] S_inv,
-                                                     double eta2, 
-                                                     double P_d, 
-                                                     double lambda_ex):
-    cdef np.ndarray[np.double_t,ndim=2] measurementsResidual = measurements - z_hat
-    cdef np.ndarray[np.double_t,ndim=1] nis = np.sum(measurementsResidual.dot(S_inv) * measurementsResidual, axis=1)
-    cdef np.ndarray[np.int64_t,ndim=1, cast = True] gatedFilter = np.less_equal(nis,np.ones(measurements.shape[0])*eta2)
-    cdef np.ndarray[np.int_t,ndim=1] gatedIndecies = np.where(gatedFilter)[0]
-    cdef int nMeasurementInsideGate = gatedIndecies.shape[0]
-    cdef np.ndarray[np.double_t,ndim=2] gatedMeasurements = measurements[gatedIndecies]
-    cdef np.ndarray[np.double_t,ndim=2] gatedMeasurementResidual = np.array(measurementsResidual[gatedIndecies, :], ndmin=2)
-    cdef np.ndarray cNLLR = np.zeros(nMeasurementInsideGate,dtype = np.double)
-    cdef int i = 0
-    for i in range(nMeasurementInsideGate):
-        cNLLR[i] = nllr(P_d, gatedMeasurementResidual[i,:], lambda_ex, S, S_inv)
-    if nMeasurementInsideGate > 0:
-        print(type(gatedIndecies))
-        return stackNodeMatrix(gatedIndecies,gatedMeasurementResidual, gatedMeasurements, cNLLR)
-    else:
-        return np.array([],ndmin=2)
\ No newline at end of file
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+Compiled kernels for pymht.utils.kalman. All arrays are float64 and C
+contiguous, the outputs are allocated by the caller and the kernels do not
+allocate. The measurement dimension is two (radar).
+
+Build with
+    USE_CYTHON=1 python setup.py build_ext --inplace
+"""
+from libc.math cimport log, sqrt, isfinite
+
+
+def predict(const double[:, ::1] A,
+            const double[:, ::1] Q,
+            const double[:, ::1] x_0_list,
+            const double[:, :, ::1] P_0_list,
+            double[:, ::1] x_bar_list,
+            double[:, :, ::1] P_bar_list):
+    cdef Py_ssize_t nStates = A.shape[0]
+    cdef Py_ssize_t k, i, j, a, b
+    cdef double s, t
+    with nogil:
+        for k in range(x_0_list.shape[0]):
+            for i in range(nStates):
+                s = 0.
+                for j in range(nStates):
+                    s = s + A[i, j] * x_0_list[k, j]
+                x_bar_list[k, i] = s
+        for k in range(P_0_list.shape[0]):
+            for i in range(nStates):
+                for j in range(nStates):
+                    s = 0.
+                    for a in range(nStates):
+                        t = 0.
+                        for b in range(nStates):
+                            t = t + P_0_list[k, a, b] * A[j, b]
+                        s = s + A[i, a] * t
+                    P_bar_list[k, i, j] = s + Q[i, j]
+
+
+def precalcCovariance(const double[:, ::1] C,
+                      const double[:, ::1] R,
+                      const double[:, :, ::1] P_bar_list,
+                      double[:, :, ::1] S_list,
+                      double[:, :, ::1] S_inv_list,
+                      double[:, :, ::1] K_list,
+                      double[:, :, ::1] P_hat_list):
+    cdef Py_ssize_t nStates = C.shape[1]
+    cdef Py_ssize_t k, a, b, c, r
+    cdef double s, det, pc0, pc1, cp0, cp1
+    with nogil:
+        for k in range(P_bar_list.shape[0]):
+            # K holds P*C^T until it is overwritten row by row below
+            for a in range(nStates):
+                for r in range(2):
+                    s = 0.
+                    for b in range(nStates):
+                        s = s + P_bar_list[k, a, b] * C[r, b]
+                    K_list[k, a, r] = s
+            for r in range(2):
+                for c in range(2):
+                    s = 0.
+                    for a in range(nStates):
+                        s = s + C[r, a] * K_list[k, a, c]
+                    S_list[k, r, c] = s + R[r, c]
+            det = S_list[k, 0, 0] * S_list[k, 1, 1] - S_list[k, 0, 1] * S_list[k, 1, 0]
+            S_inv_list[k, 0, 0] = S_list[k, 1, 1] / det
+            S_inv_list[k, 0, 1] = -S_list[k, 0, 1] / det
+            S_inv_list[k, 1, 0] = -S_list[k, 1, 0] / det
+            S_inv_list[k, 1, 1] = S_list[k, 0, 0] / det
+            for a in range(nStates):
+                pc0 = K_list[k, a, 0]
+                pc1 = K_list[k, a, 1]
+                K_list[k, a, 0] = pc0 * S_inv_list[k, 0, 0] + pc1 * S_inv_list[k, 1, 0]
+                K_list[k, a, 1] = pc0 * S_inv_list[k, 0, 1] + pc1 * S_inv_list[k, 1, 1]
+            for b in range(nStates):
+                cp0 = 0.
+                cp1 = 0.
+                for c in range(nStates):
+                    cp0 = cp0 + C[0, c] * P_bar_list[k, c, b]
+                    cp1 = cp1 + C[1, c] * P_bar_list[k, c, b]
+                for a in range(nStates):
+                    P_hat_list[k, a, b] = (P_bar_list[k, a, b] -
+                                           (K_list[k, a, 0] * cp0 + K_list[k, a, 1] * cp1))
+
+
+def gate(const double[:, ::1] z_list,
+         const double[:, ::1] z_hat_list,
+         const double[:, :, ::1] S_inv_unique,
+         const long long[::1] groupIndices,
+         double eta2,
+         double[:, ::1] nis,
+         unsigned char[:, ::1] gated):
+    """
+    Returns the number of gated (node, measurement) pairs.
+    """
+    cdef Py_ssize_t nGated = 0
+    cdef Py_ssize_t i, j, g
+    cdef double d0, d1, value
+    with nogil:
+        for i in range(z_hat_list.shape[0]):
+            g = groupIndices[i]
+            for j in range(z_list.shape[0]):
+                d0 = z_list[j, 0] - z_hat_list[i, 0]
+                d1 = z_list[j, 1] - z_hat_list[i, 1]
+                value = (d0 * (d0 * S_inv_unique[g, 0, 0] + d1 * S_inv_unique[g, 1, 0]) +
+                         d1 * (d0 * S_inv_unique[g, 0, 1] + d1 * S_inv_unique[g, 1, 1]))
+                nis[i, j] = value
+                gated[i, j] = value <= eta2
+                nGated += gated[i, j]
+    return nGated
+
+
+def filterGated(const double[:, ::1] x_bar_list,
+                const double[:, ::1] z_hat_list,
+                const double[:, ::1] z_list,
+                const double[:, :, ::1] K_unique,
+                const long long[::1] groupIndices,
+                const double[::1] det_S_unique,
+                const double[::1] P_d_list,
+                double lambda_ex,
+                const double[:, ::1] nis,
+                const long long[::1] gatedNodes,
+                const long long[::1] gatedMeasurements,
+                double[:, ::1] z_tilde_list,
+                double[:, ::1] x_hat_list,
+                double[::1] nllr_list):
+    """
+    Filtered state and NLLR for each gated (node, measurement) pair. Returns
+    False if any NLLR is not finite.
+    """
+    cdef Py_ssize_t nStates = x_bar_list.shape[1]
+    cdef Py_ssize_t p, i, j, g, a
+    cdef bint finite = True
+    cdef double d0, d1
+    with nogil:
+        for p in range(gatedNodes.shape[0]):
+            i = gatedNodes[p]
+            j = gatedMeasurements[p]
+            g = groupIndices[i]
+            d0 = z_list[j, 0] - z_hat_list[i, 0]
+            d1 = z_list[j, 1] - z_hat_list[i, 1]
+            z_tilde_list[p, 0] = d0
+            z_tilde_list[p, 1] = d1
+            for a in range(nStates):
+                x_hat_list[p, a] = x_bar_list[i, a] + (K_unique[g, a, 0] * d0 + K_unique[g, a, 1] * d1)
+            nllr_list[p] = 0.5 * nis[i, j] + log((lambda_ex * sqrt(det_S_unique[g])) / P_d_list[i])
+            finite = finite and isfinite(nllr_list[p])
+    return finite
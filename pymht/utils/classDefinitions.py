@@ -1,17 +1,20 @@
 import math
 import numpy as np
 import datetime
-import matplotlib.pyplot as plt
 import logging
 import copy
 import collections
 import xml.etree.ElementTree as ET
-import matplotlib.pyplot as plt
 from .xmlDefinitions import *
 from ..models import pv, polar, ais
+from . import trace
 log = logging.getLogger(__name__)
 
 
+def _timeString(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S.%f")
+
+
 class SimTarget:
     def __init__(self, state, time, P_d, sigma_Q, **kwargs):
         self.state = np.array(state, dtype=np.double)
@@ -262,27 +265,9 @@ class Position:
     def y(self):
         return self.array[1]
 
-    def plot(self,ax=plt.gca(), measurementNumber=-1, scanNumber=None, mmsi=None, **kwargs):
-        if mmsi is not None:
-            marker = 'h' if kwargs.get('original',False) else 'D'
-            ax.plot(self.array[0], self.array[1],
-                     marker=marker, markerfacecolor='None',
-                     markeredgewidth=kwargs.get('markeredgewidth',1),
-                     markeredgecolor = kwargs.get('color','black'))
-        elif measurementNumber > 0:
-            ax.plot(self.array[0], self.array[1], 'kx',
-                     markeredgecolor=kwargs.get('color', 'black'))
-        elif measurementNumber == 0:
-            ax.plot(self.array[0], self.array[1], fillstyle="none", marker="o",
-                     markeredgecolor=kwargs.get('color', 'black'))
-        else:
-            raise ValueError("Not a valid measurement number")
-
-        if ((scanNumber is not None) and
-                (measurementNumber is not None) and
-                kwargs.get("labels", False)):
-            ax.text(self.array[0], self.array[1], str(
-                scanNumber) + ":" + str(measurementNumber), size=7, ha="left", va="top")
+    def plot(self, ax=None, measurementNumber=-1, scanNumber=None, mmsi=None, **kwargs):
+        from . import plotting
+        plotting.plotPosition(self, ax, measurementNumber, scanNumber, mmsi, **kwargs)
 
 class Velocity:
     def __init__(self, *args, **kwargs):
@@ -402,7 +387,8 @@ class AIS_message:
         return timeString
 
     def plot(self, **kwargs):
-        Position(self.state[0:2]).plot(mmsi=self.mmsi, original=True, **kwargs)
+        from . import plotting
+        plotting.plotAisMessage(self, **kwargs)
 
     def predict(self, dT):
         Phi = ais.Phi(dT)
@@ -470,10 +456,9 @@ class AisMessagesList:
         import pymht.utils.kalman as kalman
         assert len(aisMeasurements) > 0
         aisPredictions = AisMessageList(scanTime)
-        scanTimeString = datetime.datetime.fromtimestamp(scanTime).strftime("%H:%M:%S.%f")
         for measurement in aisMeasurements:
-            aisTimeString = datetime.datetime.fromtimestamp(measurement.time).strftime("%H:%M:%S.%f")
-            log.debug("Predicting AIS ("+str(measurement.mmsi)+") from " + aisTimeString + " to " + scanTimeString)
+            log.debug("Predicting AIS (%s) from %s to %s", measurement.mmsi,
+                      trace.Lazy(_timeString, measurement.time), trace.Lazy(_timeString, scanTime))
             dT = scanTime - measurement.time
             assert dT >= 0
             state = measurement.state
@@ -484,15 +469,16 @@ class AisMessagesList:
             aisPredictions.measurements.append(
                 AIS_prediction(model.C_RADAR.dot(x_bar[0]),
                                model.C_RADAR.dot(P_bar[0]).dot(model.C_RADAR.T), measurement.mmsi))
-            log.debug(np.array_str(state) + "=>" + np.array_str(x_bar[0]))
+            log.debug("%s=>%s", state, x_bar[0])
             aisPredictions.aisMessages.append(measurement)
         assert len(aisPredictions.measurements) == len(aisMeasurements)
         return aisPredictions
 
 class MeasurementList:
-    def __init__(self, time, measurements=None):
+    def __init__(self, time, measurements=None, sector=None):
         self.time = time
         self.measurements = measurements if measurements is not None else []
+        self.sector = sector
 
     def __str__(self):
         np.set_printoptions(precision=1, suppress=True)
@@ -508,9 +494,9 @@ class MeasurementList:
 
     __repr__ = __str__
 
-    def plot(self,ax = plt.gca(), **kwargs):
-        for measurementIndex, measurement in enumerate(self.measurements):
-            Position(measurement).plot(ax, measurementIndex + 1, **kwargs)
+    def plot(self, ax=None, **kwargs):
+        from . import plotting
+        plotting.plotMeasurementList(self, ax, **kwargs)
 
     def filterUnused(self, unused_measurement_indices):
         measurements = self.measurements[np.where(unused_measurement_indices)]
@@ -522,35 +508,99 @@ class MeasurementList:
     def getMeasurements(self):
         return self.measurements
 
+    def splitSectors(self, nSectors, origin=np.zeros(2), northOffset=0.):
+        """
+        Splits the scan into nSectors equal azimuth sectors in the order of
+        rotation, starting at northOffset.
+        """
+        from . import sector
+        edges = northOffset + np.linspace(0., sector.TWO_PI, nSectors + 1)
+        measurements = np.array(self.measurements, ndmin=2).reshape(-1, 2)
+        indices = sector.sectorIndices(sector.azimuth(measurements, origin), nSectors, northOffset)
+        return [MeasurementList(self.time,
+                                measurements[indices == i],
+                                (edges[i], edges[i + 1]))
+                for i in range(nSectors)]
+
+class AisColumns():
+    """
+    The messages of an AisMessageList as arrays (time, mmsi, state and
+    highAccuracy, one row per message, mmsi -1 if unknown), with the rows
+    grouped by (time, highAccuracy) and a map from MMSI to row. groups is a
+    list of (time, highAccuracy, rows) ordered by time, high accuracy first.
+    """
+
+    def __init__(self, messages):
+        self.size = len(messages)
+        self.time = np.array([float(m.time) for m in messages], dtype=np.float64)
+        self.mmsi = np.array([m.mmsi if m.mmsi is not None else -1 for m in messages], dtype=np.int64)
+        self.state = np.array([m.state for m in messages], dtype=np.float64).reshape(
+            self.size, -1 if self.size else 0)
+        self.highAccuracy = np.array([bool(m.highAccuracy) for m in messages], dtype=bool)
+        self.rowOfMmsi = {mmsi: row for row, mmsi in enumerate(self.mmsi.tolist()) if mmsi != -1}
+        order = np.lexsort((~self.highAccuracy, self.time))
+        keys = np.column_stack((self.time[order], self.highAccuracy[order]))
+        starts = np.flatnonzero(np.append(True, np.any(keys[1:] != keys[:-1], axis=1))) if self.size else []
+        self.groups = [(float(self.time[order[start]]), bool(self.highAccuracy[order[start]]), order[start:end])
+                       for start, end in zip(starts, np.append(starts[1:], self.size).astype(int))]
+
+
 class AisMessageList(list):
     def __init__(self, *args):
         list.__init__(self, *args)
         assert all([type(m) is AIS_message for m in self])
-        mmsiList = [m.mmsi for m in self]
-        deleteIndices = []
-        duplicateMMSI = [item for item, count in collections.Counter(mmsiList).items() if count > 1]
-        for mmsi in duplicateMMSI:
-            indices = [(i,m.time) for i,m in enumerate(self) if m.mmsi == mmsi]
-            indices.sort(key=lambda tup: tup[1])
-            assert len(indices) > 1
-            for tup in indices[:-1]:
-                deleteIndices.append(tup[0])
-        deleteIndices.sort(reverse=True)
-        for i in deleteIndices:
-            del self[i]
-
-        mmsiList = [m.mmsi for m in self]
-        mmsiSet = set(mmsiList)
-        assert len(mmsiList) == len(mmsiSet)
+        self._columns = None
+        if len(self) > 1:
+            # Only the latest message of each MMSI is kept
+            mmsi = np.array([m.mmsi if m.mmsi is not None else -1 for m in self], dtype=np.int64)
+            times = np.array([float(m.time) for m in self])
+            order = np.lexsort((np.arange(len(self)), times, mmsi))
+            latest = np.append(mmsi[order][1:] != mmsi[order][:-1], True)
+            keep = np.sort(order[latest])
+            if len(keep) < len(self):
+                self[:] = [self[i] for i in keep]
+
+    def getColumns(self):
+        """
+        The messages as AisColumns, built once and again after the list is
+        changed.
+        """
+        if self._columns is None:
+            self._columns = AisColumns(self)
+        return self._columns
+
+    def _changed(method):
+        def wrapper(self, *args, **kwargs):
+            self._columns = None
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    __setitem__ = _changed(list.__setitem__)
+    __delitem__ = _changed(list.__delitem__)
+    __iadd__ = _changed(list.__iadd__)
+    __imul__ = _changed(list.__imul__)
+    append = _changed(list.append)
+    extend = _changed(list.extend)
+    insert = _changed(list.insert)
+    pop = _changed(list.pop)
+    remove = _changed(list.remove)
+    clear = _changed(list.clear)
+    sort = _changed(list.sort)
+    reverse = _changed(list.reverse)
+    del _changed
+
+    def select(self, rows):
+        return AisMessageList([self[row] for row in rows])
 
     def filterUnused(self, usedMmsiSet):
-        unusedAisMeasurements = [m for m in self
-                                 if m.mmsi not in usedMmsiSet]
-        return unusedAisMeasurements
+        columns = self.getColumns()
+        unused = ~np.isin(columns.mmsi, np.fromiter(usedMmsiSet, dtype=np.int64, count=len(usedMmsiSet)))
+        return self.select(np.flatnonzero(unused))
 
     def plot(self, **kwargs):
-        for measurement in self:
-            measurement.plot(**kwargs)
+        from . import plotting
+        plotting.plotAisMessageList(self, **kwargs)
 
 class ScanList(list):
     def __init__(self, *args):
@@ -562,13 +612,10 @@ class ScanList(list):
             raise TypeError('item is not of type'+str(type(MeasurementList)))
         super(ScanList, self).append(item)
 
-    def plot(self,ax=plt.gca(), **kwargs):
-        for m in self:
-            m.plot(ax,**kwargs)
+    def plot(self, ax=None, **kwargs):
+        from . import plotting
+        plotting.plotScanList(self, ax, **kwargs)
 
-    def plotFast(self, ax=plt.gca(), **kwargs):
-        for measurementList in self:
-            measurementArray = np.array(measurementList.measurements, ndmin=2)
-            assert measurementArray.ndim ==2
-            assert measurementArray.shape[1] == 2
-            ax.plot(measurementArray[:,0],measurementArray[:,1], '.', color='black', **kwargs)
+    def plotFast(self, ax=None, **kwargs):
+        from . import plotting
+        plotting.plotScanListFast(self, ax, **kwargs)
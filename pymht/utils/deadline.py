@@ -0,0 +1,72 @@
+"""
+Deadline for the processing of one scan.
+
+A scan has until the next scan arrives, the radar period times a margin, to
+produce its output. Each stage of the cycle must be finished by a fraction
+of that budget:
+
+    Process   0.5   grow the track trees
+    Optim     0.8   solve the clusters
+    Init      0.8   latest start of initiation
+
+The tracker checks the deadline between targets and between clusters. When a
+stage is behind, it switches to a cheaper strategy for the rest of the stage
+and records the switch with degrade().
+
+Usage:
+    deadline = Deadline(radarPeriod, scanNumber)
+    for target in targets:
+        if deadline.isBehind('Process'):
+            deadline.degrade('Process', 'skipAis')
+"""
+import time
+import logging
+import collections
+
+log = logging.getLogger(__name__)
+
+stageDeadlines = {'Process': 0.5,
+                  'Optim': 0.8,
+                  'Init': 0.8}
+
+Degradation = collections.namedtuple('Degradation', ['scanNumber', 'stage', 'action', 'elapsed', 'count'])
+
+
+class Deadline():
+
+    def __init__(self, radarPeriod, scanNumber, **kwargs):
+        self.budget = radarPeriod * kwargs.get('margin', 0.9)
+        self.stageDeadlines = dict(stageDeadlines, **kwargs.get('stageDeadlines', {}))
+        self.scanNumber = scanNumber
+        self.startTime = kwargs.get('startTime', time.time())
+        self.degradations = collections.OrderedDict()
+
+    def elapsed(self):
+        return time.time() - self.startTime
+
+    def remaining(self, stage):
+        return self.budget * self.stageDeadlines[stage] - self.elapsed()
+
+    def isBehind(self, stage):
+        return self.remaining(stage) < 0.
+
+    def isDegraded(self, stage, action):
+        return (stage, action) in self.degradations
+
+    def degrade(self, stage, action):
+        """
+        Records that action was taken once more in stage. The first time
+        per scan is logged.
+        """
+        key = (stage, action)
+        degradation = self.degradations.get(key)
+        if degradation is None:
+            elapsed = self.elapsed()
+            log.warning("Scan %s behind in %s after %.0fms of %.0fms, degrading to %s",
+                        self.scanNumber, stage, elapsed * 1000, self.budget * 1000, action)
+            self.degradations[key] = Degradation(self.scanNumber, stage, action, elapsed, 1)
+        else:
+            self.degradations[key] = degradation._replace(count=degradation.count + 1)
+
+    def getDegradations(self):
+        return list(self.degradations.values())
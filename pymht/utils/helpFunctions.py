@@ -1,5 +1,4 @@
 from __future__ import print_function
-import matplotlib.pyplot as plt
 import numpy as np
 import logging
 
@@ -7,9 +6,6 @@ import logging
 # Instantiate logging object
 # ----------------------------------------------------------------------------
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
-log.debug("Loaded helpFunctions")
-log.info("Loaded helpFunctions")
 
 def _getBestTextPosition(normVelocity, **kwargs):
     DEBUG = kwargs.get('debug', False)
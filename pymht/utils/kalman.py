@@ -1,8 +1,35 @@
 """
 A module with operations useful for Kalman filtering.
+
+The batched functions use the compiled kernels in pymht.utils.cFunctions when
+the extension is built (USE_CYTHON=1 python setup.py build_ext --inplace), and
+numpy otherwise.
 """
+import logging
 import numpy as np
 
+log = logging.getLogger(__name__)
+
+try:
+    from . import cFunctions as _compiledKernels
+except ImportError:
+    _compiledKernels = None
+_kernels = _compiledKernels
+
+
+def useCompiledKernels(enabled=True):
+    """
+    Switches between the compiled kernels and numpy. Returns True if the
+    compiled kernels are in use.
+    """
+    global _kernels
+    _kernels = _compiledKernels if enabled else None
+    return _kernels is not None
+
+
+def _float64(array):
+    return np.ascontiguousarray(array, dtype=np.float64)
+
 
 def nllr_ais(S_list, nis):
     result = (0.5 * nis + np.log(np.sqrt(np.linalg.det(2 * np.pi * S_list))))
@@ -13,21 +40,82 @@ def nllr_ais(S_list, nis):
 
 def nllr(lambda_ex, P_d, S_list, nis):
     # assert S_list.shape[0] ==  nis.size, str(S_list.shape) + str(nis.size) + str(nis.shape)
-    if lambda_ex == 0:
-        log.warning("'lambda_ex' can not be zero.")
-        lambda_ex += 1e-20
-    result = (0.5 * nis + np.log((lambda_ex * np.sqrt(np.linalg.det(2 * np.pi * S_list))) / P_d))
+    return nllrFromDet(lambda_ex, P_d, np.linalg.det(2 * np.pi * S_list), nis)
+
+
+def nllrFromDet(lambda_ex, P_d, det_S_list, nis):
+    """
+    nllr with det(2*pi*S) given, for when it is shared by several hypotheses
+    """
+    lambda_ex = _nonZeroLambda(lambda_ex)
+    result = (0.5 * nis + np.log((lambda_ex * np.sqrt(det_S_list)) / P_d))
     assert result.size == nis.size, str(result.size)+'/'+str(nis.size)
     assert all(np.isfinite(result)), str(result)
     return result
 
 
+def _nonZeroLambda(lambda_ex):
+    if lambda_ex == 0:
+        log.warning("'lambda_ex' can not be zero.")
+        lambda_ex += 1e-20
+    return lambda_ex
+
+
 def normalizedInnovationSquared(z_tilde_list, S_inv_list):
     return np.sum(np.matmul(z_tilde_list, S_inv_list) *
                   z_tilde_list,
                   axis=2)
 
 
+def gate(z_list, z_hat_list, S_inv_unique, groupIndices, eta2):
+    """
+    NIS of every measurement for every node and the gate mask. Node i uses
+    S_inv_unique[groupIndices[i]].
+    """
+    nNodes, measDim = z_hat_list.shape
+    nMeas = z_list.shape[0]
+    if _kernels is not None and measDim == 2:
+        nis = np.empty((nNodes, nMeas))
+        gated = np.empty((nNodes, nMeas), dtype=bool)
+        _kernels.gate(_float64(z_list), _float64(z_hat_list), _float64(S_inv_unique),
+                      np.ascontiguousarray(groupIndices, dtype=np.int64), eta2,
+                      nis, gated.view(np.uint8))
+        return nis, gated
+    z_tilde_list = z_tilde(z_list, z_hat_list, nNodes, measDim)
+    nis = normalizedInnovationSquared(z_tilde_list, S_inv_unique[groupIndices])
+    return nis, nis <= eta2
+
+
+def filterGated(x_bar_list, z_hat_list, z_list, K_unique, groupIndices, det_S_unique,
+                P_d_list, lambda_ex, nis, gatedNodes, gatedMeasurements):
+    """
+    Residual, filtered state and NLLR for each gated (node, measurement) pair
+    """
+    nGated = gatedNodes.size
+    measDim = z_hat_list.shape[1]
+    if _kernels is not None and measDim == 2:
+        z_tilde_list = np.empty((nGated, measDim))
+        x_hat_list = np.empty((nGated, x_bar_list.shape[1]))
+        nllr_list = np.empty(nGated)
+        finite = _kernels.filterGated(_float64(x_bar_list), _float64(z_hat_list), _float64(z_list),
+                                      _float64(K_unique),
+                                      np.ascontiguousarray(groupIndices, dtype=np.int64),
+                                      _float64(det_S_unique), _float64(P_d_list),
+                                      _nonZeroLambda(lambda_ex), _float64(nis),
+                                      np.ascontiguousarray(gatedNodes, dtype=np.int64),
+                                      np.ascontiguousarray(gatedMeasurements, dtype=np.int64),
+                                      z_tilde_list, x_hat_list, nllr_list)
+        assert finite, str(nllr_list)
+        return z_tilde_list, x_hat_list, nllr_list
+    z_tilde_list = z_list[gatedMeasurements] - z_hat_list[gatedNodes]
+    gatedGroups = groupIndices[gatedNodes]
+    x_hat_list = x_bar_list[gatedNodes] + np.matmul(K_unique[gatedGroups],
+                                                    z_tilde_list[:, :, np.newaxis])[:, :, 0]
+    nllr_list = nllrFromDet(lambda_ex, P_d_list[gatedNodes], det_S_unique[gatedGroups],
+                            nis[gatedNodes, gatedMeasurements])
+    return z_tilde_list, x_hat_list, nllr_list
+
+
 def nis_single(z_tilde, S):
     nis = z_tilde.dot(np.linalg.inv(S).dot(z_tilde.T))
     return nis
@@ -57,6 +145,12 @@ def predict(A, Q, x_0_list, P_0_list):
     assert Q.ndim == 2
     assert x_0_list.ndim == 2
     assert P_0_list.ndim == 3
+    if _kernels is not None:
+        x_bar_list = np.empty(x_0_list.shape)
+        P_bar_list = np.empty(P_0_list.shape)
+        _kernels.predict(_float64(A), _float64(Q), _float64(x_0_list), _float64(P_0_list),
+                         x_bar_list, P_bar_list)
+        return x_bar_list, P_bar_list
     x_bar_list = A.dot(x_0_list.T).T
     P_bar_list = (np.matmul(np.matmul(A, P_0_list), A.T) + Q)
     assert x_bar_list.shape == x_0_list.shape, "x_bar ERROR"
@@ -87,20 +181,37 @@ def precalc(C, R, x_bar_list, P_bar_list):
     nObservableState = C.shape[0]
 
     z_hat_list = C.dot(x_bar_list.T).T
-    S_list = np.matmul(np.matmul(C, P_bar_list), C.T) + R
-    S_inv_list = np.linalg.inv(S_list)
-    K_list = np.matmul(np.matmul(P_bar_list, C.T), S_inv_list)
-    P_hat_list = P_bar_list - np.matmul(K_list.dot(C), P_bar_list)
+    S_list, S_inv_list, K_list, P_hat_list = precalcCovariance(C, R, P_bar_list)
 
     assert z_hat_list.shape == (nMeasurement, nObservableState), "z_hat ERROR"
     assert S_list.shape == (nMeasurement, nObservableState, nObservableState), "S ERROR"
-    assert S_inv_list.shape == S_list.shape, "S_inv ERROR"
     assert K_list.shape == (nMeasurement, nStates, nObservableState)
     assert P_hat_list.shape == P_bar_list.shape, "P_hat ERROR"
 
     return z_hat_list, S_list, S_inv_list, K_list, P_hat_list
 
 
+def precalcCovariance(C, R, P_bar_list):
+    """
+    The state independent part of precalc
+    """
+    if _kernels is not None and C.shape[0] == 2 and P_bar_list.ndim == 3:
+        nCovariances, nStates, _ = P_bar_list.shape
+        S_list = np.empty((nCovariances, 2, 2))
+        S_inv_list = np.empty((nCovariances, 2, 2))
+        K_list = np.empty((nCovariances, nStates, 2))
+        P_hat_list = np.empty(P_bar_list.shape)
+        _kernels.precalcCovariance(_float64(C), _float64(R), _float64(P_bar_list),
+                                   S_list, S_inv_list, K_list, P_hat_list)
+        return S_list, S_inv_list, K_list, P_hat_list
+    S_list = np.matmul(np.matmul(C, P_bar_list), C.T) + R
+    S_inv_list = np.linalg.inv(S_list)
+    K_list = np.matmul(np.matmul(P_bar_list, C.T), S_inv_list)
+    P_hat_list = P_bar_list - np.matmul(K_list.dot(C), P_bar_list)
+    assert S_inv_list.shape == S_list.shape, "S_inv ERROR"
+    return S_list, S_inv_list, K_list, P_hat_list
+
+
 class KalmanFilter():
     """
     A Kalman filterUnused class, does filtering for systems of the type:
@@ -202,3 +313,48 @@ class KalmanFilter():
         else:
             raise ValueError("Invalid number of arguments")
         return KalmanFilter(x_hat, P_hat, self.A, self.C, self.Q, self.R)
+
+
+def rtsSmoother(z, mask, x_0, P_0, A, Q, C, R):
+    """
+    Rauch-Tung-Striebel smoother for a batch of tracks with a common model.
+    z       (nTracks, nSteps, nObs) measurements
+    mask    (nTracks, nSteps) True where the measurement is valid. Missed
+            detections and padding after the end of a track are masked.
+    x_0     (nTracks, nStates) prior state at the first step
+    P_0     (nTracks, nStates, nStates) or (nStates, nStates) prior covariance
+    Returns the smoothed states and covariances, (nTracks, nSteps, nStates)
+    and (nTracks, nSteps, nStates, nStates).
+    """
+    nTracks, nSteps, nObs = z.shape
+    nStates = A.shape[0]
+    assert mask.shape == (nTracks, nSteps), str(mask.shape)
+    assert x_0.shape == (nTracks, nStates), str(x_0.shape)
+    x_bar = np.empty((nTracks, nSteps, nStates))
+    P_bar = np.empty((nTracks, nSteps, nStates, nStates))
+    x_hat = np.empty_like(x_bar)
+    P_hat = np.empty_like(P_bar)
+
+    x_bar[:, 0] = x_0
+    P_bar[:, 0] = P_0
+    for k in range(nSteps):
+        if k > 0:
+            x_bar[:, k] = x_hat[:, k - 1].dot(A.T)
+            P_bar[:, k] = np.matmul(np.matmul(A, P_hat[:, k - 1]), A.T) + Q
+        valid = mask[:, k]
+        S = np.matmul(np.matmul(C, P_bar[:, k]), C.T) + R
+        K = np.matmul(np.matmul(P_bar[:, k], C.T), np.linalg.inv(S))
+        z_tilde = np.where(valid[:, None], z[:, k] - x_bar[:, k].dot(C.T), 0.)
+        x_hat[:, k] = x_bar[:, k] + np.matmul(K, z_tilde[:, :, None])[:, :, 0]
+        P_hat[:, k] = np.where(valid[:, None, None],
+                               P_bar[:, k] - np.matmul(np.matmul(K, C), P_bar[:, k]),
+                               P_bar[:, k])
+
+    x_smooth = np.copy(x_hat)
+    P_smooth = np.copy(P_hat)
+    for k in range(nSteps - 2, -1, -1):
+        G = np.matmul(np.matmul(P_hat[:, k], A.T), np.linalg.inv(P_bar[:, k + 1]))
+        x_smooth[:, k] += np.matmul(G, (x_smooth[:, k + 1] - x_bar[:, k + 1])[:, :, None])[:, :, 0]
+        P_smooth[:, k] += np.matmul(np.matmul(G, P_smooth[:, k + 1] - P_bar[:, k + 1]),
+                                    np.swapaxes(G, 1, 2))
+    return x_smooth, P_smooth
@@ -0,0 +1,55 @@
+"""
+Integer measurement keys.
+
+A radar measurement (scanNumber, measurementNumber) or an AIS message
+(scanNumber, mmsi) is identified by one int64:
+
+    scanNumber << 32 | sensor << 31 | measurementNumber or mmsi
+
+Keys sort by scan, then radar before AIS, then number, so the keys of one
+scan and sensor are a contiguous range of a sorted key array.
+"""
+import numpy as np
+
+RADAR = 0
+AIS = 1
+
+_scanShift = 32
+_sensorShift = 31
+_valueMask = (1 << _sensorShift) - 1
+
+empty = np.zeros(0, dtype=np.int64)
+empty.flags.writeable = False
+
+
+def radarKey(scanNumber, measurementNumber):
+    return (int(scanNumber) << _scanShift) | int(measurementNumber)
+
+
+def aisKey(scanNumber, mmsi):
+    return (int(scanNumber) << _scanShift) | (AIS << _sensorShift) | int(mmsi)
+
+
+def decode(keys):
+    """
+    Returns the scan numbers, sensors and measurement numbers or MMSIs of the keys.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    return keys >> _scanShift, (keys >> _sensorShift) & 1, keys & _valueMask
+
+
+def toTuples(keys):
+    """
+    The keys as (scanNumber, measurementNumber) and (scanNumber, mmsi) tuples.
+    """
+    scanNumbers, _, values = decode(keys)
+    return list(zip(scanNumbers.tolist(), values.tolist()))
+
+
+def scanRange(keys, scanNumber, sensor):
+    """
+    The values of the keys of one scan and sensor in the sorted key array.
+    """
+    first = (int(scanNumber) << _scanShift) | (sensor << _sensorShift)
+    start, end = np.searchsorted(keys, [first, first + _valueMask + 1])
+    return keys[start:end] & _valueMask
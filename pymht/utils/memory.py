@@ -0,0 +1,174 @@
+"""
+Memory accounting for the tracker.
+
+The bytes held by the tracker structures are estimated from the objects and
+the numpy arrays among their attributes. An array shared by several objects,
+like the covariance shared by sibling nodes, is counted once per structure.
+The estimates leave out interpreter overhead such as small ints and floats,
+so they are lower bounds that show which structure grows.
+
+StageAllocations measures the net bytes allocated by each stage of a scan
+with tracemalloc. Tracing slows the tracker down considerably.
+
+Usage:
+    tracker = Tracker(..., memoryAccounting=True, traceAllocations=True,
+                      memoryLimits={'Trees': 200 * MB, 'Target': 10 * MB})
+    tracker.addMeasurementList(scanList, aisList)
+    tracker.getMemorySnapshot()
+"""
+import sys
+import logging
+import tracemalloc
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+
+structures = ['Trees', 'Scans', 'Ais', 'Terminated', 'Initiator']
+stages = ['Process', 'Cluster', 'Optim', 'DynN', 'Terminate', 'N-Prune', 'Init']
+
+
+def objectBytes(obj, seen):
+    """
+    Size of obj with its attribute dict, and of the arrays and lists among
+    its attributes. Arrays whose id is in seen are skipped, the others are
+    added to seen.
+    """
+    size = sys.getsizeof(obj)
+    attributes = getattr(obj, '__dict__', None)
+    if attributes is None:
+        return size
+    size += sys.getsizeof(attributes)
+    for value in attributes.values():
+        if isinstance(value, np.ndarray):
+            if id(value) not in seen:
+                seen.add(id(value))
+                size += sys.getsizeof(value) + (value.nbytes if value.base is not None else 0)
+        elif isinstance(value, (list, tuple, dict)):
+            size += sys.getsizeof(value)
+    return size
+
+
+def treeBytes(node):
+    """
+    Size of the hypothesis tree of node, including the pruned history above
+    its root.
+    """
+    while node.parent is not None:
+        node = node.parent
+    seen = set()
+    size = 0
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        size += objectBytes(node, seen)
+        if node.trackHypotheses is not None:
+            nodes.extend(node.trackHypotheses)
+    return size
+
+
+def listBytes(objects):
+    seen = set()
+    size = objectBytes(objects, seen) + sum(objectBytes(obj, seen) for obj in objects)
+    columns = getattr(objects, '_columns', None)
+    if columns is not None:
+        size += objectBytes(columns, seen)
+    return size
+
+
+def aisListBytes(aisList):
+    return listBytes(aisList) if aisList is not None else 0
+
+
+class HistoryUsage():
+    """
+    Running totals of the bytes held by the lists that only grow: the scan
+    and AIS history and the terminated targets. Their entries do not change
+    once appended, so only the entries added since the last call are
+    measured. A list that was replaced or shortened, as by a snapshot
+    restore, is measured again.
+    """
+
+    def __init__(self):
+        self._totals = {}
+
+    def total(self, name, objects, measure):
+        objectList, count, total = self._totals.get(name, (None, 0, 0))
+        if objectList is not objects or count > len(objects):
+            count, total = 0, 0
+        total += sum(measure(obj) for obj in objects[count:])
+        self._totals[name] = (objects, len(objects), total)
+        return total
+
+
+def trackerUsage(tracker, historyUsage=None):
+    """
+    Estimated bytes held by each structure of the tracker, and by the tree
+    of each target by track ID. Without historyUsage the whole history is
+    measured.
+    """
+    historyUsage = historyUsage if historyUsage is not None else HistoryUsage()
+    targets = tracker.__targets__
+    targetUsage = {int(targets.trackNodes[slot].ID): treeBytes(targets.roots[slot])
+                   for slot in targets.slots}
+    usage = {'Trees': sum(targetUsage.values()),
+             'Scans': historyUsage.total('Scans', tracker.__scanHistory__,
+                                         lambda scanList: objectBytes(scanList, set())),
+             'Ais': historyUsage.total('Ais', tracker.__aisHistory__, aisListBytes),
+             'Terminated': historyUsage.total('Terminated', tracker.__terminatedTargets__, treeBytes),
+             'Initiator': (listBytes(tracker.initiator.preliminary_tracks) +
+                           listBytes(tracker.initiator.initiators))}
+    usage['Total'] = sum(usage.values())
+    return usage, targetUsage
+
+
+def checkLimits(usage, targetUsage, limits):
+    """
+    Logs a warning for every structure above its limit. The 'Target' limit
+    applies to the tree of each target.
+    """
+    for name, limit in limits.items():
+        if name == 'Target':
+            for trackId, size in targetUsage.items():
+                if size > limit:
+                    log.warning("Target %s holds %.1fMB, above the limit of %.1fMB",
+                                trackId, size / MB, limit / MB)
+        elif usage[name] > limit:
+            log.warning("%s holds %.1fMB, above the limit of %.1fMB", name, usage[name] / MB, limit / MB)
+
+
+class StageAllocations():
+    """
+    Net bytes allocated by each stage, from the traced memory at mark() to
+    the traced memory at record(stage). Starts tracemalloc if it is not
+    tracing.
+    """
+
+    def __init__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.allocations = {}
+        self._traced = 0
+
+    def reset(self):
+        self.allocations = {}
+        self.mark()
+
+    def mark(self):
+        self._traced = tracemalloc.get_traced_memory()[0]
+
+    def record(self, stage):
+        traced = tracemalloc.get_traced_memory()[0]
+        self.allocations[stage] = self.allocations.get(stage, 0) + traced - self._traced
+        self._traced = traced
+
+    @staticmethod
+    def topAllocations(limit=10):
+        """
+        The limit source lines holding the most traced memory, as
+        (file:line, bytes).
+        """
+        statistics = tracemalloc.take_snapshot().statistics('lineno')[:limit]
+        return [('{0:}:{1:}'.format(s.traceback[0].filename, s.traceback[0].lineno), s.size)
+                for s in statistics]
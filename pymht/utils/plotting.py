@@ -0,0 +1,285 @@
+"""
+Plotting functions for pyMHT objects.
+
+This module imports matplotlib at module level and should only be imported
+from the plot* methods of the tracker classes, so that importing the tracker
+does not initialize a GUI backend.
+"""
+import numpy as np
+import matplotlib.pyplot as plt
+from .classDefinitions import Position
+from . import helpFunctions as hpf
+
+# ----------------------------------------------------------------------------
+# classDefinitions
+# ----------------------------------------------------------------------------
+
+
+def plotPosition(position, ax=None, measurementNumber=-1, scanNumber=None, mmsi=None, **kwargs):
+    ax = ax if ax is not None else plt.gca()
+    if mmsi is not None:
+        marker = 'h' if kwargs.get('original', False) else 'D'
+        ax.plot(position.array[0], position.array[1],
+                marker=marker, markerfacecolor='None',
+                markeredgewidth=kwargs.get('markeredgewidth', 1),
+                markeredgecolor=kwargs.get('color', 'black'))
+    elif measurementNumber > 0:
+        ax.plot(position.array[0], position.array[1], 'kx',
+                markeredgecolor=kwargs.get('color', 'black'))
+    elif measurementNumber == 0:
+        ax.plot(position.array[0], position.array[1], fillstyle="none", marker="o",
+                markeredgecolor=kwargs.get('color', 'black'))
+    else:
+        raise ValueError("Not a valid measurement number")
+
+    if ((scanNumber is not None) and
+            (measurementNumber is not None) and
+            kwargs.get("labels", False)):
+        ax.text(position.array[0], position.array[1], str(
+            scanNumber) + ":" + str(measurementNumber), size=7, ha="left", va="top")
+
+
+def plotAisMessage(aisMessage, **kwargs):
+    plotPosition(Position(aisMessage.state[0:2]), mmsi=aisMessage.mmsi, original=True, **kwargs)
+
+
+def plotMeasurementList(measurementList, ax=None, **kwargs):
+    for measurementIndex, measurement in enumerate(measurementList.measurements):
+        plotPosition(Position(measurement), ax, measurementIndex + 1, **kwargs)
+
+
+def plotAisMessageList(aisMessageList, **kwargs):
+    for measurement in aisMessageList:
+        plotAisMessage(measurement, **kwargs)
+
+
+def plotScanList(scanList, ax=None, **kwargs):
+    for measurementList in scanList:
+        plotMeasurementList(measurementList, ax, **kwargs)
+
+
+def plotScanListFast(scanList, ax=None, **kwargs):
+    ax = ax if ax is not None else plt.gca()
+    for measurementList in scanList:
+        measurementArray = np.array(measurementList.measurements, ndmin=2)
+        assert measurementArray.ndim == 2
+        assert measurementArray.shape[1] == 2
+        ax.plot(measurementArray[:, 0], measurementArray[:, 1], '.', color='black', **kwargs)
+
+# ----------------------------------------------------------------------------
+# pyTarget
+# ----------------------------------------------------------------------------
+
+
+def plotValidationRegion(target, eta2, stepsBack=0):
+    if not hasattr(target, 'kalmanFilter'):
+        raise NotImplementedError("plotValidationRegion is not functional in this version")
+    if target.kalmanFilter.S is not None:
+        plotCovarianceEllipse(target, eta2)
+    if (target.parent is not None) and (stepsBack > 0):
+        plotValidationRegion(target.parent, eta2, stepsBack - 1)
+
+
+def plotCovarianceEllipse(target, eta2):
+    from matplotlib.patches import Ellipse
+    lambda_, _ = np.linalg.eig(target.kalmanFilter.S)
+    ell = Ellipse(xy=(target.kalmanFilter.x_bar[0], target.kalmanFilter.x_bar[1]),
+                  width=np.sqrt(lambda_[0]) * np.sqrt(eta2) * 2,
+                  height=np.sqrt(lambda_[1]) * np.sqrt(eta2) * 2,
+                  angle=np.rad2deg(np.arctan2(lambda_[1], lambda_[0])),
+                  linewidth=2,
+                  )
+    ell.set_facecolor('none')
+    ell.set_linestyle("dotted")
+    ell.set_alpha(0.5)
+    ax = plt.subplot(111)
+    ax.add_artist(ell)
+
+
+def plotTrack(target, root=None, stepsBack=float('inf'), **kwargs):
+    if kwargs.get('markInitial', False) and stepsBack == float('inf'):
+        markInitial(target.getInitial(), **kwargs)
+    if kwargs.get('markID', True):
+        markID(target.getInitial(), offset=20, **kwargs)
+    if kwargs.get('markRoot', False) and root is not None:
+        markRoot(root)
+    if kwargs.get('markEnd', True):
+        markEnd(target, **kwargs)
+    if kwargs.get('smooth', False) and target.getInitial().depth() > 1:
+        radarPeriod = kwargs.get('radarPeriod', target._estimateRadarPeriod())
+        track, _, smoothingGood = target.getSmoothTrack(radarPeriod)
+        linestyle = 'dashed'
+        if not smoothingGood:
+            return
+    else:
+        track = target.backtrackPosition(stepsBack)
+        linestyle = 'solid'
+    plt.plot([p[0] for p in track],
+             [p[1] for p in track],
+             c=kwargs.get('c'),
+             linestyle=linestyle)
+
+
+def plotMeasurement(target, stepsBack=0, **kwargs):
+    if (target.measurement is not None) and kwargs.get('real', True):
+        plotPosition(Position(target.measurement),
+                     measurementNumber=target.measurementNumber,
+                     scanNumber=target.scanNumber,
+                     **kwargs)
+    if kwargs.get("dummy", False):
+        plotPosition(target.getPosition(),
+                     measurementNumber=target.measurementNumber,
+                     scanNumber=target.scanNumber,
+                     **kwargs)
+
+    if (target.parent is not None) and (stepsBack > 0):
+        plotMeasurement(target.parent, stepsBack - 1, **kwargs)
+
+
+def plotStates(target, stepsBack=0, **kwargs):
+    if (target.mmsi is not None) and kwargs.get('ais', True):
+        plotPosition(Position(target.x_0),
+                     measurementNumber=target.measurementNumber,
+                     scanNumber=target.scanNumber,
+                     mmsi=target.mmsi,
+                     **kwargs)
+    elif (target.measurementNumber is not None) and (target.measurementNumber == 0) and kwargs.get("dummy", True):
+        plotPosition(Position(target.x_0),
+                     measurementNumber=target.measurementNumber,
+                     scanNumber=target.scanNumber,
+                     **kwargs)
+    elif (target.measurementNumber is not None) and (target.measurementNumber > 0) and kwargs.get('real', True):
+        plotPosition(Position(target.x_0),
+                     measurementNumber=target.measurementNumber,
+                     scanNumber=target.scanNumber,
+                     **kwargs)
+    if (target.parent is not None) and (stepsBack > 0):
+        plotStates(target.parent, stepsBack - 1, **kwargs)
+
+
+def plotVelocityArrow(target, stepsBack=1):
+    if target.kalmanFilter.x_bar is not None:
+        ax = plt.subplot(111)
+        deltaPos = target.kalmanFilter.x_bar[0:2] - target.kalmanFilter.x_hat[0:2]
+        ax.arrow(target.kalmanFilter.x_hat[0],
+                 target.kalmanFilter.x_hat[1],
+                 deltaPos[0],
+                 deltaPos[1],
+                 head_width=0.1,
+                 head_length=0.1,
+                 fc="None", ec='k',
+                 length_includes_head="true",
+                 linestyle="-",
+                 alpha=0.3,
+                 linewidth=1)
+    if (target.parent is not None) and (stepsBack > 0):
+        plotVelocityArrow(target.parent, stepsBack - 1)
+
+
+def markInitial(target, **kwargs):
+    plt.plot(target.x_0[0],
+             target.x_0[1],
+             "*",
+             markerfacecolor='black',
+             markeredgecolor='black')
+
+
+def markID(target, **kwargs):
+    index = target.ID
+    if (index is not None):
+        ax = plt.subplot(111)
+        normVelocity = (target.x_0[2:4] /
+                        np.linalg.norm(target.x_0[2:4]))
+        offsetScale = kwargs.get('offset', 0.0)
+        offset = offsetScale * np.array(normVelocity)
+        position = target.x_0[0:2] - offset
+        (horizontalalignment,
+         verticalalignment) = hpf._getBestTextPosition(normVelocity)
+        ax.text(position[0],
+                position[1],
+                "T" + str(index),
+                fontsize=10,
+                horizontalalignment=horizontalalignment,
+                verticalalignment=verticalalignment)
+
+
+def markRoot(target):
+    plt.plot(target.x_0[0],
+             target.x_0[1],
+             's',
+             markerfacecolor='None',
+             markeredgecolor='black')
+
+
+def markEnd(target, **kwargs):
+    plt.plot(target.x_0[0],
+             target.x_0[1],
+             "H",
+             markerfacecolor='None',
+             markeredgecolor='black')
+    if kwargs.get('terminated', False):
+        plt.plot(target.x_0[0],
+                 target.x_0[1],
+                 "*",
+                 markeredgecolor='red')
+
+
+def recDownPlotMeasurements(target, plottedMeasurements, **kwargs):
+    if target.parent is not None:
+        if target.measurementNumber == 0:
+            plotMeasurement(target, **kwargs)
+        else:
+            if kwargs.get('real', True):
+                measurementID = (target.scanNumber, target.measurementNumber)
+                if measurementID not in plottedMeasurements:
+                    plotMeasurement(target, **kwargs)
+                    plottedMeasurements.add(measurementID)
+    if target.trackHypotheses is not None:
+        for hyp in target.trackHypotheses:
+            recDownPlotMeasurements(hyp, plottedMeasurements, **kwargs)
+
+
+def recDownPlotStates(target, **kwargs):
+    if target.parent is not None:
+        plotStates(target, **kwargs)
+    if target.trackHypotheses is not None:
+        for hyp in target.trackHypotheses:
+            recDownPlotStates(hyp, **kwargs)
+
+# ----------------------------------------------------------------------------
+# tracker
+# ----------------------------------------------------------------------------
+
+
+def plotHypothesesTrack(tracker, **kwargs):
+    def recPlotHypothesesTrack(target, track=[], **kwargs):
+        newTrack = track[:] + [target.getPosition()]
+        if target.trackHypotheses is None:
+            plt.plot([p.x() for p in newTrack],
+                     [p.y() for p in newTrack],
+                     "--",
+                     **kwargs)
+        else:
+            for hyp in target.trackHypotheses:
+                recPlotHypothesesTrack(hyp, newTrack, **kwargs)
+
+    colors = kwargs.get("colors", tracker._getColorCycle())
+    for target in tracker.__targetList__:
+        recPlotHypothesesTrack(target, c=next(colors))
+    if kwargs.get('markStates', False):
+        defaults = {'dummy': True, 'real': True, 'ais': True,
+                    'includeHistory': False, 'color': 'red'}
+        tracker.plotStatesFromRoot(**{**defaults, **kwargs})
+
+
+def plotInitialTargets(tracker, **kwargs):
+    initialTargets = [target.getInitial() for target in tracker.__targetList__]
+    fig = plt.gcf()
+    size = fig.get_size_inches() * fig.dpi
+    for i, initialTarget in enumerate(initialTargets):
+        index = kwargs.get("index", list(range(len(initialTargets))))
+        offset = 0.05 * size
+        if len(index) != len(initialTargets):
+            raise ValueError(
+                "plotInitialTargets: Need equal number of targets and indices")
+        markInitial(initialTarget, index=index[i], offset=offset)
@@ -0,0 +1,162 @@
+"""
+Profiles of slow scans.
+
+While a scan is processed, a background thread samples the call stack of the
+tracker thread every interval seconds. A sample costs a walk over the stack,
+so the profile of every scan can be taken and only the slow ones are kept.
+
+A slow scan is written to its own directory slowscan-<time>-<scan number>
+under the profile directory, and only the newest directories are kept:
+
+    profile.folded  sampled stacks, one 'outer;...;inner count' line per stack,
+                    for flame graph tools
+    scan.npz        the radar measurements and AIS messages of the scan
+    info.json       scan number, radar period, stage timings and the scalar
+                    arguments of addMeasurementList
+    state.snp       with profileState, the tracker snapshot from before the scan
+
+Usage:
+    tracker = Tracker(..., profileDirectory='profiles', profileState=True)
+    ...
+    # Offline, with a tracker created with the same arguments
+    replayCapture('profiles/slowscan-20170601-120000-000042', Tracker(...))
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import threading
+import collections
+import numpy as np
+from .classDefinitions import MeasurementList, AisMessageList, AIS_message
+
+log = logging.getLogger(__name__)
+
+capturePrefix = 'slowscan-'
+
+
+class SamplingProfiler():
+    """
+    Counts the call stacks of one thread, sampled by a background thread.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._threadId = None
+        self._thread = None
+        self._stopEvent = threading.Event()
+
+    def start(self, threadId=None):
+        if self._thread is not None:
+            self.stop()
+        self.stacks = collections.Counter()
+        self._threadId = threadId if threadId is not None else threading.get_ident()
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._sample, name='pymht-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        self._thread.join()
+        self._thread = None
+        return self.stacks
+
+    def _sample(self):
+        while not self._stopEvent.wait(self.interval):
+            frame = sys._current_frames().get(self._threadId)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{0:}:{1:}'.format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            del frame
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join('{0:} {1:}\n'.format(';'.join(stack), count)
+                       for stack, count in self.stacks.most_common())
+
+
+def _scalarArguments(kwargs):
+    return {k: v for k, v in kwargs.items() if isinstance(v, (bool, int, float, str))}
+
+
+def writeCapture(directory, scanNumber, profiler, scanList, aisList, info, state=None):
+    """
+    Writes the capture of a slow scan and returns its directory.
+    """
+    path = os.path.join(directory, '{0:}{1:}-{2:06d}'.format(
+        capturePrefix, time.strftime('%Y%m%d-%H%M%S'), scanNumber))
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'profile.folded'), 'w') as f:
+        f.write(profiler.folded())
+    aisColumns = (aisList if aisList is not None else AisMessageList()).getColumns()
+    np.savez(os.path.join(path, 'scan.npz'),
+             time=np.float64(scanList.time),
+             measurements=np.asarray(scanList.measurements),
+             aisPresent=aisList is not None,
+             aisTime=aisColumns.time,
+             aisState=aisColumns.state,
+             aisMmsi=aisColumns.mmsi,
+             aisHighAccuracy=aisColumns.highAccuracy)
+    with open(os.path.join(path, 'info.json'), 'w') as f:
+        json.dump(dict(info, scanNumber=scanNumber, kwargs=_scalarArguments(info.get('kwargs', {}))),
+                  f, indent=1, sort_keys=True)
+    if state is not None:
+        with open(os.path.join(path, 'state.snp'), 'wb') as f:
+            f.write(state)
+    return path
+
+
+def rotate(directory, keep):
+    """
+    Removes all but the keep newest captures in directory.
+    """
+    captures = sorted(name for name in os.listdir(directory) if name.startswith(capturePrefix))
+    for name in captures[:max(0, len(captures) - keep)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def loadCapture(path):
+    """
+    Returns a dict with the scanList, aisList, info, kwargs, state (None if
+    not captured) and profile of a capture.
+    """
+    with np.load(os.path.join(path, 'scan.npz')) as scan:
+        scanList = MeasurementList(float(scan['time']), scan['measurements'])
+        aisList = None
+        if scan['aisPresent']:
+            aisList = AisMessageList([AIS_message(float(t), state, int(mmsi) if mmsi != -1 else None, bool(highAccuracy))
+                                      for t, state, mmsi, highAccuracy in zip(scan['aisTime'], scan['aisState'],
+                                                                              scan['aisMmsi'], scan['aisHighAccuracy'])])
+    with open(os.path.join(path, 'info.json')) as f:
+        info = json.load(f)
+    with open(os.path.join(path, 'profile.folded')) as f:
+        profile = f.read()
+    state = None
+    if os.path.exists(os.path.join(path, 'state.snp')):
+        with open(os.path.join(path, 'state.snp'), 'rb') as f:
+            state = f.read()
+    return {'scanList': scanList,
+            'aisList': aisList,
+            'info': info,
+            'kwargs': info['kwargs'],
+            'state': state,
+            'profile': profile}
+
+
+def replayCapture(path, tracker):
+    """
+    Restores the state of the capture, if any, into tracker and runs the
+    captured scan. The tracker must be created with the same arguments as
+    the one that captured it.
+    """
+    capture = loadCapture(path)
+    if capture['state'] is not None:
+        tracker.restore(capture['state'])
+    tracker.addMeasurementList(capture['scanList'], capture['aisList'], **capture['kwargs'])
+    return tracker
@@ -0,0 +1,244 @@
+"""
+Binary format for recorded radar scans and AIS messages.
+
+File layout (little endian, all sections 8 byte aligned):
+    header                  _headerDtype
+    one record per scan:
+        scan header         _scanDtype (time, nMeasurements, nAis)
+        measurements        float32[nMeasurements, 2]
+        AIS time            float64[nAis]
+        AIS state           float64[nAis, stateDim]
+        AIS MMSI            int64[nAis]          (-1 if unknown)
+        AIS high accuracy   uint8[nAis]
+
+Every record is written to disk as its scan is appended, so the writer holds
+no scan data in memory. The scan headers form the index. The counts in the
+file header are written on close, a file that was never closed is read up
+to its last complete record. The reader memory-maps the file and returns
+MeasurementList objects whose measurement arrays are read-only views into the
+map, so long recordings can be replayed without loading them into memory.
+
+Usage:
+    with ScanFileWriter(path) as writer:
+        for scan in scanList:
+            writer.append(scan, aisList.getMeasurements(scan.time))
+
+    with ScanFileReader(path) as reader:
+        for scan, aisList in reader:
+            tracker.addMeasurementList(scan, aisList)
+"""
+import logging
+import numpy as np
+from .classDefinitions import MeasurementList, AisMessageList, AIS_message
+from ..models.constants import nObsDim_AIS
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'PYMHTSCN'
+VERSION = 2
+
+_headerDtype = np.dtype([('magic', 'S8'),
+                         ('version', '<u4'),
+                         ('stateDim', '<u4'),
+                         ('nScans', '<i8'),
+                         ('nMeasurements', '<i8'),
+                         ('nAis', '<i8'),
+                         ('closed', '<i8')])
+_scanDtype = np.dtype([('time', '<f8'),
+                       ('nMeasurements', '<i8'),
+                       ('nAis', '<i8')])
+_measurementDtype = np.dtype('<f4')
+_noMmsi = -1
+
+
+def _padding(size):
+    return (-size) % 8
+
+
+def _aisColumns(stateDim, nAis):
+    return [('aisTime', np.dtype('<f8'), (nAis,)),
+            ('aisState', np.dtype('<f8'), (nAis, stateDim)),
+            ('aisMmsi', np.dtype('<i8'), (nAis,)),
+            ('aisHighAccuracy', np.dtype('<u1'), (nAis,))]
+
+
+def _recordSize(stateDim, nMeasurements, nAis):
+    size = _scanDtype.itemsize + nMeasurements * 2 * _measurementDtype.itemsize
+    size += sum(int(np.prod(shape)) * dtype.itemsize for _, dtype, shape in _aisColumns(stateDim, nAis))
+    return size + _padding(size)
+
+
+class ScanFileWriter():
+    def __init__(self, path, stateDim=nObsDim_AIS):
+        self.path = path
+        self.stateDim = stateDim
+        self._file = open(path, 'wb')
+        self._file.write(self._getHeader(closed=False).tobytes())
+        self._file.write(b'\0' * _padding(_headerDtype.itemsize))
+        self._nScans = 0
+        self._nMeasurements = 0
+        self._nAis = 0
+        self._lastTime = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._nScans
+
+    def _getHeader(self, closed):
+        header = np.zeros(1, dtype=_headerDtype)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['stateDim'] = self.stateDim
+        if closed:
+            header['nScans'] = self._nScans
+            header['nMeasurements'] = self._nMeasurements
+            header['nAis'] = self._nAis
+            header['closed'] = 1
+        return header
+
+    def append(self, measurementList, aisMessageList=None):
+        assert self._file is not None, "File is closed"
+        if self._lastTime is not None:
+            assert measurementList.time >= self._lastTime, "Scans must be appended in time order"
+        measurements = np.asarray(measurementList.measurements, dtype=_measurementDtype)
+        measurements = measurements.reshape((-1, 2))
+        aisMessageList = aisMessageList if aisMessageList is not None else []
+        nAis = len(aisMessageList)
+        aisState = np.zeros((nAis, self.stateDim), dtype='<f8')
+        for i, message in enumerate(aisMessageList):
+            state = np.asarray(message.state, dtype=np.float64)
+            assert state.shape == (self.stateDim,), str(state.shape)
+            aisState[i] = state
+        sections = [np.array([(measurementList.time, measurements.shape[0], nAis)], dtype=_scanDtype),
+                    np.ascontiguousarray(measurements),
+                    np.array([m.time for m in aisMessageList], dtype='<f8'),
+                    aisState,
+                    np.array([int(m.mmsi) if m.mmsi is not None else _noMmsi for m in aisMessageList],
+                             dtype='<i8'),
+                    np.array([bool(m.highAccuracy) for m in aisMessageList], dtype='<u1')]
+        data = b''.join(section.tobytes() for section in sections)
+        self._file.write(data + b'\0' * _padding(len(data)))
+        self._lastTime = float(measurementList.time)
+        self._nScans += 1
+        self._nMeasurements += measurements.shape[0]
+        self._nAis += nAis
+
+    def flush(self):
+        """
+        Flushes the appended scans to disk, where a reader finds them even
+        if the writer is never closed.
+        """
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.write(self._getHeader(closed=True).tobytes())
+        self._file.close()
+        self._file = None
+
+
+class ScanFileReader():
+    def __init__(self, path):
+        self.path = path
+        self._buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        if self._buffer.size < _headerDtype.itemsize:
+            raise ValueError("Not a pyMHT scan file: " + str(path))
+        header = self._buffer[:_headerDtype.itemsize].view(_headerDtype)[0]
+        if header['magic'] != MAGIC:
+            raise ValueError("Not a pyMHT scan file: " + str(path))
+        if header['version'] != VERSION:
+            raise ValueError("Unsupported scan file version " + str(header['version']))
+        self.stateDim = int(header['stateDim'])
+
+        offsets = []
+        times = []
+        offset = _headerDtype.itemsize + _padding(_headerDtype.itemsize)
+        while offset + _scanDtype.itemsize <= self._buffer.size:
+            scanHeader = self._buffer[offset:offset + _scanDtype.itemsize].view(_scanDtype)[0]
+            size = _recordSize(self.stateDim, int(scanHeader['nMeasurements']), int(scanHeader['nAis']))
+            if offset + size > self._buffer.size:
+                break
+            offsets.append(offset)
+            times.append(scanHeader['time'])
+            offset += size
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self.times = np.array(times, dtype=np.float64)
+        if not header['closed']:
+            log.warning("Scan file %s was not closed, read %s complete scans", path, len(offsets))
+        elif header['nScans'] != len(offsets):
+            raise ValueError("Corrupt scan file {0:}, {1:} of {2:} scans".format(
+                path, len(offsets), header['nScans']))
+
+    def _getScanHeader(self, index):
+        offset = self._offsets[index]
+        return self._buffer[offset:offset + _scanDtype.itemsize].view(_scanDtype)[0]
+
+    def _section(self, offset, dtype, shape):
+        nBytes = int(np.prod(shape)) * dtype.itemsize
+        return self._buffer[offset:offset + nBytes].view(dtype).reshape(shape), offset + nBytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.times.size
+
+    def __getitem__(self, index):
+        return self.getScan(index), self.getAisMessages(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def _getMeasurements(self, index):
+        scanHeader = self._getScanHeader(index)
+        return self._section(self._offsets[index] + _scanDtype.itemsize, _measurementDtype,
+                             (int(scanHeader['nMeasurements']), 2))
+
+    def getScan(self, index):
+        measurements, _ = self._getMeasurements(index)
+        return MeasurementList(float(self.times[index]), measurements)
+
+    def getAisMessages(self, index):
+        _, offset = self._getMeasurements(index)
+        nAis = int(self._getScanHeader(index)['nAis'])
+        columns = {}
+        for name, dtype, shape in _aisColumns(self.stateDim, nAis):
+            columns[name], offset = self._section(offset, dtype, shape)
+        return AisMessageList([AIS_message(time=float(columns['aisTime'][i]),
+                                           state=columns['aisState'][i],
+                                           mmsi=(int(columns['aisMmsi'][i])
+                                                 if columns['aisMmsi'][i] != _noMmsi else None),
+                                           highAccuracy=bool(columns['aisHighAccuracy'][i]))
+                               for i in range(nAis)])
+
+    def close(self):
+        """
+        Drops the reader's references to the memory map. Lists already returned
+        keep the map alive for as long as they are referenced.
+        """
+        self._buffer = None
+        self._offsets = None
+        self.times = None
+
+
+def writeScanFile(path, scanList, aisMessagesList=None):
+    """
+    Writes a ScanList and the AIS messages that AisMessagesList.getMeasurements
+    hands out at each scan time. Note that this consumes aisMessagesList.
+    """
+    with ScanFileWriter(path) as writer:
+        for scan in scanList:
+            aisList = (aisMessagesList.getMeasurements(scan.time)
+                       if aisMessagesList is not None else None)
+            writer.append(scan, aisList)
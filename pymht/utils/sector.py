@@ -0,0 +1,104 @@
+"""
+Azimuth sectors for processing a rotating radar scan in parts.
+
+Azimuths are in radians in [0, 2pi), clockwise from north (the y axis) as seen
+from the radar position. A sector (start, end) covers the azimuths from start
+clockwise to end and may wrap through north; (0, 2pi) is the full circle.
+Coverage is kept as a sorted list of disjoint [start, end] intervals that do
+not wrap.
+
+Sector edges computed by different float operations, like northOffset + 2pi
+taken modulo 2pi, differ in the last bits. Edges closer than tolerance are
+treated as the same edge, so the sectors of a scan join into the full circle.
+"""
+import numpy as np
+
+TWO_PI = 2 * np.pi
+tolerance = 1e-9
+
+
+def azimuth(positions, origin):
+    delta = np.array(positions, ndmin=2)[:, 0:2] - origin
+    return np.mod(np.arctan2(delta[:, 0], delta[:, 1]), TWO_PI)
+
+
+def splitSector(start, end):
+    """
+    Returns the sector as at most two intervals that do not wrap.
+    """
+    if end - start >= TWO_PI - tolerance:
+        return [(0., TWO_PI)]
+    start = np.mod(start, TWO_PI)
+    end = np.mod(end, TWO_PI)
+    if start >= TWO_PI - tolerance:
+        start = 0.
+    if end <= tolerance:
+        end = TWO_PI
+    if start < end:
+        return [(start, end)]
+    return [(0., end), (start, TWO_PI)]
+
+
+def addCoverage(coverage, *sectors):
+    intervals = sorted(coverage + [interval for sector in sectors for interval in splitSector(*sector)])
+    merged = [list(intervals[0])]
+    for start, end in intervals[1:]:
+        if start <= merged[-1][1] + tolerance:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def isCovered(coverage, sector):
+    return all(any(start >= coverStart - tolerance and end <= coverEnd + tolerance
+                   for coverStart, coverEnd in coverage)
+               for start, end in splitSector(*sector))
+
+
+def isComplete(coverage):
+    return isCovered(coverage, (0., TWO_PI))
+
+
+def inSector(azimuths, sector):
+    """
+    True for the azimuths in the sector or within tolerance of its edges.
+    """
+    return np.logical_or.reduce([(azimuths >= start - tolerance) & (azimuths < end + tolerance)
+                                 for start, end in splitSector(*sector)])
+
+
+def sectorIndices(azimuths, nSectors, northOffset=0.):
+    """
+    Index of the sector holding each azimuth, of nSectors equal sectors in
+    the order of rotation starting at northOffset.
+    """
+    indices = np.floor(np.mod(azimuths - northOffset, TWO_PI) / (TWO_PI / nSectors)).astype(int)
+    return np.minimum(indices, nSectors - 1)
+
+
+def discSector(center, radius, origin):
+    """
+    Smallest sector that holds the disc, the full circle if the disc covers
+    the origin.
+    """
+    distance = np.linalg.norm(np.asarray(center) - origin)
+    if distance <= radius:
+        return (0., TWO_PI)
+    centerAzimuth = azimuth(center, origin)[0]
+    halfWidth = np.arcsin(radius / distance)
+    return (centerAzimuth - halfWidth, centerAzimuth + halfWidth)
+
+
+def spanSectors(sectors):
+    """
+    Smallest sector that holds all the sectors.
+    """
+    coverage = addCoverage([], *sectors)
+    if isComplete(coverage):
+        return (0., TWO_PI)
+    # The largest gap between covered intervals, including the wrap, is outside
+    gaps = [(coverage[i][1], coverage[i + 1][0]) for i in range(len(coverage) - 1)]
+    gaps.append((coverage[-1][1], coverage[0][0] + TWO_PI))
+    gapStart, gapEnd = max(gaps, key=lambda gap: gap[1] - gap[0])
+    return (gapEnd, gapStart + TWO_PI)
@@ -17,22 +17,24 @@ def seed_simulator(seed):
 
 def generateInitialTargets(numOfTargets, centerPosition,
                            radarRange, P_d, sigma_Q, **kwargs):
+    rng = kwargs.get('rng', np.random)
+    randint = rng.integers if hasattr(rng, 'integers') else rng.randint
     usedMMSI = []
-    initialTime = time.time()
+    initialTime = kwargs.get('initialTime', time.time())
     initialList = []
     speeds = np.array([1, 10, 12, 15, 28, 35], dtype=np.float32) * 0.5  # ~knots to m/s
     for targetIndex in range(numOfTargets):
-        heading = np.random.uniform(0, 360)
-        distance = np.random.uniform(0, radarRange * 0.8)
+        heading = rng.uniform(0, 360)
+        distance = rng.uniform(0, radarRange * 0.8)
         px, py = _pol2cart(heading, distance)
         px += centerPosition[0]
         py += centerPosition[1]
-        heading = np.random.uniform(0, 360)
-        speed = np.random.choice(speeds)
+        heading = rng.uniform(0, 360)
+        speed = rng.choice(speeds)
         vx, vy = _pol2cart(heading, speed)
         if kwargs.get('assignMMSI',False):
             while True:
-                mmsi = np.random.randint(100000000,999999999)
+                mmsi = int(randint(100000000,999999999))
                 if mmsi not in usedMMSI:
                     usedMMSI.append(mmsi)
                     break
@@ -109,7 +111,107 @@ def simulateScans(simList, radarPeriod, H, R, lambda_phi=0,
         scanList.append(copy.deepcopy(measurementList))
     return scanList
 
+def simulateTargetsArray(initialTargets, simTime, timeStep, model, **kwargs):
+    """
+    Array based version of simulateTargets for Cartesian targets. All targets
+    are propagated together with one batched noise draw per time step.
+    Returns the sample times (nSteps+1) and states (nSteps+1, nTargets, 4).
+    """
+    rng = kwargs.get('rng', np.random)
+    assert all([isinstance(initialTarget, SimTargetCartesian) for initialTarget in initialTargets])
+    assert checkEqualIvo([target.time for target in initialTargets])
+    nTimeSteps = int(np.ceil(simTime / timeStep))
+    nTargets = len(initialTargets)
+
+    times = np.empty(nTimeSteps + 1)
+    times[0] = initialTargets[0].time
+    for i in range(nTimeSteps):
+        times[i + 1] = times[i] + timeStep
+
+    Phi = model.Phi(timeStep)
+    # Q is linear in sigma_Q, so each target's noise is a scaled draw from Q(T, 1)
+    L = np.linalg.cholesky(model.Q(timeStep, 1.))
+    scale = np.sqrt(np.array([target.sigma_Q for target in initialTargets], dtype=np.double))
+    states = np.empty((nTimeSteps + 1, nTargets, 4))
+    states[0] = np.array([target.state for target in initialTargets], dtype=np.double).reshape(nTargets, 4)
+    for i in range(nTimeSteps):
+        w = rng.standard_normal((nTargets, 4)).dot(L.T) * scale[:, None]
+        states[i + 1] = states[i].dot(Phi.T) + w
+    return times, states
+
+def simListFromArray(initialTargets, times, states):
+    """
+    Builds a SimList (needed by simulateAIS and the ground truth export) from
+    the output of simulateTargetsArray.
+    """
+    simList = SimList()
+    simList.append(initialTargets)
+    for time, stateList in zip(times[1:], states[1:]):
+        simList.append([SimTargetCartesian(**{**target.__dict__, 'state': state, 'time': time})
+                        for target, state in zip(initialTargets, stateList)])
+    return simList
+
+def simulateScansArray(times, states, radarPeriod, H, R, lambda_phi=0,
+                       rRange=None, p0=None, P_d=None, **kwargs):
+    """
+    Array based version of simulateScans. Detections, local clutter and global
+    clutter for a scan are drawn in a few batched calls and the measurement
+    lists hold float32 arrays directly. The states carry no detection
+    probability, so P_d must be given, either one value for all targets or
+    the P_d of each target, like [target.P_d for target in initialTargets].
+    """
+    assert P_d is not None, "P_d is required"
+    rng = kwargs.get('rng', np.random)
+    includeInitialTime = not kwargs.get('preInitialized', False)
+    lClutter = kwargs.get('lambda_local', 1)
+    localClutter = kwargs.get('localClutter', True)
+    globalClutter = (all(e is not None for e in [rRange, p0]) and
+                     kwargs.get('globalClutter', True))
+    gClutter = lambda_phi * np.pi * np.power(rRange, 2) if globalClutter else 0.
+    nTargets = states.shape[1]
+    P_d = np.broadcast_to(np.asarray(P_d, dtype=np.double), (nTargets,))
+    L = np.linalg.cholesky(R)
+
+    scanIndices = []
+    lastScan = None
+    for i, simTime in enumerate(times):
+        if lastScan is None:
+            lastScan = simTime
+            if not includeInitialTime:
+                continue
+        elif simTime - lastScan >= radarPeriod:
+            lastScan = simTime
+        else:
+            continue
+        scanIndices.append(i)
+
+    scanList = ScanList()
+    for i in scanIndices:
+        targetStates = states[i]
+        visible = rng.uniform(size=nTargets) <= P_d
+        if (rRange is not None) and (p0 is not None):
+            visible &= np.linalg.norm(targetStates[:, 0:2] - p0, axis=1) <= rRange
+        positions = targetStates[visible].dot(H.T)
+        blocks = [positions + rng.standard_normal(positions.shape).dot(L.T)]
+        if localClutter:
+            nClutter = rng.poisson(lClutter, size=positions.shape[0])
+            clutterCenters = np.repeat(positions, nClutter, axis=0)
+            blocks.append(clutterCenters +
+                          3. * rng.standard_normal(clutterCenters.shape).dot(L.T))
+        if globalClutter:
+            nClutter = rng.poisson(gClutter)
+            radius = rRange * np.sqrt(rng.uniform(size=nClutter))
+            angle = rng.uniform(0., 2. * np.pi, size=nClutter)
+            blocks.append(np.column_stack((p0[0] + radius * np.cos(angle),
+                                           p0[1] + radius * np.sin(angle))))
+        measurements = np.concatenate(blocks).astype(np.float32)
+        if kwargs.get("shuffle", True):
+            measurements = measurements[rng.permutation(measurements.shape[0])]
+        scanList.append(MeasurementList(times[i], measurements))
+    return scanList
+
 def simulateAIS(sim_list, ais_model, radarPeriod, initTime, **kwargs):
+    rng = kwargs.get('rng', np.random)
     ais_measurements = AisMessagesList()
     integerTime = kwargs.get('integerTime', True)
     tempList = []
@@ -147,13 +249,13 @@ def simulateAIS(sim_list, ais_model, radarPeriod, initTime, **kwargs):
                 pass
             highAccuracy = True
             if kwargs.get('noise', True):
-                highAccuracy = np.random.uniform() > 0.5
+                highAccuracy = rng.uniform() > 0.5
                 R = target.model.R_AIS(highAccuracy)
-                v = np.random.multivariate_normal(np.zeros(R.shape[0]), R)
+                v = rng.multivariate_normal(np.zeros(R.shape[0]), R)
                 state = target.model.C_AIS.dot(state) + v
                 assert state.ndim == 1
                 assert state.size == target.model.nObsDim_AIS, str(state.size)
-            if kwargs.get('idScrambling',False) and np.random.uniform() > 0.5:
+            if kwargs.get('idScrambling',False) and rng.uniform() > 0.5:
                 mmsi = target.mmsi + 10
                 # log.info("Scrambling MMSI {0:} to {1:} at {2:}".format(target.mmsi,mmsi, messageTime))
             else:
@@ -163,7 +265,7 @@ def simulateAIS(sim_list, ais_model, radarPeriod, initTime, **kwargs):
                                      state=state,
                                      mmsi=mmsi,
                                      highAccuracy=highAccuracy)
-            if np.random.uniform() <= target.P_r:
+            if rng.uniform() <= target.P_r:
                 tempList.append(prediction)
         simTime = sim[0].time
         if (simTime - initTime) % radarPeriod == 0:
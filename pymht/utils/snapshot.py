@@ -0,0 +1,591 @@
+"""
+Binary snapshots of the complete tracker state, for handing a running tracker
+over to a standby process.
+
+A snapshot is a flat container of named numpy columns (little endian, all
+sections 8 byte aligned):
+    header                  _headerDtype
+    section table           _sectionDtype[nSections]
+    sections                raw array data
+
+The hypothesis forest is stored as a node table (one row per node, state and
+measurement as fixed width rows, covariances deduplicated into a separate table
+as they are shared between siblings) and a structure table in depth first
+order with the row of each node's parent. No Python objects are pickled.
+
+Every node and covariance matrix gets a serial number the first time it is
+written. A delta snapshot only carries the nodes, covariances, scans,
+terminated tracks and runtime samples that are new since the previous snapshot
+from the same writer, together with the structure table of the live forest
+(which is small, 13 bytes per node) and the association sets. Nodes are never
+modified after they are grown, except for the root flag and the list of
+children, which both live in the structure table.
+
+Usage:
+    # Primary, after each scan
+    data = tracker.snapshot(delta=True)
+
+    # Standby, for each received snapshot
+    reader.apply(data)
+
+    # Standby, on takeover. The tracker must be created with the same arguments
+    tracker = Tracker(...)
+    reader.restore(tracker)
+"""
+import numpy as np
+from ..pyTarget import Target, AssociationSet
+from . import measurementKeys
+from .classDefinitions import MeasurementList, AisMessageList, AIS_message
+from .xmlDefinitions import activeTag, preinitializedTag, outofrangeTag, toolowscoreTag
+from ..initiators.m_of_n import PreliminaryTrack, Measurement
+
+MAGIC = b'PYMHTSNP'
+VERSION = 2
+
+_headerDtype = np.dtype([('magic', 'S8'),
+                         ('version', '<u4'),
+                         ('delta', '<u4'),
+                         ('sequence', '<i8'),
+                         ('baseSequence', '<i8'),
+                         ('nSections', '<i8')])
+_sectionDtype = np.dtype([('name', 'S32'),
+                          ('dtype', 'S8'),
+                          ('ndim', '<u4'),
+                          ('shape', '<i8', (3,)),
+                          ('offset', '<i8')])
+
+_none = -1
+_statusTags = [activeTag, preinitializedTag, outofrangeTag, toolowscoreTag]
+
+# Node flags
+_SINGLE_STATE = 1
+_SINGLE_MEASUREMENT = 2
+_SINGLE_COVARIANCE = 4
+# Structure flags
+_ROOT = 1
+_EXPANDED = 2
+
+_nodeColumns = ['serial', 'time', 'scanNumber', 'ID', 'P_d', 'cumulativeNLLR',
+                'measurementNumber', 'mmsi', 'status', 'flags', 'state', 'measurement',
+                'covariance']
+_covarianceColumns = ['serial', 'single', 'matrix']
+
+
+def _padding(size):
+    return (-size) % 8
+
+
+def encode(columns, delta=False, sequence=0, baseSequence=0):
+    headerSize = _headerDtype.itemsize + _sectionDtype.itemsize * len(columns)
+    table = np.zeros(len(columns), dtype=_sectionDtype)
+    arrays = []
+    offset = headerSize + _padding(headerSize)
+    for i, (name, array) in enumerate(sorted(columns.items())):
+        array = np.ascontiguousarray(array)
+        array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+        assert array.ndim <= 3, name
+        assert len(name) <= _sectionDtype['name'].itemsize, name
+        table[i]['name'] = name
+        table[i]['dtype'] = array.dtype.str
+        table[i]['ndim'] = array.ndim
+        table[i]['shape'][:array.ndim] = array.shape
+        table[i]['offset'] = offset
+        arrays.append(array)
+        offset += array.nbytes + _padding(array.nbytes)
+
+    header = np.zeros(1, dtype=_headerDtype)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['delta'] = delta
+    header['sequence'] = sequence
+    header['baseSequence'] = baseSequence
+    header['nSections'] = len(columns)
+    chunks = [header.tobytes(), table.tobytes(), b'\0' * _padding(headerSize)]
+    for array in arrays:
+        chunks.append(array.tobytes())
+        chunks.append(b'\0' * _padding(array.nbytes))
+    return b''.join(chunks)
+
+
+def decode(data):
+    """
+    Returns the header and a dict of read-only column views into data.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if buffer.size < _headerDtype.itemsize:
+        raise ValueError("Not a pyMHT snapshot")
+    header = buffer[:_headerDtype.itemsize].view(_headerDtype)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError("Not a pyMHT snapshot")
+    if header['version'] != VERSION:
+        raise ValueError("Unsupported snapshot version " + str(header['version']))
+    nSections = int(header['nSections'])
+    table = buffer[_headerDtype.itemsize:
+                   _headerDtype.itemsize + nSections * _sectionDtype.itemsize].view(_sectionDtype)
+    columns = {}
+    for section in table:
+        dtype = np.dtype(section['dtype'].decode())
+        shape = tuple(int(e) for e in section['shape'][:section['ndim']])
+        nBytes = int(np.prod(shape)) * dtype.itemsize
+        offset = int(section['offset'])
+        columns[section['name'].decode()] = buffer[offset:offset + nBytes].view(dtype).reshape(shape)
+    return header, columns
+
+
+def _walkForest(tops):
+    """
+    Depth first (pre-order) walk, returns the nodes and the row of their parent.
+    """
+    nodes = []
+    parentRows = []
+    stack = [(top, _none) for top in reversed(tops)]
+    while stack:
+        node, parentRow = stack.pop()
+        row = len(nodes)
+        nodes.append(node)
+        parentRows.append(parentRow)
+        if node.trackHypotheses:
+            stack.extend((child, row) for child in reversed(node.trackHypotheses))
+    return nodes, parentRows
+
+
+def _getTop(node):
+    while node.parent is not None:
+        node = node.parent
+    return node
+
+
+def _structureColumns(prefix, nodes, parentRows, serials):
+    flags = np.array([(_ROOT if node.isRoot else 0) |
+                      (_EXPANDED if node.trackHypotheses is not None else 0)
+                      for node in nodes], dtype=np.uint8)
+    return {prefix + '.serial': np.array(serials, dtype=np.int64),
+            prefix + '.parent': np.array(parentRows, dtype=np.int32),
+            prefix + '.flags': flags}
+
+
+def _optional(value):
+    return value if value is not None else _none
+
+
+def _isSingle(array):
+    return np.asarray(array).dtype == np.float32
+
+
+def _asFloat(array, single):
+    return np.array(array, dtype=np.float32 if single else np.float64)
+
+
+class SnapshotWriter():
+    def __init__(self):
+        self.sequence = 0
+        self._nextNodeSerial = 0
+        self._nextCovarianceSerial = 0
+        self._reset()
+
+    def _reset(self):
+        # id -> (serial, object). The object reference keeps the id from being reused
+        self._nodeSerials = {}
+        self._covarianceSerials = {}
+        self._nScans = 0
+        self._nTerminated = 0
+        self._nRuntime = 0
+
+    def write(self, tracker, delta=False):
+        delta = delta and self.sequence > 0
+        if not delta:
+            self._reset()
+        stateDim = tracker.A.shape[0]
+        measDim = tracker.C.shape[0]
+        newNodes = []
+        newNodeSerials = []
+        newNodeCovariances = []
+        newCovariances = []
+        newCovarianceSerials = {}
+
+        def serialize(nodes, nodeSerials):
+            serials = []
+            for node in nodes:
+                key = id(node)
+                known = self._nodeSerials.get(key)
+                if known is None:
+                    known = (self._nextNodeSerial, node)
+                    self._nextNodeSerial += 1
+                    newNodes.append(node)
+                    newNodeSerials.append(known[0])
+                    covarianceKey = id(node.P_0)
+                    covariance = (self._covarianceSerials.get(covarianceKey) or
+                                  newCovarianceSerials.get(covarianceKey))
+                    if covariance is None:
+                        covariance = (self._nextCovarianceSerial, node.P_0)
+                        self._nextCovarianceSerial += 1
+                        newCovarianceSerials[covarianceKey] = covariance
+                        newCovariances.append(node.P_0)
+                    newNodeCovariances.append(covariance[0])
+                nodeSerials[key] = known
+                serials.append(known[0])
+            return serials
+
+        # Live forest
+        liveNodeSerials = {}
+        liveNodes, liveParents = _walkForest([_getTop(target) for target in tracker.__targetList__])
+        liveSerials = serialize(liveNodes, liveNodeSerials)
+        rows = {id(node): row for row, node in enumerate(liveNodes)}
+        columns = _structureColumns('forest', liveNodes, liveParents, liveSerials)
+        columns['targets'] = np.array([rows[id(target)] for target in tracker.__targetList__],
+                                      dtype=np.int32)
+        columns['trackNodes'] = np.array([rows[id(node)] for node in tracker.__trackNodes__],
+                                         dtype=np.int32)
+        columns['windowSizes'] = np.array(tracker.__targetWindowSize__, dtype=np.int64)
+        columns['slots'] = np.array(tracker.__targets__.slots, dtype=np.int64)
+
+        # Terminated tracks are not modified after termination, only new ones are written
+        terminated = tracker.__terminatedTargets__[self._nTerminated:]
+        terminatedNodes, terminatedParents = _walkForest([_getTop(node) for node in terminated])
+        terminatedSerials = serialize(terminatedNodes, {})
+        rows = {id(node): row for row, node in enumerate(terminatedNodes)}
+        columns.update(_structureColumns('terminated', terminatedNodes, terminatedParents,
+                                         terminatedSerials))
+        columns['terminated.tips'] = np.array([rows[id(node)] for node in terminated],
+                                              dtype=np.int32)
+        self._nTerminated = len(tracker.__terminatedTargets__)
+
+        for node in newNodes:
+            assert node.S_inv is None, "S_inv is not part of the snapshot"
+        columns.update(self._nodeColumns(newNodes, newNodeSerials, stateDim, measDim))
+        columns['node.covariance'] = np.array(newNodeCovariances, dtype=np.int64)
+        covarianceSerials = [newCovarianceSerials[id(P_0)][0] for P_0 in newCovariances]
+        columns['covariance.serial'] = np.array(covarianceSerials, dtype=np.int64)
+        columns['covariance.single'] = np.array([_isSingle(P_0) for P_0 in newCovariances],
+                                                dtype=np.uint8)
+        columns['covariance.matrix'] = np.array(newCovariances, dtype=np.float64).reshape(
+            (-1, stateDim, stateDim))
+        self._nodeSerials = liveNodeSerials
+        self._covarianceSerials.update(newCovarianceSerials)
+        self._covarianceSerials = {id(node.P_0): self._covarianceSerials[id(node.P_0)]
+                                   for node in liveNodes}
+
+        columns.update(self._associationColumns(tracker))
+        columns.update(self._scanColumns(tracker, stateDim, measDim))
+        columns.update(self._runtimeColumns(tracker))
+        columns.update(self._initiatorColumns(tracker.initiator, stateDim, measDim))
+        lastTimestamp = tracker.initiator.last_timestamp
+        columns['counters'] = np.array([len(tracker.__scanHistory__),
+                                        tracker.trackIdCounter,
+                                        tracker.N,
+                                        stateDim], dtype=np.int64)
+        columns['times'] = np.array([tracker.radarPeriod,
+                                     lastTimestamp if lastTimestamp is not None else np.nan])
+
+        baseSequence = self.sequence if delta else 0
+        self.sequence += 1
+        return encode(columns, delta, self.sequence, baseSequence)
+
+    @staticmethod
+    def _nodeColumns(nodes, serials, stateDim, measDim):
+        measurements = np.full((len(nodes), measDim), np.nan)
+        flags = np.zeros(len(nodes), dtype=np.uint8)
+        for i, node in enumerate(nodes):
+            if node.measurement is not None:
+                measurements[i] = node.measurement
+                flags[i] |= _SINGLE_MEASUREMENT if _isSingle(node.measurement) else 0
+            flags[i] |= _SINGLE_STATE if _isSingle(node.x_0) else 0
+        return {'node.serial': np.array(serials, dtype=np.int64),
+                'node.time': np.array([node.time for node in nodes], dtype=np.float64),
+                'node.scanNumber': np.array([_optional(node.scanNumber) for node in nodes],
+                                            dtype=np.int64),
+                'node.ID': np.array([_optional(node.ID) for node in nodes], dtype=np.int64),
+                'node.P_d': np.array([node.P_d for node in nodes], dtype=np.float64),
+                'node.cumulativeNLLR': np.array([node.cumulativeNLLR for node in nodes],
+                                                dtype=np.float64),
+                'node.measurementNumber': np.array([_optional(node.measurementNumber)
+                                                    for node in nodes], dtype=np.int64),
+                'node.mmsi': np.array([_optional(node.mmsi) for node in nodes], dtype=np.int64),
+                'node.status': np.array([_statusTags.index(node.status) for node in nodes],
+                                        dtype=np.uint8),
+                'node.flags': flags,
+                'node.state': np.array([node.x_0 for node in nodes],
+                                       dtype=np.float64).reshape((-1, stateDim)),
+                'node.measurement': measurements,
+                }
+
+    @staticmethod
+    def _associationColumns(tracker):
+        associations = tracker.__associatedMeasurements__
+        pairs = np.array([pair for targetSet in associations
+                          for pair in measurementKeys.toTuples(targetSet.keys)],
+                         dtype=np.int64).reshape((-1, 2))
+        return {'association.count': np.array([len(s) for s in associations], dtype=np.int64),
+                'association.pairs': pairs}
+
+    def _scanColumns(self, tracker, stateDim, measDim):
+        scans = tracker.__scanHistory__[self._nScans:]
+        aisLists = tracker.__aisHistory__[self._nScans:]
+        self._nScans = len(tracker.__scanHistory__)
+        measurements = [np.asarray(scan.measurements).reshape((-1, measDim)) for scan in scans]
+        messages = [message for aisList in aisLists if aisList is not None for message in aisList]
+        return {'scan.time': np.array([scan.time for scan in scans], dtype=np.float64),
+                'scan.offsets': np.cumsum([0] + [m.shape[0] for m in measurements]),
+                'scan.single': np.array([_isSingle(m) for m in measurements], dtype=np.uint8),
+                'scan.measurements': (np.concatenate(measurements).astype(np.float64)
+                                      if measurements else np.zeros((0, measDim))),
+                'ais.offsets': np.cumsum([0] + [len(a) if a is not None else 0 for a in aisLists]),
+                'ais.present': np.array([a is not None for a in aisLists], dtype=np.uint8),
+                'ais.time': np.array([m.time for m in messages], dtype=np.float64),
+                'ais.state': np.array([m.state for m in messages],
+                                      dtype=np.float64).reshape((-1, stateDim)),
+                'ais.mmsi': np.array([_optional(m.mmsi) for m in messages], dtype=np.int64),
+                'ais.highAccuracy': np.array([m.highAccuracy for m in messages], dtype=np.uint8)}
+
+    def _runtimeColumns(self, tracker):
+        keys = list(tracker.runtimeLog.keys())
+        samples = [tracker.runtimeLog[key][self._nRuntime:] for key in keys]
+        assert len({len(s) for s in samples}) <= 1, "Uneven runtime log"
+        self._nRuntime += len(samples[0]) if samples else 0
+        return {'runtime.keys': np.array(keys, dtype='S16'),
+                'runtime.values': np.array(samples, dtype=np.float64).reshape((len(keys), -1))}
+
+    @staticmethod
+    def _initiatorColumns(initiator, stateDim, measDim):
+        initiators = initiator.initiators
+        tracks = initiator.preliminary_tracks
+        return {'initiator.time': np.array([i.timestamp for i in initiators], dtype=np.float64),
+                'initiator.value': np.array([i.value for i in initiators],
+                                            dtype=np.float64).reshape((-1, measDim)),
+                'initiator.single': np.array([_isSingle(i.value) for i in initiators],
+                                             dtype=np.uint8),
+                'preliminary.state': np.array([t.state for t in tracks],
+                                              dtype=np.float64).reshape((-1, stateDim)),
+                'preliminary.covariance': np.array([t.covariance for t in tracks],
+                                                   dtype=np.float64).reshape((-1, stateDim, stateDim)),
+                'preliminary.flags': np.array([(_SINGLE_STATE if _isSingle(t.state) else 0) |
+                                               (_SINGLE_COVARIANCE if _isSingle(t.covariance) else 0)
+                                               for t in tracks], dtype=np.uint8),
+                'preliminary.n': np.array([t.n for t in tracks], dtype=np.int64),
+                'preliminary.m': np.array([t.m for t in tracks], dtype=np.int64),
+                'preliminary.measurementIndex': np.array([_optional(t.measurement_index)
+                                                          for t in tracks], dtype=np.int64),
+                'preliminary.mmsi': np.array([_optional(t.mmsi) for t in tracks], dtype=np.int64)}
+
+
+class _Store():
+    """
+    Columns of rows keyed by an increasing serial number.
+    """
+
+    def __init__(self, prefix, names):
+        self.prefix = prefix
+        self.names = names
+        self.columns = None
+
+    def append(self, columns):
+        new = {name: columns[self.prefix + name] for name in self.names}
+        if self.columns is None:
+            self.columns = {name: np.array(array) for name, array in new.items()}
+        else:
+            assert (new['serial'].size == 0 or self.columns['serial'].size == 0 or
+                    new['serial'][0] > self.columns['serial'][-1])
+            self.columns = {name: np.concatenate((self.columns[name], new[name]))
+                            for name in self.names}
+
+    def find(self, serials):
+        indices = np.searchsorted(self.columns['serial'], serials)
+        indices = np.minimum(indices, max(self.columns['serial'].size - 1, 0))
+        if (serials.size and
+                (self.columns['serial'].size == 0 or
+                 np.any(self.columns['serial'][indices] != serials))):
+            raise ValueError("Snapshot refers to unknown " + self.prefix.strip('.'))
+        return indices
+
+    def take(self, indices):
+        return {name: array[indices] for name, array in self.columns.items()}
+
+    def keep(self, indices):
+        self.columns = self.take(np.unique(indices))
+
+
+class SnapshotReader():
+    """
+    Accumulates a full snapshot and the delta snapshots following it. Applying a
+    snapshot only touches flat arrays; the tracker objects are built by restore.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.sequence = 0
+        self._nodes = None
+        self._covariances = None
+        self._live = None
+        self._terminated = []
+        self._scans = []
+        self._runtime = []
+
+    def apply(self, data):
+        header, columns = decode(data)
+        if header['delta']:
+            if self.sequence == 0 or header['baseSequence'] != self.sequence:
+                raise ValueError("Delta snapshot {0:} does not follow snapshot {1:}".format(
+                    header['sequence'], self.sequence))
+        else:
+            self._reset()
+            self._nodes = _Store('node.', _nodeColumns)
+            self._covariances = _Store('covariance.', _covarianceColumns)
+        self.sequence = int(header['sequence'])
+        self._nodes.append(columns)
+        self._covariances.append(columns)
+
+        self._live = self._resolve(columns, 'forest')
+        self._live.update({name: np.array(columns[name])
+                           for name in ['targets', 'trackNodes', 'windowSizes', 'slots',
+                                        'association.count', 'association.pairs', 'counters',
+                                        'times'] + [name for name in columns
+                                                    if name.startswith('initiator.') or
+                                                    name.startswith('preliminary.')]})
+        terminated = self._resolve(columns, 'terminated')
+        terminated['tips'] = np.array(columns['terminated.tips'])
+        self._terminated.append(terminated)
+        self._nodes.keep(self._nodes.find(self._live['forest.serial']))
+        self._covariances.keep(self._covariances.find(self._live['node.covariance']))
+        self._scans.append({name: np.array(array) for name, array in columns.items()
+                            if name.startswith('scan.') or name.startswith('ais.')})
+        self._runtime.append((columns['runtime.keys'], np.array(columns['runtime.values'])))
+
+    def _resolve(self, columns, prefix):
+        structure = {name: np.array(columns[prefix + '.' + name])
+                     for name in ['serial', 'parent', 'flags']}
+        nodes = self._nodes.take(self._nodes.find(structure['serial']))
+        covariances = self._covariances.take(self._covariances.find(nodes['covariance']))
+        resolved = {'forest.' + name: array for name, array in structure.items()}
+        resolved.update({'node.' + name: array for name, array in nodes.items()})
+        resolved.update({'covariance.' + name: array for name, array in covariances.items()})
+        return resolved
+
+    def restore(self, tracker):
+        """
+        Replaces the state of tracker, which must have been created with the same
+        arguments as the tracker the snapshots were taken from.
+        """
+        assert self.sequence > 0, "No snapshot applied"
+        live = self._live
+        counters = live['counters']
+        assert counters[3] == tracker.A.shape[0], "Incompatible tracker model"
+
+        liveNodes = _buildForest(live)
+        pairs = [(int(scanNumber), int(key)) for scanNumber, key in live['association.pairs']]
+        offsets = np.cumsum(np.concatenate(([0], live['association.count'])))
+        tracker.__targets__.clear()
+        for i, slot in enumerate(live['slots']):
+            root = liveNodes[live['targets'][i]]
+            associatedMeasurements = AssociationSet.fromTree(root)
+            assert (set(measurementKeys.toTuples(associatedMeasurements.keys)) ==
+                    set(pairs[offsets[i]:offsets[i + 1]])), \
+                "Snapshot association sets do not match the hypothesis trees"
+            tracker.__targets__.add(root, liveNodes[live['trackNodes'][i]],
+                                    int(live['windowSizes'][i]), associatedMeasurements, int(slot))
+        tracker.__terminatedTargets__ = []
+        for terminated in self._terminated:
+            nodes = _buildForest(terminated)
+            tracker.__terminatedTargets__.extend(nodes[row] for row in terminated['tips'])
+
+        tracker.__scanHistory__ = []
+        tracker.__aisHistory__ = []
+        for scans in self._scans:
+            _restoreScans(tracker, scans)
+        assert len(tracker.__scanHistory__) == counters[0]
+        for log in tracker.runtimeLog.values():
+            del log[:]
+        # Columns the tracker does not log, like memory figures, are dropped and
+        # missing columns are padded
+        for keys, values in self._runtime:
+            for key, samples in zip(keys, values):
+                if key.decode() in tracker.runtimeLog:
+                    tracker.runtimeLog[key.decode()].extend(float(e) for e in samples)
+        nRuntime = max(len(samples) for samples in tracker.runtimeLog.values())
+        for samples in tracker.runtimeLog.values():
+            samples.extend([0.] * (nRuntime - len(samples)))
+
+        tracker.trackIdCounter = int(counters[1])
+        tracker.N = int(counters[2])
+        tracker.radarPeriod = float(live['times'][0])
+        _restoreInitiator(tracker.initiator, live)
+        tracker.__clusterList__ = []
+        tracker.__snapshotWriter__ = None
+
+
+def _buildForest(forest):
+    nodes = []
+    covariances = {}
+    for row in range(forest['forest.serial'].size):
+        parentRow = forest['forest.parent'][row]
+        parent = nodes[parentRow] if parentRow != _none else None
+        flags = forest['node.flags'][row]
+        covarianceSerial = forest['node.covariance'][row]
+        P_0 = covariances.get(covarianceSerial)
+        if P_0 is None:
+            P_0 = _asFloat(forest['covariance.matrix'][row], forest['covariance.single'][row])
+            covariances[covarianceSerial] = P_0
+        measurement = (_asFloat(forest['node.measurement'][row], flags & _SINGLE_MEASUREMENT)
+                       if not np.isnan(forest['node.measurement'][row][0]) else None)
+        scanNumber, ID, measurementNumber, mmsi = [
+            int(forest['node.' + name][row]) if forest['node.' + name][row] != _none else None
+            for name in ['scanNumber', 'ID', 'measurementNumber', 'mmsi']]
+        node = Target(float(forest['node.time'][row]),
+                      scanNumber,
+                      _asFloat(forest['node.state'][row], flags & _SINGLE_STATE),
+                      P_0,
+                      ID,
+                      P_d=float(forest['node.P_d'][row]),
+                      parent=parent,
+                      measurementNumber=measurementNumber,
+                      measurement=measurement,
+                      cumulativeNLLR=float(forest['node.cumulativeNLLR'][row]),
+                      mmsi=mmsi,
+                      status=_statusTags[forest['node.status'][row]],
+                      isRoot=bool(forest['forest.flags'][row] & _ROOT))
+        if forest['forest.flags'][row] & _EXPANDED:
+            node.trackHypotheses = []
+        if parent is not None:
+            parent.trackHypotheses.append(node)
+        nodes.append(node)
+    return nodes
+
+
+def _restoreScans(tracker, scans):
+    scanOffsets = scans['scan.offsets']
+    aisOffsets = scans['ais.offsets']
+    for i, scanTime in enumerate(scans['scan.time']):
+        measurements = _asFloat(scans['scan.measurements'][scanOffsets[i]:scanOffsets[i + 1]],
+                                scans['scan.single'][i])
+        tracker.__scanHistory__.append(MeasurementList(float(scanTime), measurements))
+        if not scans['ais.present'][i]:
+            tracker.__aisHistory__.append(None)
+            continue
+        tracker.__aisHistory__.append(AisMessageList(
+            [AIS_message(time=float(scans['ais.time'][j]),
+                         state=np.array(scans['ais.state'][j]),
+                         mmsi=int(scans['ais.mmsi'][j]) if scans['ais.mmsi'][j] != _none else None,
+                         highAccuracy=bool(scans['ais.highAccuracy'][j]))
+             for j in range(aisOffsets[i], aisOffsets[i + 1])]))
+
+
+def _restoreInitiator(initiator, live):
+    initiator.initiators = [Measurement(_asFloat(value, single), float(timestamp))
+                            for value, single, timestamp in zip(live['initiator.value'],
+                                                                live['initiator.single'],
+                                                                live['initiator.time'])]
+    initiator.preliminary_tracks = []
+    for i, flags in enumerate(live['preliminary.flags']):
+        mmsi = int(live['preliminary.mmsi'][i])
+        track = PreliminaryTrack(_asFloat(live['preliminary.state'][i], flags & _SINGLE_STATE),
+                                 _asFloat(live['preliminary.covariance'][i],
+                                          flags & _SINGLE_COVARIANCE),
+                                 mmsi if mmsi != _none else None)
+        track.n = int(live['preliminary.n'][i])
+        track.m = int(live['preliminary.m'][i])
+        measurementIndex = int(live['preliminary.measurementIndex'][i])
+        track.measurement_index = measurementIndex if measurementIndex != _none else None
+        initiator.preliminary_tracks.append(track)
+    lastTimestamp = live['times'][1]
+    initiator.last_timestamp = float(lastTimestamp) if np.isfinite(lastTimestamp) else None
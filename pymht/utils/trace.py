@@ -0,0 +1,96 @@
+"""
+Tracing for the tracker hot paths.
+
+Log calls in the hot paths pass their arguments to logging instead of building
+the message, so nothing is formatted unless the record is emitted. Wrap
+expensive arguments in Lazy. Large debug dumps (constraint matrices, cost
+vectors, gate distances) are never logged, they are handed as arrays to the
+trace sink. When no sink is installed a probe costs one attribute lookup:
+
+    if trace.sink is not None:
+        trace.emit('A1', A1, cluster=cluster)
+
+Usage:
+    with trace.tracing(trace.MemorySink()) as sink:
+        tracker.addMeasurementList(scanList, aisList)
+    A1 = sink.get('A1')
+"""
+import logging
+import contextlib
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+sink = None
+
+
+class Lazy():
+    """
+    Log argument that is only evaluated if the record is formatted.
+    """
+    __slots__ = ('function', 'args', 'kwargs')
+
+    def __init__(self, function, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.function(*self.args, **self.kwargs))
+
+    __repr__ = __str__
+
+
+class MemorySink():
+    """
+    Keeps copies of the traced values as a list of (name, value, context).
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, name, value, context):
+        self.records.append((name, np.array(value, copy=True), context))
+
+    def get(self, name):
+        return [value for recordName, value, _ in self.records if recordName == name]
+
+
+class LogSink():
+    """
+    Writes the traced values to a logger, formatted with np.array_str.
+    """
+
+    def __init__(self, logger=log, level=logging.DEBUG, **formatOptions):
+        self.logger = logger
+        self.level = level
+        self.formatOptions = formatOptions
+        self.formatOptions.setdefault('max_line_width', 200)
+
+    def __call__(self, name, value, context):
+        self.logger.log(self.level, "%s %s\n%s", name, context,
+                        np.array_str(np.asarray(value), **self.formatOptions))
+
+
+def setSink(newSink):
+    """
+    Installs newSink (None disables tracing) and returns the previous sink.
+    """
+    global sink
+    previousSink = sink
+    sink = newSink
+    return previousSink
+
+
+def emit(name, value, **context):
+    if sink is not None:
+        sink(name, value, context)
+
+
+@contextlib.contextmanager
+def tracing(newSink):
+    previousSink = setSink(newSink)
+    try:
+        yield newSink
+    finally:
+        setSink(previousSink)
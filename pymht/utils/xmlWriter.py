@@ -0,0 +1,64 @@
+"""
+Incremental writer for scenario result files.
+
+Produces the same layout as building the complete Scenario element with
+Tracker._storeTrackerArgs/_storeRun and writing it with
+helpFunctions.writeElementToFile, but each Run is written to disk as soon as it
+is complete. Only one Runtime or Track sub-tree is held in memory at a time.
+
+Usage:
+    with ScenarioWriter(path, **scenarioAttributes) as writer:
+        for iteration in range(nMonteCarlo):
+            tracker = Tracker(...)
+            ...
+            if iteration == 0:
+                tracker._streamTrackerArgs(writer)
+            tracker._streamRun(writer, preInitialized, i=iteration, seed=seed)
+"""
+import os
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import XMLGenerator
+from .xmlDefinitions import scenarioTag
+
+_encoding = 'us-ascii'
+
+
+class ScenarioWriter():
+    def __init__(self, path, **kwargs):
+        (head, tail) = os.path.split(path)
+        if head and not os.path.isdir(head):
+            os.makedirs(head)
+        self.path = path
+        self.nRuns = 0
+        self._file = open(path, 'w', encoding=_encoding, errors='xmlcharrefreplace')
+        self._generator = XMLGenerator(self._file, encoding=_encoding,
+                                       short_empty_elements=False)
+        self._openTags = []
+        self.startElement(scenarioTag, {str(k): str(v) for k, v in kwargs.items()})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def startElement(self, tag, attrib=None):
+        self._generator.startElement(tag, attrib if attrib is not None else {})
+        self._openTags.append(tag)
+
+    def endElement(self):
+        self._generator.endElement(self._openTags.pop())
+
+    def writeElement(self, element):
+        self._file.write(ET.tostring(element, encoding='unicode'))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        while self._openTags:
+            self.endElement()
+        self._file.close()
+        self._file = None
@@ -15,16 +15,20 @@ else:
     print("NOT using Cython")
     USE_CYTHON = False
 
-ext = '.pyx' if USE_CYTHON else '.c'
-
+# The compiled kernels are optional, pymht.utils.kalman falls back to numpy without them
+kernelSource = os.path.join('pymht', 'utils', 'cFunctions')
 if USE_CYTHON:
-    from distutils.extension import Extension
-    import numpy
-    extensions = [Extension("pymht.utils.cKalman", ["pymht/utils/cKalman" + ext]),
-                  Extension("pymht.utils.cFunctions", ["pymht/utils/cFunctions" + ext],
-                            include_dirs=[numpy.get_include()])]
+    kernelSource += '.pyx'
+elif os.path.exists(kernelSource + '.c'):
+    kernelSource += '.c'
+else:
+    kernelSource = None
+
+if kernelSource is not None:
+    from setuptools import Extension
+    extensions = [Extension("pymht.utils.cFunctions", [kernelSource], optional=True)]
 else:
-    extensions = None
+    extensions = []
 
 name = "pyMHT"
 version = "1.0"
@@ -36,40 +40,26 @@ keywords = 'mht tomht radar tracking track-split track split multi target multit
 url = 'http://autosea.github.io/sf/2016/04/15/radar_ais/'
 install_requires = ['matplotlib', 'numpy', 'scipy', 'psutil', 'termcolor','Cython']
 
-packages = find_packages(exclude=['examples', 'docs'])
+packages = find_packages(exclude=['examples', 'docs', 'benchmarks', 'benchmarks.*'])
 print("Packages", packages)
 
 if USE_CYTHON:
-    from distutils.core import setup
     from Cython.Build import cythonize
     print("Cythonize extensions")
     extensions = cythonize(extensions)
-    print("Setup with external modules")
-    setup(
-        name=name,
-        version=version,
-        author=author,
-        author_email=author_email,
-        description=description,
-        license=license,
-        keywords=keywords,
-        url=url,
-        packages=packages,
-        # include_package_data = True,
-        # install_requires = install_requires,
-        ext_modules=extensions,
-    )
-else:
-    from setuptools import setup
-    setup(
-        name=name,
-        version=version,
-        author=author,
-        author_email=author_email,
-        description=description,
-        license=license,
-        keywords=keywords,
-        packages=packages,
-        # include_package_data=True,
-        # install_requires=install_requires,
-    )
+
+from setuptools import setup
+setup(
+    name=name,
+    version=version,
+    author=author,
+    author_email=author_email,
+    description=description,
+    license=license,
+    keywords=keywords,
+    url=url,
+    packages=packages,
+    # include_package_data=True,
+    # install_requires=install_requires,
+    ext_modules=extensions,
+)
@@ -0,0 +1,63 @@
+import os
+import numpy as np
+import pytest
+from benchmarks import scenarios
+from benchmarks import run
+
+
+def test_scenario_reproducibility():
+    specs = {'nTargets': 4, 'nScans': 5, 'aisShare': 0.5}
+    scenarioA = scenarios.Scenario(**specs).build()
+    scenarioB = scenarios.Scenario(**specs).build()
+    for measurementListA, measurementListB in zip(scenarioA.scanList, scenarioB.scanList):
+        assert measurementListA == measurementListB
+    for listA, listB in zip(scenarioA.aisList, scenarioB.aisList):
+        for messageA, messageB in zip(listA, listB):
+            assert messageA.mmsi == messageB.mmsi
+            assert np.array_equal(messageA.state, messageB.state)
+
+
+def test_sweep_names_are_unique():
+    names = [scenario.getName() for scenario in scenarios.sweep()]
+    assert len(names) == len(set(names))
+    assert names[0] == 'default'
+
+
+def test_compare_tracks():
+    track = {'id': 0, 'terminated': False, 'status': 'Active', 'mmsi': None,
+             'time': [0., 1.], 'states': [[0., 0., 1., 1.], [1., 1., 1., 1.]]}
+    assert run.compareTracks([track], [track]) == []
+    movedTrack = dict(track, states=[[0., 0., 1., 1.], [1., 1.1, 1., 1.]])
+    assert len(run.compareTracks([movedTrack], [track])) == 1
+    assert len(run.compareTracks([], [track])) == 1
+
+
+@pytest.mark.parametrize('name', ['N=1', 'P_d=0.5', 'nTargets=5'])
+def test_tracks_match_golden_files(name):
+    pytest.importorskip("munkres")
+    goldenPath = os.path.join(run.goldenDirectory, name + '.json')
+    scenario, = [s for s in scenarios.sweep() if s.getName() == name]
+    result = run.runScenario(scenario)
+    assert run.compareTracks(result['tracks'], run._readJson(goldenPath)) == []
+
+
+def test_missing_golden_file_fails(tmpdir):
+    pytest.importorskip("munkres")
+    assert run.main(['--scenario', 'N=1', '--golden', str(tmpdir)]) == 1
+
+
+def test_tracker_import_is_lightweight():
+    from benchmarks import importTime
+    result = importTime.measureImport('pymht.tracker', repeat=1)
+    assert result['loaded'] == []
+
+
+def test_monte_carlo_independent_of_worker_count():
+    pytest.importorskip("munkres")
+    from benchmarks import monteCarlo
+    spec = {'nTargets': 3, 'nScans': 5, 'aisShare': 0.5}
+    serial = monteCarlo.runMonteCarlo(spec, [4, 5, 6], nWorkers=1)
+    parallel = monteCarlo.runMonteCarlo(spec, [4, 5, 6], nWorkers=2)
+    assert [r['seed'] for r in parallel] == [4, 5, 6]
+    for resultA, resultB in zip(serial, parallel):
+        assert resultA['tracks'] == resultB['tracks']
@@ -7,3 +7,49 @@ def func(x):
 
 def test_answer():
     assert func(3) == 5
+
+
+def test_ais_message_list_columns():
+    import numpy as np
+    from pymht.utils.classDefinitions import AisMessageList, AIS_message
+
+    def message(time, mmsi, highAccuracy):
+        return AIS_message(time, np.array([time, mmsi % 10, 0., 0.]), mmsi, highAccuracy)
+
+    aisList = AisMessageList([message(2., 257000001, False),
+                              message(1., 257000002, True),
+                              message(3., 257000001, True),
+                              message(1., 257000003, False),
+                              message(1., 257000004, True)])
+    assert [m.mmsi for m in aisList] == [257000002, 257000001, 257000003, 257000004]
+    columns = aisList.getColumns()
+    assert columns.state.shape == (4, 4)
+    assert columns.rowOfMmsi[257000001] == 1
+    assert [(time, highAccuracy, rows.tolist()) for time, highAccuracy, rows in columns.groups] == \
+        [(1., True, [0, 3]), (1., False, [2]), (3., True, [1])]
+    unused = aisList.filterUnused({257000001, 257000004})
+    assert [m.mmsi for m in unused] == [257000002, 257000003]
+    assert AisMessageList().getColumns().groups == []
+
+
+def test_ais_message_list_columns_follow_changes():
+    import numpy as np
+    from pymht.utils.classDefinitions import AisMessageList, AIS_message
+
+    def message(time, mmsi):
+        return AIS_message(time, np.array([float(mmsi), 0., 0., 0.]), mmsi, True)
+
+    aisList = AisMessageList([message(1., 1), message(1., 2)])
+    assert aisList.getColumns().mmsi.tolist() == [1, 2]
+    aisList[0] = message(1., 3)
+    assert aisList.getColumns().mmsi.tolist() == [3, 2]
+    aisList.append(message(2., 4))
+    assert aisList.getColumns().mmsi.tolist() == [3, 2, 4]
+    aisList.sort(key=lambda m: -m.mmsi)
+    assert aisList.getColumns().mmsi.tolist() == [4, 3, 2]
+    aisList[1:] = [message(1., 5), message(1., 6)]
+    assert aisList.getColumns().mmsi.tolist() == [4, 5, 6]
+    del aisList[0]
+    aisList += [message(3., 7)]
+    assert isinstance(aisList, AisMessageList)
+    assert aisList.getColumns().state[:, 0].tolist() == [5., 6., 7.]
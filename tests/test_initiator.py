@@ -1,7 +1,60 @@
 # content of test_sample.py
+import numpy as np
+import pytest
+
+
 def func(x):
     return x + 2
 
 
 def test_answer():
     assert func(3) == 5
+
+
+def test_grid_candidate_pairs_match_brute_force():
+    m_of_n = pytest.importorskip("pymht.initiators.m_of_n")
+    np.random.seed(1234)
+    initiators = np.array(np.random.uniform(-1000, 1000, (40, 2)), dtype=np.float32)
+    measurements = np.array(np.random.uniform(-1000, 1000, (60, 2)), dtype=np.float32)
+    gate_distance = 80.
+    rows, cols, distances = m_of_n._grid_candidate_pairs(initiators, measurements, gate_distance)
+    distance_matrix = np.linalg.norm(measurements[np.newaxis, :, :] - initiators[:, np.newaxis, :], axis=2)
+    assert set(zip(rows, cols)) == set(zip(*np.nonzero(distance_matrix <= gate_distance)))
+    assert np.allclose(distances, distance_matrix[rows, cols])
+
+
+def test_sparse_global_nearest_neighbour_match_dense():
+    pytest.importorskip("munkres")
+    m_of_n = pytest.importorskip("pymht.initiators.m_of_n")
+    np.random.seed(4321)
+    initiators = np.array(np.random.uniform(-500, 500, (30, 2)), dtype=np.float32)
+    measurements = np.array(np.random.uniform(-500, 500, (50, 2)), dtype=np.float32)
+    gate_distance = 60.
+    distance_matrix = np.linalg.norm(measurements[np.newaxis, :, :] - initiators[:, np.newaxis, :], axis=2)
+    dense = m_of_n._solve_global_nearest_neighbour(distance_matrix, gate_distance)
+    rows, cols, distances = m_of_n._grid_candidate_pairs(initiators, measurements, gate_distance)
+    sparse = m_of_n._solve_sparse_global_nearest_neighbour(rows, cols, distances,
+                                                           distance_matrix.shape)
+    assert len(sparse) == len(dense)
+    assert np.isclose(sum(distance_matrix[a] for a in sparse),
+                      sum(distance_matrix[a] for a in dense))
+
+
+def test_trace_sink_receives_gate_distances():
+    pytest.importorskip("munkres")
+    m_of_n = pytest.importorskip("pymht.initiators.m_of_n")
+    import pymht.utils.trace as trace
+    from pymht.models import pv
+    from pymht.utils.classDefinitions import MeasurementList
+    initiator = m_of_n.Initiator(2, 3, 20, pv.C_RADAR, pv.R_RADAR(), 5)
+    positions = np.array([[0., 0.], [500., 0.], [0., 800.]])
+    velocities = np.array([[5., 0.], [0., -5.], [3., 3.]])
+    with trace.tracing(trace.MemorySink()) as sink:
+        for scan in range(4):
+            measurements = positions + velocities * scan * 2.
+            initiator.processMeasurements(MeasurementList(1e9 + scan * 2., measurements))
+    assert trace.sink is None
+    delta_matrices = sink.get('delta_matrix')
+    assert len(delta_matrices) >= 1
+    assert all(delta_matrix.shape[1] == len(positions) for delta_matrix in delta_matrices)
+    assert np.isfinite(delta_matrices[0]).sum() == len(positions)
@@ -1,5 +1,6 @@
 from pymht.utils import kalman
 import numpy as np
+import pytest
 from pymht.models import pv
 from pymht.models import polar
 from pymht.models import ais
@@ -45,3 +46,76 @@ def test_numpyPredict():
                                            K_list[i],
                                            gated_z_tilde_list[i])
                         for i in range(n)]
+
+
+def test_rtsSmoother():
+    pykalman = pytest.importorskip("pykalman")
+    np.random.seed(1)
+    nSteps = 12
+    z = np.cumsum(np.random.normal(size=(2, nSteps, 2)), axis=1)
+    mask = np.ones((2, nSteps), dtype=bool)
+    mask[0, 3] = mask[0, 4] = mask[1, 7] = False
+    mask[1, 9:] = False
+    x_smooth, _ = kalman.rtsSmoother(np.where(mask[:, :, None], z, np.nan), mask,
+                                     x_0_list[:2], P_0, A, Q, C, R)
+    for track in range(2):
+        measurements = np.ma.masked_array(z[track], mask=~np.repeat(mask[track, :, None], 2, axis=1))
+        kf = pykalman.KalmanFilter(transition_matrices=A, observation_matrices=C,
+                                   transition_covariance=Q, observation_covariance=R,
+                                   initial_state_mean=x_0, initial_state_covariance=P_0)
+        expected, _ = kf.smooth(measurements)
+        assert np.allclose(x_smooth[track], expected)
+
+
+def _gatedUpdate(x_bar_list, P_bar_list, z_list, groupIndices, eta2):
+    S_list, S_inv_list, K_list, P_hat_list = kalman.precalcCovariance(C, R, P_bar_list)
+    z_hat_list = C.dot(x_bar_list.T).T
+    nis, gated = kalman.gate(z_list, z_hat_list, S_inv_list, groupIndices, eta2)
+    gatedNodes, gatedMeasurements = np.nonzero(gated)
+    det_S_list = np.linalg.det(2 * np.pi * S_list)
+    filtered = kalman.filterGated(x_bar_list, z_hat_list, z_list, K_list, groupIndices, det_S_list,
+                                  np.full(x_bar_list.shape[0], 0.8), 1e-4, nis, gatedNodes,
+                                  gatedMeasurements)
+    return (S_list, S_inv_list, K_list, P_hat_list, nis, gated) + filtered
+
+
+def test_gated_update_matches_per_node_filter():
+    np.random.seed(2)
+    groupIndices = np.array([0, 1, 0, 1, 1])
+    x_bar = np.random.normal(scale=10., size=(5, 4))
+    P_bar = np.array([P_0 * 4., P_0 * 9.])
+    z_list = np.random.normal(scale=10., size=(7, 2)).astype(np.float32)
+    _, _, _, _, nis, gated, z_tilde_list, x_hat_list, nllr_list = _gatedUpdate(
+        x_bar, P_bar, z_list, groupIndices, eta2=5.99)
+    assert 0 < np.count_nonzero(gated) < gated.size
+    pair = 0
+    for i, groupIndex in enumerate(groupIndices):
+        for j in np.nonzero(gated[i])[0]:
+            x_hat, _, S, y_tilde = kalman.filter_single(z_list[j], x_bar[i], P_bar[groupIndex], C, R)
+            assert np.allclose(z_tilde_list[pair], y_tilde)
+            assert np.allclose(x_hat_list[pair], x_hat)
+            assert np.isclose(nllr_list[pair], kalman.nllr(1e-4, 0.8, S[np.newaxis], nis[i, j:j + 1])[0])
+            pair += 1
+    assert pair == len(nllr_list)
+
+
+def test_compiled_kernels_match_numpy():
+    pytest.importorskip("pymht.utils.cFunctions")
+    np.random.seed(3)
+    groupIndices = np.array([0, 1, 2, 1, 0, 2])
+    x_0 = np.random.normal(scale=100., size=(6, 4))
+    L = np.random.normal(size=(3, 4, 4))
+    P_0 = np.matmul(L, L.transpose((0, 2, 1))) + np.eye(4)
+    z_list = np.random.normal(scale=100., size=(9, 2))
+    results = []
+    try:
+        for compiled in (False, True):
+            assert kalman.useCompiledKernels(compiled) == compiled
+            x_bar_list, P_bar_list = kalman.predict(A, Q, x_0, P_0)
+            results.append((x_bar_list, P_bar_list) +
+                           _gatedUpdate(x_bar_list, P_bar_list, z_list, groupIndices, eta2=50.))
+    finally:
+        kalman.useCompiledKernels(True)
+    for numpyResult, compiledResult in zip(*results):
+        assert numpyResult.shape == compiledResult.shape
+        assert np.allclose(numpyResult, compiledResult, rtol=1e-9, atol=1e-9)
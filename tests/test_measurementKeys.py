@@ -0,0 +1,17 @@
+import numpy as np
+from pymht.utils import measurementKeys
+
+
+def test_keys_round_trip_and_sort_by_scan_and_sensor():
+    keys = np.array(sorted([measurementKeys.aisKey(3, 257000000),
+                            measurementKeys.radarKey(3, 12),
+                            measurementKeys.radarKey(2, 1),
+                            measurementKeys.aisKey(3, 999999999),
+                            measurementKeys.radarKey(4, 1)]), dtype=np.int64)
+    assert measurementKeys.toTuples(keys) == [(2, 1), (3, 12), (3, 257000000), (3, 999999999), (4, 1)]
+    scanNumbers, sensors, _ = measurementKeys.decode(keys)
+    assert scanNumbers.tolist() == [2, 3, 3, 3, 4]
+    assert sensors.tolist() == [0, 0, 1, 1, 0]
+    assert measurementKeys.scanRange(keys, 3, measurementKeys.AIS).tolist() == [257000000, 999999999]
+    assert measurementKeys.scanRange(keys, 3, measurementKeys.RADAR).tolist() == [12]
+    assert measurementKeys.scanRange(keys, 5, measurementKeys.RADAR).tolist() == []
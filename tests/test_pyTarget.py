@@ -5,3 +5,62 @@ def func(x):
 
 def test_answer():
     assert func(3) == 5
+
+
+def test_inherited_mmsi():
+    import numpy as np
+    import pytest
+    from pymht.pyTarget import Target
+
+    def child(parent, mmsi=None):
+        node = Target(parent.time + 1., parent.scanNumber + 1, parent.x_0, parent.P_0,
+                      parent=parent, measurementNumber=1, mmsi=mmsi)
+        parent.trackHypotheses = (parent.trackHypotheses or []) + [node]
+        return node
+
+    root = Target(0., 0, np.zeros(4), np.eye(4))
+    plain = child(root)
+    fused = child(plain, mmsi=257000001)
+    leaf = child(fused)
+    assert plain.inheritedMmsi is None
+    assert leaf.inheritedMmsi == leaf._getHistoricalMmsi() == 257000001
+    root._checkMmsiIntegrity()
+
+    child(leaf, mmsi=257000002)
+    with pytest.raises(AssertionError):
+        root._checkMmsiIntegrity()
+    leaf.trackHypotheses = None
+    leaf.inheritedMmsi = None
+    with pytest.raises(AssertionError):
+        root._checkMmsiIntegrity()
+
+
+def test_prune_similar_states():
+    import numpy as np
+    from pymht.pyTarget import Target, AssociationSet, pruneSimilarStates
+
+    def makeParent(offsets, mmsis):
+        parent = Target(0., 0, np.zeros(4), np.eye(4), isRoot=True)
+        parent.trackHypotheses = [Target(1., 1, np.array([offset, 0., 0., 0.]), np.eye(4) * (i + 1),
+                                         parent=parent, measurementNumber=i,
+                                         cumulativeNLLR=float(i), mmsi=mmsi)
+                                  for i, (offset, mmsi) in enumerate(zip(offsets, mmsis))]
+        return parent
+
+    parents = [makeParent([0., 0.5, 5., 0.2], [None, None, None, None]),
+               makeParent([0., 0.1], [None, 257000001]),
+               makeParent([0.], [None])]
+    associationSets = [AssociationSet.fromTree(parent) for parent in parents]
+    untouched = [list(parent.trackHypotheses) for parent in parents[1:]]
+    pruneSimilarStates(parents, 1., associationSets)
+
+    merged = parents[0].trackHypotheses
+    assert len(merged) == 2
+    assert merged[0].measurementNumber == 0 and merged[0].parent is parents[0]
+    np.testing.assert_allclose(merged[0].x_0, [0.35, 0., 0., 0.])
+    np.testing.assert_allclose(merged[0].P_0, np.eye(4) * 3)
+    assert merged[0].cumulativeNLLR == 2.
+    assert merged[1].x_0[0] == 5.
+    assert [p.trackHypotheses for p in parents[1:]] == untouched
+    for parent, associationSet in zip(parents, associationSets):
+        assert associationSet == AssociationSet.fromTree(parent)
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pytest
+from pymht.utils.classDefinitions import MeasurementList, AisMessageList, AIS_message
+from pymht.utils import scanFile
+
+
+def _makeScans():
+    scans = [MeasurementList(10., np.array([[1., 2.], [3., 4.]], dtype=np.float32)),
+             MeasurementList(12.5, np.zeros((0, 2), dtype=np.float32)),
+             MeasurementList(15., np.array([[5., 6.]], dtype=np.float32))]
+    aisLists = [AisMessageList([AIS_message(9., np.array([1., 2., 3., 4.]), 123456789, True),
+                                AIS_message(9.5, np.array([5., 6., 7., 8.]), None)]),
+                None,
+                AisMessageList()]
+    return scans, aisLists
+
+
+def test_scan_file_roundtrip(tmpdir):
+    path = os.path.join(str(tmpdir), 'scans.scn')
+    scans, aisLists = _makeScans()
+    with scanFile.ScanFileWriter(path) as writer:
+        for scan, aisList in zip(scans, aisLists):
+            writer.append(scan, aisList)
+
+    with scanFile.ScanFileReader(path) as reader:
+        assert len(reader) == len(scans)
+        replayed = list(reader)
+    for (scan, aisList), (originalScan, originalAisList) in zip(replayed, zip(scans, aisLists)):
+        assert scan == originalScan
+        originalAisList = originalAisList if originalAisList is not None else []
+        assert len(aisList) == len(originalAisList)
+        for message, originalMessage in zip(aisList, originalAisList):
+            assert message.time == originalMessage.time
+            assert message.mmsi == originalMessage.mmsi
+            assert message.highAccuracy == originalMessage.highAccuracy
+            assert np.array_equal(message.state, originalMessage.state)
+
+
+def test_scan_file_reader_returns_read_only_views(tmpdir):
+    path = os.path.join(str(tmpdir), 'scans.scn')
+    scans, aisLists = _makeScans()
+    with scanFile.ScanFileWriter(path) as writer:
+        for scan, aisList in zip(scans, aisLists):
+            writer.append(scan, aisList)
+    reader = scanFile.ScanFileReader(path)
+    scan = reader.getScan(2)
+    assert np.shares_memory(scan.measurements, reader._buffer)
+    with pytest.raises(ValueError):
+        scan.measurements[0, 0] = 0.
+    reader.close()
+    assert np.array_equal(scan.measurements, scans[2].measurements)
+
+
+def test_scan_file_rejects_other_files(tmpdir):
+    path = os.path.join(str(tmpdir), 'other.bin')
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 128)
+    with pytest.raises(ValueError):
+        scanFile.ScanFileReader(path)
+
+
+def test_scan_file_readable_before_close(tmpdir):
+    path = os.path.join(str(tmpdir), 'scans.scn')
+    scans, aisLists = _makeScans()
+    writer = scanFile.ScanFileWriter(path)
+    for scan, aisList in zip(scans, aisLists):
+        writer.append(scan, aisList)
+    writer.flush()
+    with open(path, 'ab') as f:
+        f.write(b'\1' * 20)
+
+    with scanFile.ScanFileReader(path) as reader:
+        assert len(reader) == len(scans)
+        scan, aisList = reader[0]
+        assert scan == scans[0]
+        assert [message.mmsi for message in aisList] == [123456789, None]
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+import pymht.utils.sector as sector
+from pymht.utils.classDefinitions import MeasurementList
+
+
+@pytest.mark.parametrize('nSectors, northOffset', [(12, 0.3), (8, 1.), (7, 5.9), (4, 0.)])
+def test_sectors_of_a_scan_complete_the_circle(nSectors, northOffset):
+    edges = northOffset + np.linspace(0., sector.TWO_PI, nSectors + 1)
+    coverage = []
+    for i in range(nSectors):
+        assert not sector.isComplete(coverage)
+        coverage = sector.addCoverage(coverage, (edges[i], edges[i + 1]))
+    assert coverage == [(0., sector.TWO_PI)]
+    assert sector.isComplete(coverage)
+
+
+def test_split_sectors_keeps_measurements_at_the_wrapping_edge():
+    northOffset = 0.3
+    # Azimuths just below the first edge, where the end of the last sector lands after the modulo
+    azimuths = np.array([northOffset - 1e-16, northOffset - 1e-12, northOffset, 0., sector.TWO_PI - 1e-12])
+    measurements = 1000. * np.column_stack((np.sin(azimuths), np.cos(azimuths)))
+    sectorLists = MeasurementList(0., measurements).splitSectors(12, northOffset=northOffset)
+    assert sum(len(s.measurements) for s in sectorLists) == len(azimuths)
+    for sectorList in sectorLists:
+        assert np.all(sector.inSector(sector.azimuth(sectorList.measurements, np.zeros(2)),
+                                      sectorList.sector))
@@ -0,0 +1,104 @@
+import copy
+import pytest
+from benchmarks import scenarios
+import pymht.tracker as tomht
+from pymht.shardedTracker import ShardedTracker, _idStride
+from pymht.models import pv
+
+
+def buildScenario(**kwargs):
+    pytest.importorskip("munkres")
+    return scenarios.Scenario(**kwargs).build()
+
+
+def trackerArgs(scenario):
+    return ((pv, scenario.radarPeriod, scenario.lambda_phi, scenario.lambda_nu),
+            dict(N=scenario.N, P_d=scenario.P_d, radarRange=scenario.radarRange))
+
+
+def createTracker(scenario, **kwargs):
+    args, trackerKwargs = trackerArgs(scenario)
+    return tomht.Tracker(*args, **dict(trackerKwargs, **kwargs))
+
+
+def createShardedTracker(scenario, **kwargs):
+    args, trackerKwargs = trackerArgs(scenario)
+    return ShardedTracker(*args, nTiles=(4, 4), margin=1000., **dict(trackerKwargs, **kwargs))
+
+
+def runScans(trackers, scenario, **kwargs):
+    for scan in scenario.scanList:
+        aisList = scenario.aisList.getMeasurements(scan.time)
+        for tracker in trackers:
+            tracker.addMeasurementList(scan, aisList, **kwargs)
+
+
+def test_sharded_tracker_hands_over_trees():
+    scenario = buildScenario(nTargets=10, nScans=25)
+    tracker = createTracker(scenario)
+    with createShardedTracker(scenario) as shardedTracker:
+        runScans([tracker, shardedTracker], scenario, checkIntegrity=True)
+        tracks = shardedTracker.getTracks()
+        assert shardedTracker.nHandovers > 0
+
+    assert len({track['id'] for track in tracks}) == len(tracks)
+    assert (sorted(tuple(track['state']) for track in tracks) ==
+            sorted(tuple(node.x_0.tolist()) for node in tracker.getTrackNodes()))
+
+
+def test_sharded_tracker_hands_over_collapsed_states():
+    scenario = buildScenario(nTargets=10, nScans=25)
+    with createShardedTracker(scenario, handover='collapsed', processes=False) as shardedTracker:
+        runScans([shardedTracker], scenario, checkIntegrity=True)
+        assert shardedTracker.nHandovers > 0
+        for tile, tracks in zip(shardedTracker.tiles, shardedTracker.tracks):
+            assert all(tile.inCore(track['state'][0:2], shardedTracker.hysteresis)[0] for track in tracks)
+
+
+@pytest.mark.parametrize('handover', ['tree', 'collapsed'])
+def test_handed_over_tracks_keep_their_history(handover):
+    scenario = buildScenario(nTargets=10, nScans=25)
+    tracker = createTracker(scenario)
+    with createShardedTracker(scenario, handover=handover, processes=False) as shardedTracker:
+        runScans([tracker, shardedTracker], scenario, checkIntegrity=True)
+        assert shardedTracker.nHandovers > 0
+        tiles = shardedTracker.tiles
+        trackNodes = [(tile, node) for tile, worker in zip(tiles, shardedTracker.workers)
+                      for node in worker.worker.tracker.getTrackNodes()]
+
+    def history(node):
+        return [(n.scanNumber, tuple(n.x_0.tolist())) for n in node.backtrackNodes()]
+
+    if handover == 'tree':
+        assert (sorted(history(node) for _, node in trackNodes) ==
+                sorted(history(node) for node in tracker.getTrackNodes()))
+    # A track initiated in another tile has history from before it was handed over
+    handedOver = [(tile, node) for tile, node in trackNodes if node.ID // _idStride != tile.index]
+    assert handedOver
+    for tile, node in handedOver:
+        positions = [n.x_0[0:2] for n in node.backtrackNodes()]
+        assert not all(tile.inCore(positions))
+
+
+def test_replaced_and_discarded_targets_are_terminated():
+    scenario = buildScenario(nTargets=4, nScans=6)
+    tracker = createTracker(scenario)
+    tracker.preInitialize(scenario.simList)
+    for scan in scenario.scanList[1:]:
+        tracker.addMeasurementList(scan, scenario.aisList.getMeasurements(scan.time))
+    nTargets = len(tracker.__targets__)
+    released = tracker.releaseTargets([0])
+    root, trackNode, windowSize = released[0]
+    duplicate = copy.deepcopy((root, trackNode))
+    assert tracker.adoptTargets(released) == 1
+    # An equal duplicate is discarded
+    assert tracker.adoptTargets([duplicate + (windowSize,)]) == 0
+    assert len(tracker.__terminatedTargets__) == 1
+    assert tracker.__terminatedTargets__[-1].ID == trackNode.ID
+    # A better duplicate replaces the existing target
+    better = copy.deepcopy(duplicate)
+    better[1].cumulativeNLLR -= 1.
+    assert tracker.adoptTargets([better + (windowSize,)]) == 1
+    assert len(tracker.__terminatedTargets__) == 2
+    assert len(tracker.__targets__) == nTargets
+    assert len(tracker.__terminatedTargets__[-1].backtrackNodes()) == len(scenario.scanList)
@@ -1,6 +1,7 @@
 # content of test_sample.py
 import pymht.utils.simulator as sim
 import numpy as np
+import pytest
 from pymht.models import pv
 from pymht.models import ais
 from pymht.models import polar
@@ -99,6 +100,52 @@ def test_ais_simulation_consistency():
                 assert messageA == messageB
 
 
+def test_array_simulation_seed_consistency():
+    results = []
+    for _ in range(2):
+        sim.seed_simulator(seed)
+        times, states = sim.simulateTargetsArray(initialTargets, simTime, simulationTimeStep, pv)
+        scanList = sim.simulateScansArray(times, states, radarPeriod,
+                                          pv.C_RADAR,
+                                          pv.R_RADAR(pv.sigmaR_RADAR_true),
+                                          lambda_phi,
+                                          radarRange,
+                                          p0,
+                                          P_d=P_d)
+        results.append((times, states, scanList))
+    (timesA, statesA, scanListA), (timesB, statesB, scanListB) = results
+    assert np.array_equal(timesA, timesB)
+    assert np.array_equal(statesA, statesB)
+    assert len(scanListA) == len(scanListB) > 0
+    for measurementListA, measurementListB in zip(scanListA, scanListB):
+        assert measurementListA.measurements.dtype == np.float32
+        assert measurementListA == measurementListB
+
+    with pytest.raises(AssertionError):
+        sim.simulateScansArray(timesA, statesA, radarPeriod, pv.C_RADAR,
+                               pv.R_RADAR(pv.sigmaR_RADAR_true), lambda_phi, radarRange, p0)
+
+    simList = sim.simListFromArray(initialTargets, timesA, statesA)
+    assert len(simList) == len(timesA)
+    assert np.array_equal(simList[-1][0].state, statesA[-1, 0])
+
+
+def test_array_global_clutter_inside_range():
+    sim.seed_simulator(seed)
+    times = np.array([0.])
+    states = np.zeros((1, 0, 4))
+    scanList = sim.simulateScansArray(times, states, radarPeriod,
+                                      pv.C_RADAR,
+                                      pv.R_RADAR(pv.sigmaR_RADAR_true),
+                                      1e-4,
+                                      radarRange,
+                                      p0,
+                                      P_d=P_d)
+    measurements = scanList[0].measurements
+    assert measurements.shape[0] > 100
+    assert np.all(np.linalg.norm(measurements - p0, axis=1) <= radarRange * (1 + 1e-6))
+
+
 if __name__ == '__main__':
     test_initial_target_generation()
     test_simulation_seed_consistency()
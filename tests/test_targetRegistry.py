@@ -0,0 +1,17 @@
+from pymht.targetRegistry import TargetRegistry
+
+
+def test_slots_are_stable_and_reused_lowest_first():
+    registry = TargetRegistry(capacity=2)
+    slots = [registry.add('root' + str(i), 'node' + str(i), 5, None) for i in range(4)]
+    assert slots == [0, 1, 2, 3]
+    assert registry.capacity == 4
+    assert registry.remove(2) == ('root2', 'node2', 5, None)
+    registry.remove(0)
+    assert registry.slots.tolist() == [1, 3]
+    assert list(registry.roots[registry.slots]) == ['root1', 'root3']
+    assert registry.add('root4', 'node4', 5, None) == 0
+    assert registry.add('root5', 'node5', 5, None, slot=6) == 6
+    assert registry.add('root6', 'node6', 5, None) == 2
+    assert registry.slots.tolist() == [0, 1, 2, 3, 6]
+    assert len(registry) == 5
@@ -1,7 +1,316 @@
 # content of test_sample.py
+import os
+import time
+import logging
+import tracemalloc
+import numpy as np
+import pytest
+from benchmarks import scenarios
+import pymht.tracker as tomht
+import pymht.utils.helpFunctions as hpf
+import pymht.utils.measurementKeys as measurementKeys
+import pymht.utils.memory as memory
+import pymht.utils.profiler as profiler
+from pymht.utils.xmlWriter import ScenarioWriter
+from pymht.utils.classDefinitions import MeasurementList, AisMessageList, AIS_message
+from pymht.pyTarget import Target
+from pymht.models import pv, ais
+
+
+def buildScenario(**kwargs):
+    pytest.importorskip("munkres")
+    return scenarios.Scenario(**kwargs).build()
+
+
+def createTracker(scenario, **kwargs):
+    return tomht.Tracker(pv, scenario.radarPeriod, scenario.lambda_phi, scenario.lambda_nu,
+                         N=scenario.N, P_d=scenario.P_d, radarRange=scenario.radarRange, **kwargs)
+
+
+def runScans(tracker, scenario, scanList=None, **kwargs):
+    for scan in (scanList if scanList is not None else scenario.scanList):
+        tracker.addMeasurementList(scan, scenario.aisList.getMeasurements(scan.time), **kwargs)
+    return tracker
+
+
+def trackNodeStates(tracker):
+    return [(node.ID, node.x_0.tolist(), node.cumulativeNLLR) for node in tracker.getTrackNodes()]
+
+
 def func(x):
     return x + 2
 
 
 def test_answer():
     assert func(3) == 5
+
+
+@pytest.mark.parametrize('preInitialized', [False, True])
+def test_streamed_run_matches_stored_run(tmpdir, preInitialized):
+    scenario = buildScenario(nTargets=3, nScans=6)
+    tracker = createTracker(scenario)
+    scanList = scenario.scanList
+    if preInitialized:
+        tracker.preInitialize(scenario.simList)
+        scanList = scanList[1:]
+    runScans(tracker, scenario, scanList)
+    assert len(tracker.getTrackNodes()) + len(tracker.__terminatedTargets__) > 0
+
+    storedPath = os.path.join(str(tmpdir), 'stored.xml')
+    streamedPath = os.path.join(str(tmpdir), 'streamed.xml')
+    scenarioElement = tracker.getScenarioElement()
+    tracker._storeTrackerArgs(scenarioElement, name='test')
+    for seed in range(2):
+        tracker._storeRun(scenarioElement, preInitialized, seed=seed)
+    hpf.writeElementToFile(storedPath, scenarioElement)
+
+    with ScenarioWriter(streamedPath, name='test') as writer:
+        tracker._streamTrackerArgs(writer)
+        for seed in range(2):
+            tracker._streamRun(writer, preInitialized, seed=seed)
+
+    with open(storedPath) as stored, open(streamedPath) as streamed:
+        assert stored.read() == streamed.read()
+
+
+def test_initiate_targets_match_pairwise_neighbour_check():
+    scenario = buildScenario(nTargets=6, nScans=5)
+    tracker = runScans(createTracker(scenario), scenario)
+    threshold = tracker.mergeThreshold
+    leafPositions = [node.x_0[0:2] for target in tracker.__targetList__ for node in target.getLeafNodes()]
+    assert leafPositions
+
+    def newTarget(position):
+        return Target(scenario.scanList[-1].time, None, np.hstack((position, [0., 0.])), pv.P0)
+
+    offsets = [(threshold, 0.), (0., -threshold), (0.5 * threshold, 0.), (2 * threshold, 0.)]
+    newTargets = [newTarget(position + offset) for position in leafPositions[::3] for offset in offsets]
+    newTargets += [newTarget(np.array([x, 1e5])) for x in [0., threshold, 1.5 * threshold, 3 * threshold]]
+    np.random.shuffle(newTargets)
+
+    accepted = list(tracker.__targetList__)
+    for target in newTargets:
+        if target.haveNoNeightbours(accepted, threshold):
+            accepted.append(target)
+    nTargets = len(tracker.__targetList__)
+    firstId = tracker.trackIdCounter
+    tracker.initiateTargets(newTargets[:len(newTargets) // 2])
+    tracker.initiateTargets(newTargets[len(newTargets) // 2:])
+    initiated = sorted((target for target in tracker.__targetList__ if target.ID >= firstId),
+                       key=lambda target: target.ID)
+    assert 0 < len(initiated) < len(newTargets)
+    assert [target.x_0.tolist() for target in initiated] == [target.x_0.tolist() for target in accepted[nTargets:]]
+
+
+@pytest.mark.filterwarnings('error::RuntimeWarning')
+def test_scan_without_target_nodes_does_not_warn():
+    scenario = buildScenario(nTargets=3, nScans=4)
+    tracker = runScans(createTracker(scenario), scenario, scenario.scanList[:3])
+    tracker.releaseTargets(range(len(tracker.__targets__)))
+    assert tracker.__targets__.capacity > 0
+    runScans(tracker, scenario, scenario.scanList[3:])
+
+
+def test_group_covariances_by_identity():
+
+    class Node():
+        def __init__(self, P_0):
+            self.P_0 = P_0
+
+    P_a = np.eye(4)
+    P_b = np.eye(4)
+    nodes = [Node(P_a), Node(P_b), Node(P_a), Node(P_a), Node(P_b)]
+    groupIndices, covariances = tomht.Tracker._groupCovariances(nodes)
+    assert list(groupIndices) == [0, 1, 0, 0, 1]
+    assert covariances.shape == (2, 4, 4)
+
+
+def test_restore_from_delta_snapshots():
+    scenario = buildScenario(nTargets=4, nScans=12)
+    aisLists = [scenario.aisList.getMeasurements(scan.time) for scan in scenario.scanList]
+
+    def trackState(tracker):
+        return ([(node.ID, node.x_0.tolist(), node.cumulativeNLLR, node.mmsi)
+                 for node in tracker.getTrackNodes()],
+                [[node.x_0.tolist() for node in track.backtrackNodes()]
+                 for track in tracker.__terminatedTargets__],
+                tracker.__associatedMeasurements__,
+                tracker.trackIdCounter)
+
+    primary = createTracker(scenario)
+    snapshots = []
+    for scan, aisList in zip(scenario.scanList[:8], aisLists[:8]):
+        primary.addMeasurementList(scan, aisList)
+        snapshots.append(primary.snapshot(delta=True))
+
+    standby = createTracker(scenario)
+    standby.restore(snapshots)
+    fromFull = createTracker(scenario)
+    fromFull.restore(primary.snapshot())
+    assert trackState(standby) == trackState(primary) == trackState(fromFull)
+
+    for scan, aisList in zip(scenario.scanList[8:], aisLists[8:]):
+        primary.addMeasurementList(scan, aisList)
+        standby.addMeasurementList(scan, aisList, checkIntegrity=True)
+    assert trackState(standby) == trackState(primary)
+
+    with pytest.raises(ValueError):
+        createTracker(scenario).restore([snapshots[0], snapshots[2]])
+
+
+@pytest.mark.parametrize('nSectors, northOffset, aisShare', [(8, 1., 0.), (12, 0.3, 0.5), (7, 5.9, 0.5)])
+def test_sector_mode_matches_full_scans(nSectors, northOffset, aisShare):
+    scenario = buildScenario(seed=1, nTargets=6, nScans=8, lambda_phi=5e-6, aisShare=aisShare)
+    fullTracker = createTracker(scenario)
+    sectorTracker = createTracker(scenario)
+    nEarlyTargets = 0
+    for scanIndex, scan in enumerate(scenario.scanList):
+        # An AIS message from every AIS target before each scan, to have AIS with tracks to fuse
+        aisList = AisMessageList([AIS_message(target.time - 1., ais.C.dot(target.cartesianState()),
+                                              target.mmsi, True)
+                                  for target in scenario.simList[scanIndex]
+                                  if target.mmsi is not None and scanIndex > 0])
+        sectorLists = scan.splitSectors(nSectors, northOffset=northOffset)
+        assert sum(len(s.measurements) for s in sectorLists) == len(scan.measurements)
+        fullTracker.addMeasurementList(
+            MeasurementList(scan.time, np.vstack([s.measurements for s in sectorLists])), aisList)
+        for sectorList in sectorLists[:-1]:
+            nEarlyTargets += len(sectorTracker.addSector(sectorList, aisList))
+        sectorTracker.addSector(sectorLists[-1], aisList, checkIntegrity=True)
+        assert len(sectorTracker.runtimeLog['Total']) == scanIndex + 1
+        assert trackNodeStates(fullTracker) == trackNodeStates(sectorTracker)
+
+    assert nEarlyTargets > 0
+    if aisShare:
+        assert any(node.mmsi is not None for node in sectorTracker.getTrackNodes())
+
+
+def test_fused_ais_without_mmsi_has_no_mmsi():
+    scenario = buildScenario(seed=1, nTargets=6, nScans=6, lambda_phi=5e-6, aisShare=0.5)
+    tracker = createTracker(scenario)
+    tracker.preInitialize(scenario.simList)
+    for scanIndex, scan in enumerate(scenario.scanList[1:], 1):
+        # One message without an MMSI per scan, the list keeps only the latest message per MMSI
+        target = scenario.simList[scanIndex][0]
+        aisList = AisMessageList([AIS_message(target.time - 1., ais.C.dot(target.cartesianState()),
+                                              None, True)])
+        tracker.addMeasurementList(scan, aisList)
+    leafNodes = [node for target in tracker.__targetList__ for node in target.getLeafNodes()]
+    assert leafNodes
+    assert all(node.mmsi is None for node in leafNodes)
+
+
+def test_incremental_association_sets():
+    scenario = buildScenario(nTargets=6, nScans=12)
+    tracker = runScans(createTracker(scenario), scenario,
+                       pruneSimilar=True, dynamicWindow=True, checkIntegrity=True)
+    assert tracker.__targetList__
+    for target, associatedMeasurements in zip(tracker.__targetList__,
+                                              tracker.__associatedMeasurements__):
+        assert set(measurementKeys.toTuples(associatedMeasurements.keys)) == target.getMeasurementSet()
+        assert all(count > 0 for count in associatedMeasurements.counts.values())
+
+
+def test_deadline_degradation():
+    scenario = buildScenario(nTargets=20, nScans=12, aisShare=0.5)
+    tracker = createTracker(scenario, maxLeaves=4,
+                            stageDeadlines={'Process': 0., 'Optim': 0., 'Init': 0.})
+    runScans(tracker, scenario, deadline=True, checkIntegrity=True)
+    assert tracker.__targetList__
+    assert len(tracker.runtimeLog['Degraded']) == len(scenario.scanList)
+    actions = {(d.stage, d.action) for d in tracker.degradationLog}
+    assert {('Process', 'capLeaves'), ('Optim', 'greedy'), ('Init', 'deferInitiation')} <= actions
+    deferred = [d.scanNumber for d in tracker.degradationLog if d.action == 'deferInitiation']
+    assert all(b - a > 1 for a, b in zip(deferred, deferred[1:]))
+
+
+def test_deadline_degradation_in_sector_mode():
+    scenario = buildScenario(seed=1, nTargets=6, nScans=5, lambda_phi=5e-6)
+    # Sectors arrive over 210ms, more than the Init deadline of 180ms
+    tracker = createTracker(scenario, stageDeadlines={'Process': 0.05, 'Optim': 0.08, 'Init': 0.08})
+    for scan in scenario.scanList:
+        aisList = scenario.aisList.getMeasurements(scan.time)
+        for sectorIndex, sectorList in enumerate(scan.splitSectors(8)):
+            if sectorIndex > 0:
+                time.sleep(0.03)
+            tracker.addSector(sectorList, aisList, deadline=True)
+    assert tracker.__targetList__
+    assert len(tracker.runtimeLog['Total']) == len(scenario.scanList)
+    assert tracker.degradationLog == []
+
+
+def test_gnn_mode_switch():
+    scenario = buildScenario(nTargets=20, nScans=14)
+    tracker = createTracker(scenario)
+    for scanIndex, scan in enumerate(scenario.scanList):
+        gnn = 5 <= scanIndex < 10
+        ids = {node.ID for node in tracker.getTrackNodes()}
+        tracker.addMeasurementList(scan, scenario.aisList.getMeasurements(scan.time),
+                                   gnn=gnn, checkIntegrity=True)
+        terminatedIds = {node.ID for node in tracker.__terminatedTargets__}
+        assert ids <= {node.ID for node in tracker.getTrackNodes()} | terminatedIds
+        if gnn:
+            assert all(len(target.getLeafNodes()) == 1 for target in tracker.__targetList__)
+    assert tracker.__targetList__
+    assert any(len(target.getLeafNodes()) > 1 for target in tracker.__targetList__)
+
+
+def test_memory_accounting(caplog):
+    scenario = buildScenario(nTargets=6, nScans=8)
+    tracker = createTracker(scenario, traceAllocations=True, memoryLimits={'Trees': 1, 'Target': 1})
+    try:
+        with caplog.at_level(logging.WARNING, logger=memory.__name__):
+            runScans(tracker, scenario)
+        memorySnapshot = tracker.getMemorySnapshot(nTopAllocations=5)
+    finally:
+        tracemalloc.stop()
+
+    for key in ['Mem-' + name for name in memory.structures + ['Total']] + \
+               ['Alloc-' + stage for stage in memory.stages]:
+        assert len(tracker.runtimeLog[key]) == len(scenario.scanList)
+    usage = memorySnapshot['structures']
+    assert usage['Total'] == sum(usage[name] for name in memory.structures) > 0
+    assert sorted(memorySnapshot['targets']) == sorted(node.ID for node in tracker.getTrackNodes())
+    assert usage['Trees'] == sum(memorySnapshot['targets'].values())
+    assert tracker.runtimeLog['Mem-Total'][-1] * memory.MB == pytest.approx(usage['Total'])
+    assert set(memorySnapshot['allocations']) == set(memory.stages)
+    assert len(memorySnapshot['topAllocations']) == 5
+    assert any("Trees holds" in record.message for record in caplog.records)
+
+
+def test_history_usage_measures_new_entries():
+    measured = []
+
+    def measure(obj):
+        measured.append(obj)
+        return obj
+
+    historyUsage = memory.HistoryUsage()
+    history = [1, 2]
+    assert historyUsage.total('Scans', history, measure) == 3
+    history.append(4)
+    assert historyUsage.total('Scans', history, measure) == 7
+    assert measured == [1, 2, 4]
+    # A replaced list is measured again
+    assert historyUsage.total('Scans', [8], measure) == 8
+    assert measured == [1, 2, 4, 8]
+
+
+def test_slow_scan_capture(tmpdir):
+    scenario = buildScenario(nTargets=10, nScans=8, aisShare=0.5)
+    aisLists = [scenario.aisList.getMeasurements(scan.time) for scan in scenario.scanList]
+
+    tracker = createTracker(scenario, profileDirectory=str(tmpdir), profileKeep=3, profileState=True,
+                            slowScanFraction=0., profileInterval=0.001)
+    for scan, aisList in zip(scenario.scanList, aisLists):
+        tracker.addMeasurementList(scan, aisList, pruneSimilar=True)
+    captures = sorted(os.listdir(str(tmpdir)))
+    assert len(captures) == 3
+    assert captures[-1].endswith('{0:06d}'.format(len(scenario.scanList)))
+
+    capture = profiler.loadCapture(os.path.join(str(tmpdir), captures[-1]))
+    assert capture['kwargs'] == {'pruneSimilar': True}
+    assert capture['info']['timings']['Total'] > 0
+    assert capture['scanList'].measurements.tolist() == scenario.scanList[-1].measurements.tolist()
+    replayed = profiler.replayCapture(os.path.join(str(tmpdir), captures[-1]), createTracker(scenario))
+    assert trackNodeStates(replayed) == trackNodeStates(tracker)